@@ -1,10 +1,20 @@
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
 import numpy as np
-import joblib
 import os
+from .fast_inference import CompiledIsolationForest
+from .prediction_cache import PredictionCache, quantize
+from .compact_models import with_compact_copies, load_compiled
+from .ensemble_pruning import (
+    SERVE_PRUNED_MODELS,
+    PRUNING_TOLERANCE,
+    PRUNING_VALIDATION_FRACTION,
+    prune_isolation_forest,
+    print_pruning_report
+)
 
 # Anomaly Detection for Sensor Data
+#
+# sklearn is imported only for training and the sklearn fallback, joblib only
+# when saving or loading. Serving from compiled artifacts needs only NumPy.
 
 class AnomalyDetector:
     """
@@ -12,17 +22,64 @@ class AnomalyDetector:
     Uses Isolation Forest algorithm
     """
     
-    def __init__(self):
-        self.model = None
-        self.scaler = StandardScaler()
-        self.model_path = "app/ai_models/saved_models/"
+    # Sensor precision of temperature, humidity, light_exposure, vibration
+    INPUT_PRECISION = (0.1, 0.5, 1.0, 0.01)
+    
+    # Node-array artifacts, also exported in the compact format
+    COMPILED_ARTIFACTS = ("anomaly_compiled.pkl", "anomaly_compiled_pruned.pkl")
+    
+    def __init__(self, model_path="app/ai_models/saved_models/"):
+        self._model = None
+        self._scaler = None
+        self._model_on_disk = False
+        self.compiled_model = None
+        # Smallest-forest copy of the fitted model, and whether the compiled
+        # model being served is that one
+        self.pruned_model = None
+        self.pruning_report = None
+        self.serving_pruned = False
+        # Whether the served node arrays are the compact float32 copies
+        self.serving_compact = False
+        self.cache = PredictionCache()
+        self.model_path = model_path
         os.makedirs(self.model_path, exist_ok=True)
     
-    def train_model(self, sensor_data):
+    @property
+    def model(self):
+        self._load_estimator()
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._model_on_disk = False
+    
+    @property
+    def scaler(self):
+        self._load_estimator()
+        return self._scaler
+    
+    @scaler.setter
+    def scaler(self, scaler):
+        self._scaler = scaler
+        self._model_on_disk = False
+    
+    def is_trained(self):
+        """True once a model is trained or loaded (doesn't unpickle sklearn)"""
+        return self.compiled_model is not None or self._model is not None
+    
+    def train_model(self, sensor_data, n_jobs=None, prune=False):
         """
         Train anomaly detection model on normal sensor readings
+        n_jobs: parallel tree fitting, as for sklearn (default single-threaded)
+        prune: also keep the smallest forest within PRUNING_TOLERANCE, picked
+        on PRUNING_VALIDATION_FRACTION of the readings held out of training
         """
         
+        from sklearn.ensemble import IsolationForest
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+        
         print("\n🔍 Training Anomaly Detection Model...")
         
         # Prepare features
@@ -34,16 +91,23 @@ class AnomalyDetector:
         
         X = sensor_data[features].dropna()
         
+        X_val = None
+        if prune:
+            X, X_val = train_test_split(X, test_size=PRUNING_VALIDATION_FRACTION, random_state=42)
+        
         # Scale features
+        self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
         
         # Train Isolation Forest
         self.model = IsolationForest(
             contamination=0.1,  # Expect 10% anomalies
             random_state=42,
-            n_estimators=100
+            n_estimators=100,
+            n_jobs=n_jobs
         )
         self.model.fit(X_scaled)
+        self.compile_model()
         
         # Evaluate on training data
         predictions = self.model.predict(X_scaled)
@@ -54,50 +118,202 @@ class AnomalyDetector:
         print(f"  ✓ Detected {anomaly_count} anomalies ({anomaly_count/len(X)*100:.1f}%)")
         print(f"  ✓ Normal readings: {normal_count} ({normal_count/len(X)*100:.1f}%)")
         
+        if prune:
+            self.prune(self.scaler.transform(X_val), X_scaled)
+        
         return anomaly_count, normal_count
     
-    def save_model(self):
-        """Save model to disk"""
-        joblib.dump(self.model, f"{self.model_path}anomaly_detector.pkl")
-        joblib.dump(self.scaler, f"{self.model_path}anomaly_scaler.pkl")
+    def prune(self, X_val, X_test, tolerance=PRUNING_TOLERANCE):
+        """
+        Smallest-forest copy of the trained model, scored by label agreement
+        with the full forest
+        The tree count and threshold are picked on the (scaled) readings X_val
+        and the reported agreement is on X_test, readings that did not choose
+        them. With SERVE_PRUNED_MODELS on it is served from now on, and by
+        load_model once saved. Returns the pruning report.
+        """
+        
+        self.pruned_model, self.pruning_report = prune_isolation_forest(
+            self.model, X_val, tolerance, X_test=X_test
+        )
+        if SERVE_PRUNED_MODELS:
+            self.compiled_model = CompiledIsolationForest(self.pruned_model, self.scaler)
+            # After the swap, so no old-model result is cached once cleared
+            self.cache.clear()
+            self.serving_pruned = True
+        print_pruning_report("Isolation forest", self.pruning_report)
+        return self.pruning_report
+    
+    def save_model(self, model_path=None):
+        """Save model to disk (default: self.model_path)"""
+        import joblib
+        artifacts = [(self.model, "anomaly_detector.pkl"), (self.scaler, "anomaly_scaler.pkl")]
+        # Uncompressed node arrays that workers memory-map instead of unpickling
+        if self.compiled_model is not None:
+            # When serving the pruned forest it is only saved under its own name
+            full = CompiledIsolationForest(self.model, self.scaler) if self.serving_pruned \
+                else self.compiled_model
+            artifacts.append((full, "anomaly_compiled.pkl"))
+        
+        pruned_names = ["anomaly_detector_pruned.pkl", "anomaly_compiled_pruned.pkl"]
+        if self.pruned_model is not None:
+            artifacts += [
+                (self.pruned_model, pruned_names[0]),
+                ({'model': CompiledIsolationForest(self.pruned_model, self.scaler),
+                  'report': self.pruning_report},
+                 pruned_names[1])
+            ]
+        else:
+            # Pruned from a model being replaced
+            for name in pruned_names:
+                if os.path.exists(f"{model_path or self.model_path}{name}"):
+                    os.remove(f"{model_path or self.model_path}{name}")
+        
+        artifacts = with_compact_copies(
+            artifacts, model_path or self.model_path, self.COMPILED_ARTIFACTS
+        )
+        
+        # Write to temporary files first so readers never see a partial pickle
+        # (and memory-mapped files are replaced, never rewritten)
+        for obj, name in artifacts:
+            tmp_path = f"{model_path or self.model_path}{name}.tmp"
+            joblib.dump(obj, tmp_path)
+            os.replace(tmp_path, f"{model_path or self.model_path}{name}")
         print("  ✓ Anomaly detector saved!")
     
     def load_model(self):
-        """Load model from disk"""
+        """
+        Load model from disk
+        Serving uses the memory-mapped compiled arrays; the Isolation Forest
+        and scaler are only unpickled (importing sklearn) when something asks
+        for them. The pruned forest is served instead of the full one when it
+        was saved and SERVE_PRUNED_MODELS is on, and the compact node arrays
+        when SERVE_COMPACT_MODELS is on.
+        """
+        import joblib
         try:
-            self.model = joblib.load(f"{self.model_path}anomaly_detector.pkl")
-            self.scaler = joblib.load(f"{self.model_path}anomaly_scaler.pkl")
+            self.serving_pruned = SERVE_PRUNED_MODELS and os.path.exists(
+                f"{self.model_path}anomaly_compiled_pruned.pkl"
+            )
+            self.serving_compact = False
+            compiled_path = f"{self.model_path}anomaly_compiled.pkl"
+            if self.serving_pruned:
+                pruned, self.serving_compact = load_compiled(
+                    self.model_path, "anomaly_compiled_pruned.pkl"
+                )
+                self.compiled_model = pruned['model']
+                self.pruning_report = pruned['report']
+                self.cache.clear()
+                self._model = None
+                self._scaler = None
+                self._model_on_disk = True
+            elif os.path.exists(compiled_path):
+                self.compiled_model, self.serving_compact = load_compiled(
+                    self.model_path, "anomaly_compiled.pkl"
+                )
+                self.cache.clear()
+                self._model = None
+                self._scaler = None
+                self._model_on_disk = True
+            else:
+                self.scaler = joblib.load(f"{self.model_path}anomaly_scaler.pkl")
+                self.model = joblib.load(f"{self.model_path}anomaly_detector.pkl")
+                self.compile_model()
             return True
         except:
             return False
     
+    def _load_estimator(self):
+        """Unpickle the Isolation Forest the first time it's needed"""
+        if not self._model_on_disk:
+            return
+        import joblib
+        scaler = joblib.load(f"{self.model_path}anomaly_scaler.pkl")
+        model = joblib.load(
+            f"{self.model_path}anomaly_detector{'_pruned' if self.serving_pruned else ''}.pkl"
+        )
+        self._scaler = scaler
+        self._model = model
+        self._model_on_disk = False
+    
+    def predict_labels(self, X):
+        """1 (normal) / -1 (anomaly) for each row of raw readings"""
+        if self.compiled_model is not None:
+            return self.compiled_model.predict(X)
+        return self.model.predict(self.scaler.transform(X))
+    
+    def compile_model(self):
+        """Flatten the Isolation Forest into NumPy node arrays for fast inference"""
+        try:
+            self.compiled_model = CompiledIsolationForest(self.model, self.scaler)
+        except Exception as e:
+            self.compiled_model = None
+            print(f"⚠️  Fast anomaly inference unavailable, using sklearn: {e}")
+        # Cached results belong to the previous model; cleared after the swap
+        # so a concurrent request can't cache an old result again
+        self.cache.clear()
+    
     def detect(self, temperature, humidity, light_exposure=None, vibration=None):
         """
         Detect if current reading is anomalous
+        Readings are quantized to sensor precision and served from the cache
+        when the same conditions were checked recently
         """
         
-        # Prepare features
-        features = [temperature, humidity]
-        if light_exposure is not None:
-            features.append(light_exposure)
-        if vibration is not None:
-            features.append(vibration)
-        
-        features_array = np.array([features])
-        
-        # Scale and predict
-        features_scaled = self.scaler.transform(features_array)
-        prediction = self.model.predict(features_scaled)[0]
-        anomaly_score = self.model.score_samples(features_scaled)[0]
-        
-        is_anomaly = prediction == -1
-        
-        return {
-            'is_anomaly': bool(is_anomaly),
-            'anomaly_score': float(anomaly_score),
-            'severity': self._get_severity(anomaly_score),
-            'recommendation': self._get_recommendation(is_anomaly, temperature, humidity)
-        }
+        return self.detect_many([(temperature, humidity, light_exposure, vibration)])[0]
+    
+    def detect_many(self, readings):
+        """
+        detect() for many readings at once
+        readings: sequence of (temperature, humidity, light_exposure, vibration)
+        tuples. Cache misses are scored together, one call per set of
+        present features.
+        """
+        
+        keys = [quantize(values, self.INPUT_PRECISION) for values in readings]
+        scored = {key: self.cache.get(key) for key in keys}
+        
+        # Readings missing optional sensors have fewer columns
+        groups = {}
+        for key, cached in scored.items():
+            if cached is None:
+                groups.setdefault(tuple(value is None for value in key), []).append(key)
+        
+        for group in groups.values():
+            # Prepare features
+            features_array = np.array([
+                [
+                    value * step
+                    for value, step in zip(key, self.INPUT_PRECISION)
+                    if value is not None
+                ]
+                for key in group
+            ], dtype=np.float64)
+            
+            if self.compiled_model is not None:
+                anomaly_scores = self.compiled_model.score_samples(features_array)
+                predictions = np.where(anomaly_scores - self.compiled_model.offset_ < 0, -1, 1)
+            else:
+                # Scale and predict
+                features_scaled = self.scaler.transform(features_array)
+                predictions = self.model.predict(features_scaled)
+                anomaly_scores = self.model.score_samples(features_scaled)
+            
+            for key, prediction, anomaly_score in zip(group, predictions, anomaly_scores):
+                scored[key] = (int(prediction), float(anomaly_score))
+                self.cache.put(key, scored[key])
+        
+        results = []
+        for (temperature, humidity, _, _), key in zip(readings, keys):
+            prediction, anomaly_score = scored[key]
+            is_anomaly = prediction == -1
+            results.append({
+                'is_anomaly': bool(is_anomaly),
+                'anomaly_score': float(anomaly_score),
+                'severity': self._get_severity(anomaly_score),
+                'recommendation': self._get_recommendation(is_anomaly, temperature, humidity)
+            })
+        return results
     
     def _get_severity(self, score):
         """Convert anomaly score to severity level"""
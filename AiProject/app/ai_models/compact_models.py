@@ -0,0 +1,92 @@
+import os
+import numpy as np
+from decouple import config
+from .fast_inference import compact_model
+
+# Compact Compiled-Model Artifacts
+#
+# Every compiled artifact a predictor saves (<name>.pkl) is also exported in
+# the compact node-array format (float32 thresholds and values, int32
+# feature indices) as <name>_compact.pkl. With SERVE_COMPACT_MODELS on,
+# load_model serves the compact copy instead: about 30% less memory per
+# loaded model version, at the cost of mixed-precision compares in the
+# NumPy traversal (a little slower per prediction). Outputs match the
+# float64 arrays to within float32 rounding (see
+# test_compact_models_match_compiled), so serving it is opt-in.
+
+COMPACT_MODEL_EXPORT = config('COMPACT_MODEL_EXPORT', default=True, cast=bool)
+SERVE_COMPACT_MODELS = config('SERVE_COMPACT_MODELS', default=False, cast=bool)
+
+
+def compact_name(name):
+    return name.replace('.pkl', '_compact.pkl')
+
+
+def compact(artifact):
+    """Compact copy of a compiled model, or of a dict holding some (other values kept)"""
+    if isinstance(artifact, dict):
+        return {
+            key: compact_model(value) if hasattr(value, 'forest') else value
+            for key, value in artifact.items()
+        }
+    return compact_model(artifact)
+
+
+def with_compact_copies(artifacts, model_path, compiled_names):
+    """
+    A predictor's (object, file name) save list plus the compact copy of
+    each compiled artifact in it
+    Compact files whose full artifact isn't being written are removed, so
+    they can't be served next to a newer model.
+    """
+
+    written = {name for _, name in artifacts}
+    copies = [
+        (compact(obj), compact_name(name))
+        for obj, name in artifacts
+        if name in compiled_names and COMPACT_MODEL_EXPORT
+    ]
+    for name in compiled_names:
+        path = f"{model_path}{compact_name(name)}"
+        if (name not in written or not COMPACT_MODEL_EXPORT) and os.path.exists(path):
+            os.remove(path)
+    return artifacts + copies
+
+
+def load_compiled(model_path, name):
+    """
+    Load a compiled artifact for serving (memory-mapped)
+    Returns (artifact, compact): the compact copy when SERVE_COMPACT_MODELS
+    is on and one was exported, otherwise the artifact itself.
+    """
+
+    import joblib
+
+    compact_path = f"{model_path}{compact_name(name)}"
+    if SERVE_COMPACT_MODELS and os.path.exists(compact_path):
+        return joblib.load(compact_path, mmap_mode='r'), True
+    return joblib.load(f"{model_path}{name}", mmap_mode='r'), False
+
+
+def compare(original, compact_copy, X):
+    """
+    Largest output difference and label agreement between a compiled
+    model and its compact copy on raw feature rows X (no labels for the
+    regressor: its output is the prediction)
+    """
+
+    for method in ('predict_proba', 'score_samples', 'predict'):
+        if hasattr(original, method):
+            break
+    outputs = getattr(original, method)(X)
+    compact_outputs = getattr(compact_copy, method)(X)
+    return {
+        'output': method,
+        'max_abs_diff': float(np.max(np.abs(outputs - compact_outputs))),
+        'label_agreement': (
+            float(np.mean(original.predict(X) == compact_copy.predict(X)))
+            if method != 'predict' else None
+        ),
+        'bytes': original.forest.nbytes,
+        'compact_bytes': compact_copy.forest.nbytes
+    }
@@ -0,0 +1,215 @@
+import copy
+import pickle
+import numpy as np
+from decouple import config
+from .fast_inference import (
+    CompiledRandomForestRegressor,
+    CompiledGradientBoostingClassifier,
+    CompiledIsolationForest,
+    median_latency_ms
+)
+
+# Ensemble Pruning
+#
+# A trained ensemble is scored on validation rows with only its first k
+# trees, for every k, from a single pass of per-tree outputs: a random
+# forest's prediction is the running mean of its trees, gradient boosting's
+# is its staged decision function, and an isolation forest's score is the
+# running mean of path lengths. The smallest k whose score is within
+# PRUNING_TOLERANCE of the full ensemble is kept. Later trees are dropped,
+# which for boosting is the only valid cut: every stage corrects the ones
+# before it.
+#
+# Both versions are compiled and timed, so the report shows what the
+# pruned model costs per prediction and in memory next to its accuracy.
+# k is picked on validation rows; given separate test rows, the reported
+# full and pruned scores come from those, so the cut is not graded on the
+# rows that chose it.
+
+# Prune after training (the full ensembles are always kept as well)
+ENSEMBLE_PRUNING = config('ENSEMBLE_PRUNING', default=True, cast=bool)
+# Serve the pruned ensembles when a model directory has them
+SERVE_PRUNED_MODELS = config('SERVE_PRUNED_MODELS', default=True, cast=bool)
+# Largest score drop accepted (R², accuracy or label agreement, 0-1)
+PRUNING_TOLERANCE = config('PRUNING_TOLERANCE', default=0.005, cast=float)
+PRUNING_MIN_TREES = config('PRUNING_MIN_TREES', default=10, cast=int)
+# Share of the training rows held out to pick k (quality models)
+PRUNING_VALIDATION_FRACTION = config('PRUNING_VALIDATION_FRACTION', default=0.15, cast=float)
+
+
+def smallest_ensemble(scores, tolerance=PRUNING_TOLERANCE, min_trees=PRUNING_MIN_TREES):
+    """Smallest tree count whose score (scores[k-1] for k trees) is within tolerance of the full one"""
+    target = scores[-1] - tolerance
+    for k in range(min(max(min_trees, 1), len(scores)), len(scores) + 1):
+        if scores[k - 1] >= target:
+            return k
+    return len(scores)
+
+
+def _r2(y, predictions):
+    # One R² per row of predictions
+    residual = ((predictions - y) ** 2).sum(axis=1)
+    total = ((y - y.mean()) ** 2).sum()
+    return 1 - residual / total if total > 0 else np.zeros(len(predictions))
+
+
+def _curve(scores):
+    """Score by tree count, rounded for the report"""
+    return [round(float(score), 5) for score in scores]
+
+
+def _costs(model, compiled, X):
+    """Latency per prediction and size of a model and its compiled arrays"""
+    predict = getattr(compiled, 'predict_proba', compiled.predict)
+    rows = X[:1000]
+    return {
+        'trees': len(model.estimators_),
+        'latency_ms': round(median_latency_ms(predict, rows[:1], 200), 4),
+        'batch_row_us': round(median_latency_ms(predict, rows, 5) * 1000 / len(rows), 3),
+        'model_bytes': len(pickle.dumps(model)),
+        'compiled_bytes': compiled.forest.nbytes
+    }
+
+
+def _test_scores(model, pruned, X_test, y_test):
+    """(full, pruned) sklearn scores on the test rows, or None without them"""
+    if X_test is None:
+        return None
+    return model.score(X_test, y_test), pruned.score(X_test, y_test)
+
+
+def _report(metric, scores, k, tolerance, full, pruned, test_scores=None):
+    # test_scores: (full, pruned) on rows other than the ones k was picked on
+    full_score, pruned_score = test_scores or (scores[-1], scores[k - 1])
+    return {
+        'metric': metric,
+        'tolerance': tolerance,
+        'full_score': round(float(full_score), 5),
+        'pruned_score': round(float(pruned_score), 5),
+        'validation_full_score': round(float(scores[-1]), 5),
+        'validation_pruned_score': round(float(scores[k - 1]), 5),
+        'full': full,
+        'pruned': pruned,
+        'speedup': round(full['latency_ms'] / pruned['latency_ms'], 2) if pruned['latency_ms'] > 0 else None,
+        'batch_speedup': (
+            round(full['batch_row_us'] / pruned['batch_row_us'], 2) if pruned['batch_row_us'] > 0 else None
+        ),
+        'curve': _curve(scores)
+    }
+
+
+def prune_random_forest(model, X_val, y_val, tolerance=PRUNING_TOLERANCE,
+                        min_trees=PRUNING_MIN_TREES, X_test=None, y_test=None):
+    """
+    First-k-trees copy of a RandomForestRegressor, scored by R²
+    X_val in the feature space the model was fitted on; k is picked on it and
+    both models are scored on X_test when given. Returns (pruned, report).
+    """
+
+    y_val = np.asarray(y_val, dtype=np.float64)
+    per_tree = np.array([tree.predict(X_val) for tree in model.estimators_])
+    running_mean = np.cumsum(per_tree, axis=0) / np.arange(1, len(per_tree) + 1)[:, None]
+    scores = _r2(y_val, running_mean)
+    k = smallest_ensemble(scores, tolerance, min_trees)
+
+    pruned = copy.copy(model)
+    pruned.estimators_ = model.estimators_[:k]
+    pruned.n_estimators = k
+
+    return pruned, _report(
+        'r2', scores, k, tolerance,
+        _costs(model, CompiledRandomForestRegressor(model), X_val),
+        _costs(pruned, CompiledRandomForestRegressor(pruned), X_val),
+        _test_scores(model, pruned, X_test, y_test)
+    )
+
+
+def prune_gradient_boosting(model, X_val, y_val, tolerance=PRUNING_TOLERANCE,
+                            min_trees=PRUNING_MIN_TREES, X_test=None, y_test=None):
+    """
+    First-k-stages copy of a GradientBoostingClassifier, scored by accuracy
+    k is picked on X_val, the reported scores come from X_test when given.
+    Returns (pruned, report).
+    """
+
+    y_val = np.asarray(y_val)
+    scores = np.array([
+        np.mean(predictions == y_val) for predictions in model.staged_predict(X_val)
+    ])
+    k = smallest_ensemble(scores, tolerance, min_trees)
+
+    pruned = copy.copy(model)
+    pruned.estimators_ = model.estimators_[:k]
+    pruned.train_score_ = model.train_score_[:k]
+    pruned.n_estimators = k
+    pruned.n_estimators_ = k
+
+    # 'trees' counts boosting stages (one tree per class each)
+    return pruned, _report(
+        'accuracy', scores, k, tolerance,
+        _costs(model, CompiledGradientBoostingClassifier(model), X_val),
+        _costs(pruned, CompiledGradientBoostingClassifier(pruned), X_val),
+        _test_scores(model, pruned, X_test, y_test)
+    )
+
+
+def _isolation_scores(model, compiled, X):
+    """Anomaly score of every row of X with the first k trees, one column per k"""
+    depths = compiled.forest.leaf_values(X)
+    normalizer = compiled.denominator / len(model.estimators_)
+    counts = np.arange(1, depths.shape[1] + 1)
+    return -(2.0 ** (-np.cumsum(depths, axis=1) / (counts * normalizer)))
+
+
+def prune_isolation_forest(model, X_val, tolerance=PRUNING_TOLERANCE,
+                           min_trees=PRUNING_MIN_TREES, X_test=None):
+    """
+    First-k-trees copy of an IsolationForest, scored by agreement of its
+    anomaly labels with the full forest's on X_val (there are no true labels)
+    The threshold is re-fitted to X_val for each k, so the pruned forest still
+    flags the same share of readings. The reported scores are the agreement
+    on X_test when given. Returns (pruned, report).
+    """
+
+    compiled = CompiledIsolationForest(model)
+    running_scores = _isolation_scores(model, compiled, X_val)
+
+    full_labels = running_scores[:, -1] < model.offset_
+    if model.contamination == 'auto':
+        offsets = np.full(running_scores.shape[1], -0.5)
+    else:
+        offsets = np.percentile(running_scores, 100.0 * model.contamination, axis=0)
+    scores = ((running_scores < offsets) == full_labels[:, None]).mean(axis=0)
+    k = smallest_ensemble(scores, tolerance, min_trees)
+
+    test_scores = None
+    if X_test is not None:
+        # Same k and offsets, on readings that did not choose them
+        test_running = _isolation_scores(model, compiled, X_test)
+        test_full = test_running[:, -1] < model.offset_
+        test_scores = tuple(
+            np.mean((test_running[:, i] < offsets[i]) == test_full) for i in (-1, k - 1)
+        )
+
+    pruned = copy.copy(model)
+    pruned.estimators_ = model.estimators_[:k]
+    pruned.estimators_features_ = model.estimators_features_[:k]
+    pruned._decision_path_lengths = model._decision_path_lengths[:k]
+    pruned._average_path_length_per_tree = model._average_path_length_per_tree[:k]
+    pruned.n_estimators = k
+    pruned.offset_ = float(offsets[k - 1])
+
+    return pruned, _report(
+        'label_agreement', scores, k, tolerance,
+        _costs(model, compiled, X_val),
+        _costs(pruned, CompiledIsolationForest(pruned), X_val),
+        test_scores
+    )
+
+
+def print_pruning_report(name, report):
+    full, pruned = report['full'], report['pruned']
+    print(f"  ✓ {name} pruned {full['trees']} → {pruned['trees']} trees: "
+          f"{report['metric']} {report['full_score']:.4f} → {report['pruned_score']:.4f}, "
+          f"{report['speedup']}x faster per prediction ({report['batch_speedup']}x in batches), "
+          f"{full['compiled_bytes'] // 1024} → {pruned['compiled_bytes'] // 1024} KiB")
@@ -1,6 +1,6 @@
 # Computer Vision for Packaging Analysis (Simplified)
+# PIL is imported when an image is opened, not when the API starts
 
-from PIL import Image
 import numpy as np
 
 class ImageAnalyzer:
@@ -15,6 +15,7 @@ class ImageAnalyzer:
     def load_reference_image(self, product_name, image_path):
         """Load reference image for authentic product"""
         try:
+            from PIL import Image
             img = Image.open(image_path)
             self.reference_images[product_name] = img
             return True
@@ -27,6 +28,7 @@ class ImageAnalyzer:
         Returns structure compatible with frontend PackagingAnalysisResult
         """
         try:
+            from PIL import Image
             img = Image.open(image_path)
             
             # 1. Run internal analysis helpers
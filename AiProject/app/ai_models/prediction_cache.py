@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+
+# LRU + TTL Prediction Cache
+#
+# Stable storage rooms send nearly identical readings over and over, so
+# predictors memoize results keyed on inputs quantized to sensor precision.
+
+CACHE_MAX_ENTRIES = config('PREDICTION_CACHE_SIZE', default=10000, cast=int)
+CACHE_TTL_SECONDS = config('PREDICTION_CACHE_TTL_SECONDS', default=300, cast=float)
+
+def quantize(values, precision):
+    """Round each value to its sensor precision step; None stays None"""
+    return tuple(
+        None if value is None else int(round(float(value) / step))
+        for value, step in zip(values, precision)
+    )
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live
+    Sized by entry count; tracks hit-rate metrics
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __getstate__(self):
+        # Predictors are pickled across processes (training jobs); the lock
+        # can't be, and cached entries aren't worth shipping
+        return {'max_entries': self.max_entries, 'ttl_seconds': self.ttl_seconds}
+    
+    def __setstate__(self, state):
+        self.__init__(**state)
+    
+    def get(self, key):
+        """Return the cached value or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (called when the model is reloaded)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -1,13 +1,29 @@
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import joblib
 from datetime import datetime, timedelta
 import os
+from .fast_inference import (
+    CompiledRandomForestRegressor,
+    CompiledGradientBoostingClassifier,
+    median_latency_ms
+)
+from .prediction_cache import PredictionCache, quantize
+from .surrogate import QualitySurrogate
+from .compact_models import with_compact_copies, load_compiled
+from .segment_models import SegmentModels, remove_segments
+from .ensemble_pruning import (
+    SERVE_PRUNED_MODELS,
+    PRUNING_TOLERANCE,
+    PRUNING_VALIDATION_FRACTION,
+    prune_random_forest,
+    prune_gradient_boosting,
+    print_pruning_report
+)
 
 # Quality Degradation Prediction Model
+#
+# pandas and sklearn are imported inside the methods that train or fall back
+# to sklearn, and joblib where models are saved or loaded. Serving from
+# compiled artifacts needs only NumPy.
 
 class QualityPredictor:
     """
@@ -15,13 +31,104 @@ class QualityPredictor:
     Uses Random Forest for regression and classification
     """
     
-    def __init__(self):
-        self.regression_model = None
-        self.classification_model = None
-        self.scaler = StandardScaler()
-        self.model_path = "app/ai_models/saved_models/"
+    # Model input columns, in order
+    FEATURES = [
+        'storage_temperature',
+        'storage_humidity',
+        'ph_level',
+        'moisture_content',
+        'days_elapsed',
+        'impurity_percentage',
+        'active_ingredient_concentration'
+    ]
+    
+    # Sensor/lab precision of each predict() input, used to key the cache
+    INPUT_PRECISION = (0.1, 0.5, 0.01, 0.1, 1, 0.01, 0.1)
+    
+    # 'full' uses the ensembles; 'fast' the distilled surrogate, falling back
+    # to the ensembles for rows the surrogate is unsure about; 'joint' only
+    # the classifier, with the score derived from its probabilities
+    PREDICTION_MODES = ('full', 'fast', 'joint')
+    
+    # Node-array artifacts, also exported in the compact format
+    COMPILED_ARTIFACTS = (
+        "quality_compiled.pkl",
+        "quality_compiled_pruned.pkl",
+        "quality_surrogate.pkl"
+    )
+    
+    # Quality score of each status (the regression target)
+    CLASS_SCORES = {'Good': 100, 'Degraded': 50, 'Counterfeit': 0}
+    
+    # Grid points scored per chunk by iter_condition_grid
+    GRID_CHUNK_ROWS = 100000
+    
+    # Hyperparameters used unless a tuning run picked others
+    REGRESSION_PARAMS = {'n_estimators': 100, 'max_depth': 10}
+    CLASSIFICATION_PARAMS = {'n_estimators': 100, 'max_depth': 5}
+    
+    def __init__(self, model_path="app/ai_models/saved_models/"):
+        self._regression_model = None
+        self._classification_model = None
+        self._scaler = None
+        self._estimators_on_disk = False
+        self.compiled_regression = None
+        self.compiled_classification = None
+        self.surrogate = None
+        self.tuning_report = None
+        # Smallest-ensemble copies of the fitted models, and whether the
+        # compiled models being served are those
+        self.pruned_models = None
+        self.pruning_report = None
+        self.serving_pruned = False
+        # Whether the served node arrays are the compact float32 copies
+        self.serving_compact = False
+        # Per-active-ingredient models (SegmentModels), if any
+        self.segments = None
+        self.cache = PredictionCache()
+        self.model_path = model_path
         os.makedirs(self.model_path, exist_ok=True)
     
+    @property
+    def regression_model(self):
+        self._load_estimators()
+        return self._regression_model
+    
+    @regression_model.setter
+    def regression_model(self, model):
+        self._regression_model = model
+        self._estimators_on_disk = False
+    
+    @property
+    def classification_model(self):
+        self._load_estimators()
+        return self._classification_model
+    
+    @classification_model.setter
+    def classification_model(self, model):
+        self._classification_model = model
+        self._estimators_on_disk = False
+    
+    @property
+    def scaler(self):
+        self._load_estimators()
+        return self._scaler
+    
+    @scaler.setter
+    def scaler(self, scaler):
+        self._scaler = scaler
+        self._estimators_on_disk = False
+    
+    @property
+    def classes_(self):
+        if self.compiled_classification is not None:
+            return self.compiled_classification.classes_
+        return self.classification_model.classes_
+    
+    def is_trained(self):
+        """True once models are trained or loaded (doesn't unpickle sklearn)"""
+        return self.compiled_regression is not None or self._regression_model is not None
+    
     def prepare_training_data(self, kaggle_data):
         """
         Prepare training data from Kaggle dataset
@@ -30,6 +137,7 @@ class QualityPredictor:
         Target (regression): quality_score (0-100)
         Target (classification): quality_status (Good/Degraded/Counterfeit)
         """
+        import pandas as pd
         
         df = pd.DataFrame(kaggle_data)
         
@@ -39,15 +147,7 @@ class QualityPredictor:
         df['days_elapsed'] = (df['inspection_date'] - df['manufacturing_date']).dt.days
         
         # Feature engineering
-        features = [
-            'storage_temperature',
-            'storage_humidity',
-            'ph_level',
-            'moisture_content',
-            'days_elapsed',
-            'impurity_percentage',
-            'active_ingredient_concentration'
-        ]
+        features = list(self.FEATURES)
         
         # Remove rows with missing values
         df_clean = df.dropna(subset=features + ['quality_status'])
@@ -55,61 +155,164 @@ class QualityPredictor:
         X = df_clean[features]
         
         # Create quality score from status
-        quality_map = {'Good': 100, 'Degraded': 50, 'Counterfeit': 0}
-        y_score = df_clean['quality_status'].map(quality_map)
+        y_score = df_clean['quality_status'].map(self.CLASS_SCORES)
         y_class = df_clean['quality_status']
         
         return X, y_score, y_class, features
     
-    def train_model(self, X, y_score, y_class):
+    def train_model(self, X, y_score, y_class, tune=False, prune=False):
         """
         Train both regression and classification models
+        tune: pick hyperparameters by cross-validated successive halving on
+        the training split first (results in self.tuning_report)
+        prune: also keep the smallest ensembles within PRUNING_TOLERANCE
+        (picked on a validation slice held out of the training split)
         """
         
         print("🤖 Training Quality Prediction Models...")
         
-        # Split data
-        X_train, X_test, y_score_train, y_score_test = train_test_split(
-            X, y_score, test_size=0.2, random_state=42
+        split = self.split_training_data(X, y_score, y_class, validation=prune)
+        
+        regression_params = classification_params = None
+        if tune:
+            from ..jobs.hyperparameter_search import tune_quality_models
+            self.tuning_report = tune_quality_models(
+                split['X_train'], split['y_score_train'], split['y_class_train']
+            )
+            regression_params = self.tuning_report['regression']['best_params']
+            classification_params = self.tuning_report['classification']['best_params']
+        
+        # Train regression model (quality score)
+        print("  Training Regression Model...")
+        regression_model = self.fit_regression(
+            split['X_train'], split['y_score_train'], regression_params
         )
         
-        _, _, y_class_train, y_class_test = train_test_split(
-            X, y_class, test_size=0.2, random_state=42
+        # Train classification model (quality status)
+        print("  Training Classification Model...")
+        classification_model = self.fit_classification(
+            split['X_train'], split['y_class_train'], classification_params
         )
         
+        scores = self.finish_training(regression_model, classification_model, split)
+        if prune:
+            self.prune(split)
+        return scores
+    
+    def split_training_data(self, X, y_score, y_class, test_rows=None, validation=False):
+        """
+        Train/test split and feature scaling (fits self.scaler)
+        test_rows: boolean mask of the test rows (default: a random 20%)
+        validation: also hold PRUNING_VALIDATION_FRACTION of the training
+        rows out as X_val/y_score_val/y_class_val, for prune
+        Returns the scaled arrays the fit_* steps and finish_training use
+        """
+        
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+        
+        # Split data
+        if test_rows is None:
+            test_rows = self.test_rows(len(X))
+        test_rows = np.asarray(test_rows)
+        X_train, X_test = X[~test_rows], X[test_rows]
+        y_score_train, y_score_test = y_score[~test_rows], y_score[test_rows]
+        y_class_train, y_class_test = y_class[~test_rows], y_class[test_rows]
+        
+        validation_data = {}
+        if validation:
+            val_rows = self.test_rows(len(X_train), PRUNING_VALIDATION_FRACTION)
+            validation_data = {
+                'X_val': X_train[val_rows],
+                'y_score_val': y_score_train[val_rows],
+                'y_class_val': y_class_train[val_rows]
+            }
+            X_train = X_train[~val_rows]
+            y_score_train = y_score_train[~val_rows]
+            y_class_train = y_class_train[~val_rows]
+        
         # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
+        self.scaler = StandardScaler()
         
-        # Train regression model (quality score)
-        print("  Training Regression Model...")
-        self.regression_model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
+        split = {
+            'columns': list(X.columns),
+            'X_train': self.scaler.fit_transform(X_train),
+            'X_test': self.scaler.transform(X_test),
+            'y_score_train': y_score_train,
+            'y_score_test': y_score_test,
+            'y_class_train': y_class_train,
+            'y_class_test': y_class_test
+        }
+        if validation_data:
+            validation_data['X_val'] = self.scaler.transform(validation_data['X_val'])
+            split.update(validation_data)
+        return split
+    
+    @staticmethod
+    def test_rows(n_rows, fraction=0.2):
+        """Boolean mask of a held-out fraction (the same rows for the same n_rows)"""
+        from sklearn.model_selection import train_test_split
+        
+        _, test_index = train_test_split(np.arange(n_rows), test_size=fraction, random_state=42)
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[test_index] = True
+        return mask
+    
+    @staticmethod
+    def fit_regression(X_train_scaled, y_score_train, params=None, n_jobs=-1):
+        """
+        Fit the quality score model (parallel across trees)
+        params: RandomForestRegressor hyperparameters (default REGRESSION_PARAMS)
+        """
+        from sklearn.ensemble import RandomForestRegressor
+        
+        model = RandomForestRegressor(
+            **(params or QualityPredictor.REGRESSION_PARAMS),
             random_state=42,
-            n_jobs=-1
+            n_jobs=n_jobs
         )
-        self.regression_model.fit(X_train_scaled, y_score_train)
+        model.fit(X_train_scaled, y_score_train)
+        return model
+    
+    @staticmethod
+    def fit_classification(X_train_scaled, y_class_train, params=None):
+        """
+        Fit the quality status model (boosting stages are sequential)
+        params: GradientBoostingClassifier hyperparameters (default CLASSIFICATION_PARAMS)
+        """
+        from sklearn.ensemble import GradientBoostingClassifier
         
-        # Train classification model (quality status)
-        print("  Training Classification Model...")
-        self.classification_model = GradientBoostingClassifier(
-            n_estimators=100,
-            max_depth=5,
+        model = GradientBoostingClassifier(
+            **(params or QualityPredictor.CLASSIFICATION_PARAMS),
             random_state=42
         )
-        self.classification_model.fit(X_train_scaled, y_class_train)
+        model.fit(X_train_scaled, y_class_train)
+        return model
+    
+    def finish_training(self, regression_model, classification_model, split):
+        """
+        Install fitted models, compile them and report test accuracy
+        """
+        
+        import pandas as pd
+        
+        self.regression_model = regression_model
+        self.classification_model = classification_model
+        self.compile_models()
+        # Distilled from (or compared with) the previous models
+        self.surrogate = None
+        self.segments = None
         
         # Evaluate models
-        reg_score = self.regression_model.score(X_test_scaled, y_score_test)
-        class_score = self.classification_model.score(X_test_scaled, y_class_test)
+        reg_score = self.regression_model.score(split['X_test'], split['y_score_test'])
+        class_score = self.classification_model.score(split['X_test'], split['y_class_test'])
         
         print(f"\n  ✓ Regression Model Accuracy: {reg_score*100:.2f}%")
         print(f"  ✓ Classification Model Accuracy: {class_score*100:.2f}%")
         
         # Feature importance
         feature_importance = pd.DataFrame({
-            'feature': X.columns,
+            'feature': split['columns'],
             'importance': self.regression_model.feature_importances_
         }).sort_values('importance', ascending=False)
         
@@ -119,93 +322,699 @@ class QualityPredictor:
         
         return reg_score, class_score
     
-    def save_model(self):
-        """Save trained models to disk"""
-        joblib.dump(self.regression_model, 
-                   f"{self.model_path}quality_regression.pkl")
-        joblib.dump(self.classification_model, 
-                   f"{self.model_path}quality_classification.pkl")
-        joblib.dump(self.scaler, 
-                   f"{self.model_path}scaler.pkl")
+    def prune(self, split, tolerance=PRUNING_TOLERANCE):
+        """
+        Smallest-ensemble copies of the trained models
+        The tree counts are picked on the split's validation rows (from
+        split_training_data(validation=True)) and scored on its test rows.
+        With SERVE_PRUNED_MODELS on they are served from now on, and by
+        load_model once saved. Returns the pruning report.
+        """
+        
+        if 'X_val' not in split:
+            raise ValueError("prune needs validation rows: split_training_data(validation=True)")
+        
+        print("  Pruning ensembles...")
+        regression, regression_report = prune_random_forest(
+            self.regression_model, split['X_val'], split['y_score_val'], tolerance,
+            X_test=split['X_test'], y_test=split['y_score_test']
+        )
+        classification, classification_report = prune_gradient_boosting(
+            self.classification_model, split['X_val'], split['y_class_val'], tolerance,
+            X_test=split['X_test'], y_test=split['y_class_test']
+        )
+        self.pruned_models = {'regression': regression, 'classification': classification}
+        self.pruning_report = {
+            'regression': regression_report,
+            'classification': classification_report
+        }
+        
+        if SERVE_PRUNED_MODELS:
+            self.compiled_regression = CompiledRandomForestRegressor(regression, self.scaler)
+            self.compiled_classification = CompiledGradientBoostingClassifier(
+                classification, self.scaler
+            )
+            # After the swap, so no old-model result is cached once cleared
+            self.cache.clear()
+            self.serving_pruned = True
+        
+        print_pruning_report("Regression forest", regression_report)
+        print_pruning_report("Classification boosting", classification_report)
+        return self.pruning_report
+    
+    def distill(self, X):
+        """
+        Fit the fast-mode surrogate to the trained models
+        X: training features. Returns the surrogate's fidelity metrics.
+        """
+        
+        print("  Distilling fast-mode surrogate...")
+        self.surrogate = QualitySurrogate.distill(self, X)
+        self.cache.clear()
+        
+        fidelity = self.surrogate.fidelity
+        print(f"  ✓ Surrogate class agreement: {fidelity['class_agreement']*100:.2f}%, "
+              f"score MAE: {fidelity['score_mae']:.2f}")
+        print(f"  ✓ Fast mode: {fidelity['coverage']*100:.1f}% served by surrogate, "
+              f"{fidelity['fast_mode_class_agreement']*100:.2f}% agreement, "
+              f"{fidelity['speedup']}x faster per request, "
+              f"{fidelity['batch_speedup']}x per {fidelity['batch_rows']}-row batch")
+        return fidelity
+    
+    def save_model(self, model_path=None):
+        """Save trained models to disk (default: self.model_path)"""
+        import joblib
+        artifacts = [
+            (self.regression_model, "quality_regression.pkl"),
+            (self.classification_model, "quality_classification.pkl"),
+            (self.scaler, "scaler.pkl")
+        ]
+        # Uncompressed node arrays that workers memory-map instead of unpickling
+        if self.compiled_regression is not None:
+            if self.serving_pruned:
+                # The served arrays are the pruned ensembles, saved below
+                full = {
+                    'regression': CompiledRandomForestRegressor(self.regression_model, self.scaler),
+                    'classification': CompiledGradientBoostingClassifier(
+                        self.classification_model, self.scaler
+                    )
+                }
+            else:
+                full = {'regression': self.compiled_regression,
+                        'classification': self.compiled_classification}
+            artifacts.append((full, "quality_compiled.pkl"))
+        if self.surrogate is not None:
+            artifacts.append((self.surrogate, "quality_surrogate.pkl"))
+        elif os.path.exists(f"{model_path or self.model_path}quality_surrogate.pkl"):
+            # Distilled from models being replaced
+            os.remove(f"{model_path or self.model_path}quality_surrogate.pkl")
+        
+        pruned_names = [
+            "quality_regression_pruned.pkl",
+            "quality_classification_pruned.pkl",
+            "quality_compiled_pruned.pkl"
+        ]
+        if self.pruned_models is not None:
+            artifacts += [
+                (self.pruned_models['regression'], pruned_names[0]),
+                (self.pruned_models['classification'], pruned_names[1]),
+                ({'regression': CompiledRandomForestRegressor(
+                      self.pruned_models['regression'], self.scaler
+                  ),
+                  'classification': CompiledGradientBoostingClassifier(
+                      self.pruned_models['classification'], self.scaler
+                  ),
+                  'report': self.pruning_report},
+                 pruned_names[2])
+            ]
+        else:
+            # Pruned from models being replaced
+            for name in pruned_names:
+                if os.path.exists(f"{model_path or self.model_path}{name}"):
+                    os.remove(f"{model_path or self.model_path}{name}")
+        
+        artifacts = with_compact_copies(
+            artifacts, model_path or self.model_path, self.COMPILED_ARTIFACTS
+        )
+        
+        # Write to temporary files first: other workers may have the current
+        # files memory-mapped, so they must be replaced, never rewritten
+        for obj, name in artifacts:
+            tmp_path = f"{model_path or self.model_path}{name}.tmp"
+            joblib.dump(obj, tmp_path)
+            os.replace(tmp_path, f"{model_path or self.model_path}{name}")
+        
+        if self.segments is not None:
+            self.segments.save(model_path or self.model_path)
+        else:
+            # Segment models of the models being replaced
+            remove_segments(model_path or self.model_path)
         print("\n  ✓ Models saved successfully!")
     
     def load_model(self):
-        """Load trained models from disk"""
+        """
+        Load trained models from disk
+        Serving uses the memory-mapped compiled arrays; the sklearn estimators
+        and scaler are only unpickled (importing sklearn) when something asks
+        for them. The pruned ensembles are served instead of the full ones
+        when they were saved and SERVE_PRUNED_MODELS is on, and the compact
+        node arrays when SERVE_COMPACT_MODELS is on.
+        """
+        import joblib
         try:
-            self.regression_model = joblib.load(
-                f"{self.model_path}quality_regression.pkl"
+            self.serving_pruned = SERVE_PRUNED_MODELS and os.path.exists(
+                f"{self.model_path}quality_compiled_pruned.pkl"
             )
-            self.classification_model = joblib.load(
-                f"{self.model_path}quality_classification.pkl"
-            )
-            self.scaler = joblib.load(
-                f"{self.model_path}scaler.pkl"
+            self.serving_compact = False
+            compiled_path = f"{self.model_path}{self._artifact('quality_compiled')}"
+            if os.path.exists(compiled_path):
+                compiled, self.serving_compact = load_compiled(
+                    self.model_path, self._artifact('quality_compiled')
+                )
+                self.compiled_regression = compiled['regression']
+                self.compiled_classification = compiled['classification']
+                self.cache.clear()
+                self.pruning_report = compiled.get('report')
+                self._regression_model = None
+                self._classification_model = None
+                self._scaler = None
+                self._estimators_on_disk = True
+            else:
+                self.scaler = joblib.load(
+                    f"{self.model_path}scaler.pkl"
+                )
+                self.regression_model = joblib.load(
+                    f"{self.model_path}{self._artifact('quality_regression')}"
+                )
+                self.classification_model = joblib.load(
+                    f"{self.model_path}{self._artifact('quality_classification')}"
+                )
+                self.compile_models()
+            
+            surrogate_path = f"{self.model_path}quality_surrogate.pkl"
+            self.surrogate = (
+                load_compiled(self.model_path, "quality_surrogate.pkl")[0]
+                if os.path.exists(surrogate_path) else None
             )
+            # Only the manifest: segment models load on first request
+            self.segments = SegmentModels.load(self.model_path)
             print("✓ Models loaded successfully!")
             return True
         except Exception as e:
             print(f"❌ Error loading models: {e}")
             return False
     
-    def predict(self, temperature, humidity, ph, moisture, 
-                days_elapsed, impurity, active_ingredient):
+    def for_segment(self, segment):
+        """The segment's own predictor when it has one, otherwise this (global) one"""
+        if segment is not None and self.segments is not None:
+            predictor = self.segments.get(segment)
+            if predictor is not None:
+                return predictor
+        return self
+    
+    def model_segment(self, segment):
+        """segment if it has a model, else None (scored by the global model)"""
+        if segment is not None and self.segments is not None and segment in self.segments:
+            return segment
+        return None
+    
+    def _artifact(self, name):
+        """File name of a model artifact in the variant being served"""
+        return f"{name}_pruned.pkl" if self.serving_pruned else f"{name}.pkl"
+    
+    def _load_estimators(self):
+        """Unpickle the sklearn estimators the first time they're needed"""
+        if not self._estimators_on_disk:
+            return
+        import joblib
+        scaler = joblib.load(
+            f"{self.model_path}scaler.pkl"
+        )
+        regression_model = joblib.load(
+            f"{self.model_path}{self._artifact('quality_regression')}"
+        )
+        classification_model = joblib.load(
+            f"{self.model_path}{self._artifact('quality_classification')}"
+        )
+        self._scaler = scaler
+        self._regression_model = regression_model
+        self._classification_model = classification_model
+        self._estimators_on_disk = False
+    
+    def compile_models(self):
         """
-        Make prediction for a single medicine sample
+        Flatten the fitted forests into NumPy node arrays for fast inference
+        Falls back to sklearn predict if the models can't be compiled
+        """
+        try:
+            self.compiled_regression = CompiledRandomForestRegressor(
+                self.regression_model, self.scaler
+            )
+            self.compiled_classification = CompiledGradientBoostingClassifier(
+                self.classification_model, self.scaler
+            )
+        except Exception as e:
+            self.compiled_regression = None
+            self.compiled_classification = None
+            print(f"⚠️  Fast inference unavailable, using sklearn: {e}")
+        # Cached predictions belong to the previous models; cleared after the
+        # swap so a concurrent request can't cache an old result again
+        self.cache.clear()
+    
+    def _predict_arrays(self, features):
+        """
+        Score a 2D array of raw (unscaled) feature rows
+        Returns quality scores, quality statuses and class probabilities
         """
         
-        # Prepare features
-        features = np.array([[
-            temperature,
-            humidity,
-            ph,
-            moisture,
-            days_elapsed,
-            impurity,
-            active_ingredient
-        ]])
+        if self.compiled_regression is not None:
+            quality_scores = self.compiled_regression.predict(features)
+            probabilities = self.compiled_classification.predict_proba(features)
+            quality_statuses = self.classes_[
+                np.argmax(probabilities, axis=1)
+            ]
+            return quality_scores, quality_statuses, probabilities
         
         # Scale features
         features_scaled = self.scaler.transform(features)
         
-        # Predict quality score
-        quality_score = self.regression_model.predict(features_scaled)[0]
+        quality_scores = self.regression_model.predict(features_scaled)
+        quality_statuses = self.classification_model.predict(features_scaled)
+        probabilities = self.classification_model.predict_proba(features_scaled)
         
-        # Predict quality status
-        quality_status = self.classification_model.predict(features_scaled)[0]
+        return quality_scores, quality_statuses, probabilities
+    
+    def _predict_joint(self, features):
+        """
+        Scores and statuses from one classifier pass
+        The score is the probability-weighted CLASS_SCORES value, the status
+        the most probable class. Returns the same triple as _predict_arrays.
+        """
+        
+        if self.compiled_classification is not None:
+            probabilities = self.compiled_classification.predict_proba(features)
+        else:
+            probabilities = self.classification_model.predict_proba(
+                self.scaler.transform(features)
+            )
+        class_scores = np.array(
+            [self.CLASS_SCORES[name] for name in self.classes_], dtype=np.float64
+        )
+        quality_scores = probabilities @ class_scores
+        quality_statuses = self.classes_[np.argmax(probabilities, axis=1)]
+        return quality_scores, quality_statuses, probabilities
+    
+    def benchmark_joint_mode(self, split, repeats=200):
+        """
+        Compare joint mode with the two-model setup on the test split
+        Returns score R², class accuracy and latency of both.
+        """
+        
+        features = self.scaler.inverse_transform(split['X_test'])
+        y_score = np.asarray(split['y_score_test'], dtype=np.float64)
+        y_class = np.asarray(split['y_class_test'])
+        
+        def r2(scores):
+            total = np.sum((y_score - y_score.mean()) ** 2)
+            return float(1 - np.sum((y_score - scores) ** 2) / total) if total > 0 else None
+        
+        results = {}
+        for name, fn in (('full', self._predict_arrays), ('joint', self._predict_joint)):
+            scores, statuses, _ = fn(features)
+            results[name] = {
+                'score_r2': r2(scores),
+                'class_accuracy': float(np.mean(statuses == y_class)),
+                'latency_ms': round(median_latency_ms(fn, features[:1], repeats), 4),
+                'batch_ms': round(median_latency_ms(fn, features[:1000], 5), 3)
+            }
+        results['speedup'] = round(results['full']['latency_ms'] / results['joint']['latency_ms'], 2)
+        results['batch_speedup'] = round(results['full']['batch_ms'] / results['joint']['batch_ms'], 2)
+        
+        print(f"  ✓ Joint mode: score R² {results['joint']['score_r2']:.4f} "
+              f"(two models: {results['full']['score_r2']:.4f}), "
+              f"{results['speedup']}x faster per request, "
+              f"{results['batch_speedup']}x per batch")
+        return results
+    
+    def predict(self, temperature, humidity, ph, moisture, 
+                days_elapsed, impurity, active_ingredient, mode='full'):
+        """
+        Make prediction for a single medicine sample
+        Inputs are quantized to sensor precision and served from the cache
+        when the same conditions were scored recently
+        """
+        
+        return self.predict_many([
+            (temperature, humidity, ph, moisture, days_elapsed, impurity, active_ingredient)
+        ], mode=mode)[0]
+    
+    def predict_many(self, inputs, mode='full'):
+        """
+        predict() for many samples at once
+        inputs: sequence of (temperature, humidity, ph, moisture, days_elapsed,
+        impurity, active_ingredient) tuples. Cache misses are scored together
+        in one predict_batch call.
+        """
+        
+        keys = [quantize(values, self.INPUT_PRECISION) for values in inputs]
+        if mode != 'full':
+            keys = [key + (mode,) for key in keys]
+        predictions = [self.cache.get(key) for key in keys]
+        
+        # Identical inputs within the batch are scored once
+        missing = list(dict.fromkeys(
+            key for key, prediction in zip(keys, predictions) if prediction is None
+        ))
+        if missing:
+            # Prepare features
+            features = np.array(
+                [key[:len(self.FEATURES)] for key in missing], dtype=np.float64
+            ) * self.INPUT_PRECISION
+            batch = self.predict_batch(features, mode=mode)
+            scored = {}
+            for i, key in enumerate(missing):
+                scored[key] = self.prediction_from_batch(batch, i)
+                self.cache.put(key, scored[key])
+            predictions = [
+                scored[key] if prediction is None else prediction
+                for key, prediction in zip(keys, predictions)
+            ]
         
-        # Predict probability for each class
-        probabilities = self.classification_model.predict_proba(features_scaled)[0]
-        class_names = self.classification_model.classes_
+        # Callers add keys to the result, so hand out copies
+        return [
+            {**prediction, 'confidence': dict(prediction['confidence'])}
+            for prediction in predictions
+        ]
+    
+    def prediction_from_batch(self, batch, i):
+        """Build the predict() result dict for row i of a predict_batch result"""
+        
+        quality_score = float(batch['quality_score'][i])
+        probabilities = batch['confidence'][i]
+        class_names = batch['classes']
         
         prob_dict = {
-            class_names[i]: float(probabilities[i]) 
-            for i in range(len(class_names))
+            class_names[k]: float(probabilities[k]) 
+            for k in range(len(class_names))
         }
         
         return {
-            'quality_score': float(quality_score),
-            'quality_status': quality_status,
+            'quality_score': quality_score,
+            'quality_status': batch['quality_status'][i],
             'confidence': prob_dict,
-            'degradation_risk': 'High' if quality_score < 50 else 'Low'
+            'degradation_risk': 'High' if quality_score < 50 else 'Low',
+            'served_by': str(batch['served_by'][i])
+        }
+    
+    def predict_batch(self, samples, mode='full'):
+        """
+        Score many medicine samples in one pass
+        
+        samples: DataFrame with the FEATURES columns, or an (n, 7) array in
+        FEATURES order. Returns a dict of arrays aligned with the input rows;
+        'served_by' says which model ('fast', 'full' or 'joint') scored each row.
+        """
+        
+        if mode not in self.PREDICTION_MODES:
+            raise ValueError(f"Unknown prediction mode '{mode}'")
+        
+        # DataFrame input (checked without importing pandas)
+        if hasattr(samples, 'columns'):
+            samples = samples[self.FEATURES]
+        features = np.asarray(samples, dtype=np.float64).reshape(-1, len(self.FEATURES))
+        
+        if mode == 'fast' and self.surrogate is not None:
+            quality_scores, probabilities, confident = self.surrogate.predict(features)
+            
+            # Rows the surrogate is unsure about go to the full models
+            uncertain = ~confident
+            if uncertain.any():
+                full_scores, _, full_probabilities = self._predict_arrays(features[uncertain])
+                quality_scores[uncertain] = full_scores
+                probabilities[uncertain] = full_probabilities
+            
+            quality_statuses = self.classes_[np.argmax(probabilities, axis=1)]
+            served_by = np.where(confident, 'fast', 'full')
+        elif mode == 'joint':
+            quality_scores, quality_statuses, probabilities = self._predict_joint(features)
+            served_by = np.full(len(features), 'joint')
+        else:
+            quality_scores, quality_statuses, probabilities = self._predict_arrays(features)
+            served_by = np.full(len(features), 'full')
+        
+        return {
+            'quality_score': quality_scores,
+            'quality_status': quality_statuses,
+            'confidence': probabilities,
+            'classes': self.classes_,
+            'degradation_risk': np.where(quality_scores < 50, 'High', 'Low'),
+            'served_by': served_by
         }
     
-    def predict_degradation_timeline(self, current_conditions, days_ahead=30):
+    def _grid_axis(self, values, column):
+        """
+        Representative values of one grid axis, and the representative of
+        each value
+        Values between the same two split thresholds (of every forest that
+        may serve a prediction) take the same path through every tree, so
+        they get the same prediction and only one of them is scored.
+        """
+        
+        values = np.asarray(values, dtype=np.float64)
+        if self.compiled_regression is None:
+            # sklearn fallback: no node arrays to read the splits from
+            return values, np.arange(len(values))
+        
+        forests = [self.compiled_regression.forest, self.compiled_classification.forest]
+        if self.surrogate is not None:
+            forests.append(self.surrogate.forest)
+        thresholds = np.unique(np.concatenate([
+            forest.split_thresholds(column) for forest in forests
+        ]))
+        # x goes right at a split iff threshold < x
+        bins = np.searchsorted(thresholds, values, side='left')
+        _, first, inverse = np.unique(bins, return_index=True, return_inverse=True)
+        return values[first], inverse
+    
+    def iter_condition_grid(self, temperatures, humidities, days, conditions,
+                            mode='full', chunk_rows=GRID_CHUNK_ROWS):
+        """
+        Score every (temperature, humidity, days_elapsed) combination
+        
+        conditions: (ph, moisture, impurity, active_ingredient), held fixed.
+        Each axis is reduced to one value per threshold bin (see _grid_axis),
+        so the scored grid is often far smaller than the requested one; the
+        result is identical. Yields, a block of temperatures at a time,
+        (first temperature index, scores, status indices into classes_), the
+        arrays shaped (temperatures in block, humidities, days).
+        """
+        
+        ph, moisture, impurity, active = conditions
+        t_values, t_index = self._grid_axis(temperatures, self.FEATURES.index('storage_temperature'))
+        h_values, h_index = self._grid_axis(humidities, self.FEATURES.index('storage_humidity'))
+        d_values, d_index = self._grid_axis(days, self.FEATURES.index('days_elapsed'))
+        block = max(1, chunk_rows // (len(h_values) * len(d_values)))
+        
+        for start in range(0, len(t_index), block):
+            # Representatives this block of requested temperatures needs
+            needed, inverse = np.unique(t_index[start:start + block], return_inverse=True)
+            t_grid, h_grid, d_grid = np.meshgrid(
+                t_values[needed], h_values, d_values, indexing='ij'
+            )
+            features = np.empty((t_grid.size, len(self.FEATURES)), dtype=np.float64)
+            features[:] = [0, 0, ph, moisture, 0, impurity, active]
+            features[:, 0] = t_grid.ravel()
+            features[:, 1] = h_grid.ravel()
+            features[:, 4] = d_grid.ravel()
+            
+            batch = self.predict_batch(features, mode=mode)
+            shape = (len(needed), len(h_values), len(d_values))
+            scores = batch['quality_score'].reshape(shape)
+            statuses = np.argmax(batch['confidence'], axis=1).reshape(shape)
+            
+            # Back to the requested axes
+            expand = np.ix_(inverse, h_index, d_index)
+            yield start, scores[expand], statuses[expand]
+    
+    def predict_condition_grid(self, temperatures, humidities, days, conditions, mode='full'):
+        """
+        iter_condition_grid in one piece
+        Returns (scores, status indices into classes_), each shaped
+        (temperatures, humidities, days).
+        """
+        
+        blocks = list(self.iter_condition_grid(temperatures, humidities, days, conditions, mode))
+        return (
+            np.concatenate([scores for _, scores, _ in blocks]),
+            np.concatenate([statuses for _, _, statuses in blocks])
+        )
+    
+    def predict_degradation_matrix(self, current_conditions, days_ahead=30,
+                                   step_days=5, days_elapsed=0):
+        """
+        Score every horizon of a degradation timeline in one pass
+        
+        Builds one feature row per horizon (days_elapsed + 0, step, 2*step, ...)
+        and runs each model once over the whole matrix
+        """
+        
+        return self.predict_degradation_matrices(
+            [current_conditions], [days_elapsed], days_ahead, step_days
+        )
+    
+    def predict_degradation_matrices(self, conditions, days_elapsed, days_ahead=30, step_days=5):
+        """
+        predict_degradation_matrix for many samples in one pass
+        
+        conditions: (n, 6) array of (temp, humidity, ph, moisture, impurity, active)
+        days_elapsed: current age of each sample in days
+        The result has one row per (sample, horizon), sample-major; pass the
+        sample index to timeline_from_batch to get its timeline.
+        """
+        
+        conditions = np.asarray(conditions, dtype=np.float64).reshape(-1, 6)
+        days_elapsed = np.broadcast_to(
+            np.asarray(days_elapsed, dtype=np.float64), (len(conditions),)
+        )
+        
+        days = np.arange(0, days_ahead, step_days)
+        features = np.empty((len(conditions), len(days), len(self.FEATURES)), dtype=np.float64)
+        features[:, :, :4] = conditions[:, None, :4]
+        features[:, :, 4] = days_elapsed[:, None] + days
+        features[:, :, 5:] = conditions[:, None, 4:]
+        
+        batch = self.predict_batch(features.reshape(-1, len(self.FEATURES)))
+        batch['days_from_now'] = days
+        return batch
+    
+    def predict_degradation_timeline(self, current_conditions, days_ahead=30,
+                                     step_days=5, days_elapsed=0):
         """
         Predict quality degradation over time
         """
         
-        predictions = []
-        temp, humidity, ph, moisture, impurity, active = current_conditions
+        batch = self.predict_degradation_matrix(
+            current_conditions, days_ahead, step_days, days_elapsed
+        )
+        return self.timeline_from_batch(batch)
+    
+    def timeline_from_batch(self, batch, sample=0):
+        """Convert a predict_degradation_matrix (or one sample of a _matrices) result into timeline dicts"""
         
-        for days in range(0, days_ahead, 5):
-            pred = self.predict(
-                temp, humidity, ph, moisture, 
-                days, impurity, active
+        start = sample * len(batch['days_from_now'])
+        rows = slice(start, start + len(batch['days_from_now']))
+        return [
+            {
+                'days_from_now': int(days),
+                'predicted_quality': float(score),
+                'predicted_status': status
+            }
+            for days, score, status in zip(
+                batch['days_from_now'],
+                batch['quality_score'][rows],
+                batch['quality_status'][rows]
             )
-            predictions.append({
-                'days_from_now': days,
-                'predicted_quality': pred['quality_score'],
-                'predicted_status': pred['quality_status']
-            })
+        ]
+    
+    def _score_curves(self, features, band=(10, 90)):
+        """
+        Mean quality score plus the band percentiles of the per-tree scores
+        Returns an (n, 3) array: [mean, low, high]
+        """
+        
+        if self.compiled_regression is not None:
+            per_tree = self.compiled_regression.forest.leaf_values(features)
+        else:
+            features_scaled = self.scaler.transform(features)
+            per_tree = np.column_stack([
+                tree.predict(features_scaled)
+                for tree in self.regression_model.estimators_
+            ])
+        
+        low, high = np.percentile(per_tree, band, axis=1)
+        return np.column_stack([per_tree.mean(axis=1), low, high])
+    
+    def estimate_shelf_life_batch(self, conditions, days_elapsed, max_days,
+                                  threshold=70, band=(10, 90), grid_points=8):
+        """
+        Find the first day each sample's predicted score drops below threshold
+        
+        conditions: (n, 6) array of (temp, humidity, ph, moisture, impurity, active)
+        days_elapsed: current age of each sample in days
+        max_days: search horizon per sample (e.g. days until expiry)
+        
+        Each level scores grid_points days inside every open bracket in one
+        batch, so a 2-year horizon resolves to the day in about 4 levels.
+        The same search runs on the band percentiles of the per-tree scores
+        to give an earliest/latest confidence band. The search assumes the
+        score falls with age; a brief dip between grid points can be missed.
+        
+        Returns an (n, 3) int array of [day, earliest, latest]; -1 means the
+        score stays above threshold for the whole horizon.
+        """
+        
+        conditions = np.asarray(conditions, dtype=np.float64).reshape(-1, 6)
+        n = len(conditions)
+        days_elapsed = np.broadcast_to(np.asarray(days_elapsed, dtype=np.int64), (n,))
+        max_days = np.maximum(np.broadcast_to(np.asarray(max_days, dtype=np.int64), (n,)), 0)
+        
+        # One search per (sample, curve) pair
+        sample = np.repeat(np.arange(n), 3)
+        curve = np.tile(np.arange(3), n)
+        horizon = max_days[sample]
         
-        return predictions
\ No newline at end of file
+        lo = np.full(3 * n, -1, dtype=np.int64)   # last day known to be above threshold
+        hi = horizon + 1                          # first day known below (horizon + 1 = not found)
+        steps = np.arange(grid_points)
+        
+        while True:
+            active = np.nonzero(hi - lo > 1)[0]
+            if len(active) == 0:
+                break
+            
+            # grid_points days spanning (lo, hi], clipped to the horizon
+            width = (hi[active] - lo[active] - 1)[:, None]
+            days = lo[active][:, None] + 1 + width * steps // (grid_points - 1)
+            days = np.minimum(days, horizon[active][:, None])
+            
+            # Score each distinct (sample, day) once; curves share rows
+            keys = sample[active][:, None] * (max_days.max() + 2) + days
+            unique_keys, inverse = np.unique(keys.ravel(), return_inverse=True)
+            key_sample = unique_keys // (max_days.max() + 2)
+            key_day = unique_keys % (max_days.max() + 2)
+            
+            rows = conditions[key_sample]
+            features = np.column_stack([
+                rows[:, :4],
+                days_elapsed[key_sample] + key_day,
+                rows[:, 4:]
+            ])
+            curves = self._score_curves(features, band)
+            scores = curves[inverse.reshape(days.shape), curve[active][:, None]]
+            
+            below = scores < threshold
+            found = below.any(axis=1)
+            first = np.argmax(below, axis=1)
+            
+            # Crossing found: shrink the bracket around it
+            idx = active[found]
+            new_hi = days[found, first[found]]
+            prev = first[found] - 1
+            new_lo = np.where(
+                prev >= 0, days[found, np.maximum(prev, 0)], lo[idx]
+            )
+            hi[idx] = new_hi
+            lo[idx] = new_lo
+            
+            # No crossing in the grid: everything up to the last point is above
+            idx = active[~found]
+            lo[idx] = days[~found, -1]
+        
+        result = np.where(hi <= horizon, hi, -1)
+        return result.reshape(n, 3)
+    
+    def estimate_shelf_life(self, current_conditions, days_elapsed=0, max_days=730,
+                            threshold=70, band=(10, 90)):
+        """
+        Estimate how many days until predicted quality drops below threshold
+        """
+        
+        result = self.estimate_shelf_life_batch(
+            [current_conditions], days_elapsed, max_days, threshold, band
+        )[0]
+        return self.shelf_life_result(result, max_days, threshold)
+    
+    def shelf_life_result(self, result, max_days, threshold=70):
+        """estimate_shelf_life() dict for one [day, earliest, latest] row of estimate_shelf_life_batch"""
+        
+        day, earliest, latest = result
+        return {
+            'shelf_life_days': int(day) if day >= 0 else None,
+            'confidence_band': {
+                'earliest_days': int(earliest) if earliest >= 0 else None,
+                'latest_days': int(latest) if latest >= 0 else None
+            },
+            'threshold': threshold,
+            'horizon_days': int(max(max_days, 0)),
+            'crosses_within_horizon': bool(day >= 0)
+        }
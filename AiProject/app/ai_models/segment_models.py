@@ -0,0 +1,324 @@
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from decouple import config
+
+# Per-Segment Quality Models
+#
+# Degradation differs by molecule, so next to the global quality model one
+# model per active ingredient is trained where there is enough data. The
+# segment of a record is its medicine name without dose or form
+# ("Aspirin 500mg" -> "aspirin"). Segment models are fitted on the global
+# model's train/test split restricted to their rows, and kept only when they
+# score at least as well as the global model on the same held-out rows.
+#
+# They are stored inside the quality model version:
+#
+#   segments.json              manifest: segment -> directory + metrics
+#   segments/<segment>/        that segment's QualityPredictor artifacts
+#
+# Serving loads a segment's predictor the first time a request for it
+# arrives, into an LRU of at most SEGMENT_CACHE_SIZE predictors per worker.
+# Segments without a model, and requests without a segment, are scored by
+# the global model.
+
+# Train segment models with the global quality model
+SEGMENT_MODELS = config('SEGMENT_MODELS', default=True, cast=bool)
+# Training rows (train split) a segment needs to get its own model
+SEGMENT_MIN_ROWS = config('SEGMENT_MIN_ROWS', default=500, cast=int)
+# Segment predictors kept loaded per worker
+SEGMENT_CACHE_SIZE = config('SEGMENT_CACHE_SIZE', default=8, cast=int)
+
+SEGMENT_MANIFEST = "segments.json"
+SEGMENT_DIR = "segments"
+
+
+def segment_key(medicine_name):
+    """Active-ingredient segment of a medicine name, or None"""
+    if not medicine_name:
+        return None
+    # Words before the first digit (the dose), as a directory-safe slug
+    match = re.match(r"[^\d]+", str(medicine_name).strip())
+    if match is None:
+        return None
+    key = re.sub(r"[^a-z]+", "-", match.group(0).lower()).strip('-')
+    return key or None
+
+
+def segment_keys(medicine_names):
+    """segment_key() of every name, as an object array (each distinct name parsed once)"""
+    names = list(medicine_names)
+    keys = {name: segment_key(name) for name in set(names)}
+    return np.array([keys[name] for name in names], dtype=object)
+
+
+def plan_segments(segments, y_class, test_rows, min_rows=SEGMENT_MIN_ROWS):
+    """
+    {segment: row mask} of the segments worth their own model: at least
+    min_rows training rows and two quality statuses among them
+    """
+
+    segments = np.asarray(segments, dtype=object)
+    y_class = np.asarray(y_class)
+    train_rows = ~np.asarray(test_rows)
+
+    plan = {}
+    for segment in sorted({s for s in segments if s is not None}):
+        rows = segments == segment
+        training = rows & train_rows
+        if training.sum() >= min_rows and len(np.unique(y_class[training])) >= 2 \
+                and (rows & ~train_rows).any():
+            plan[segment] = rows
+    return plan
+
+
+def train_segment(X, y_score, y_class, test_rows, n_jobs=1):
+    """
+    Fit a QualityPredictor on one segment's rows (runs as a training job)
+    test_rows: the segment's rows in the global model's test split, which
+    select_segments compares on; pruning picks its tree counts on a
+    validation slice of the training rows instead
+    """
+
+    from .quality_predictor import QualityPredictor
+    from .ensemble_pruning import ENSEMBLE_PRUNING
+
+    predictor = QualityPredictor()
+    split = predictor.split_training_data(
+        X, y_score, y_class, test_rows=test_rows, validation=ENSEMBLE_PRUNING
+    )
+    regression = QualityPredictor.fit_regression(
+        split['X_train'], split['y_score_train'], n_jobs=n_jobs
+    )
+    classification = QualityPredictor.fit_classification(
+        split['X_train'], split['y_class_train']
+    )
+    predictor.finish_training(regression, classification, split)
+    if ENSEMBLE_PRUNING:
+        predictor.prune(split)
+    return predictor
+
+
+def _model_bytes(predictor):
+    return predictor.compiled_regression.forest.nbytes + \
+        predictor.compiled_classification.forest.nbytes
+
+
+def evaluate_segment(global_predictor, predictor, X_test, y_score_test, y_class_test):
+    """
+    Score R², class accuracy and model size of a segment model and the global one on the same rows
+    Both prune on validation slices of their training rows, so neither picked its trees on these.
+    """
+
+    y_score_test = np.asarray(y_score_test, dtype=np.float64)
+    y_class_test = np.asarray(y_class_test)
+    total = np.sum((y_score_test - y_score_test.mean()) ** 2)
+
+    metrics = {'test_rows': len(y_score_test)}
+    for prefix, model in (('', predictor), ('global_', global_predictor)):
+        batch = model.predict_batch(X_test)
+        residual = np.sum((y_score_test - batch['quality_score']) ** 2)
+        metrics[f'{prefix}r2'] = float(1 - residual / total) if total > 0 else None
+        metrics[f'{prefix}accuracy'] = float(np.mean(batch['quality_status'] == y_class_test))
+        metrics[f'{prefix}model_bytes'] = _model_bytes(model)
+    return metrics
+
+
+def better_than_global(metrics):
+    """Segment model is kept when neither its R² nor its accuracy is below the global model's"""
+    r2_ok = metrics['r2'] is None or metrics['global_r2'] is None or \
+        metrics['r2'] >= metrics['global_r2']
+    return r2_ok and metrics['accuracy'] >= metrics['global_accuracy']
+
+
+def select_segments(global_predictor, trained, X, y_score, y_class, plan, test_rows):
+    """
+    Keep the trained segment models that beat the global one on their test rows
+    trained: {segment: predictor, or None if its job failed}; plan and
+    test_rows as given to the segment jobs. Returns (SegmentModels or None,
+    {segment: metrics with 'kept'}).
+    """
+
+    print("\n🧪 Segment models against the global model:")
+    kept = {}
+    report = {}
+    for segment, rows in plan.items():
+        predictor = trained.get(segment)
+        if predictor is None:
+            continue
+        test = rows & test_rows
+        metrics = evaluate_segment(
+            global_predictor, predictor, X[test], y_score[test], y_class[test]
+        )
+        metrics['training_rows'] = int((rows & ~test_rows).sum())
+        metrics['kept'] = better_than_global(metrics)
+        print_segment_report(segment, metrics, metrics['kept'])
+        report[segment] = metrics
+        if metrics['kept']:
+            kept[segment] = predictor
+
+    if not kept:
+        return None, report
+    return SegmentModels.from_trained(kept, report), report
+
+
+def print_segment_report(segment, metrics, kept):
+    status = "✓" if kept else "⚠️ "
+    r2 = f"{metrics['r2']:.4f}" if metrics['r2'] is not None else "-"
+    global_r2 = f"{metrics['global_r2']:.4f}" if metrics['global_r2'] is not None else "-"
+    print(f"  {status} Segment {segment}: R² {r2} (global {global_r2}), "
+          f"accuracy {metrics['accuracy']*100:.2f}% (global {metrics['global_accuracy']*100:.2f}%), "
+          f"{metrics['model_bytes'] // 1024} KiB (global {metrics['global_model_bytes'] // 1024} KiB)"
+          f"{'' if kept else ' - not better than global, dropped'}")
+
+
+def remove_segments(model_path):
+    """Delete a model directory's segment manifest and models"""
+    if os.path.exists(os.path.join(model_path, SEGMENT_MANIFEST)):
+        os.remove(os.path.join(model_path, SEGMENT_MANIFEST))
+    shutil.rmtree(os.path.join(model_path, SEGMENT_DIR), ignore_errors=True)
+
+
+class SegmentModels:
+    """
+    The segment predictors of one quality model version
+    Freshly trained ones are held in memory until saved; ones on disk are
+    loaded on first use and kept in a bounded LRU.
+    """
+
+    def __init__(self, segments, model_path=None, predictors=None,
+                 max_loaded=SEGMENT_CACHE_SIZE):
+        # {segment: {'path': directory relative to model_path, **metrics}}
+        self.segments = segments
+        self.model_path = model_path
+        self._trained = predictors or {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_loaded = max_loaded
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_trained(cls, predictors, metrics):
+        """Segments from training: {segment: predictor} and {segment: metrics}"""
+        return cls(
+            {
+                segment: {'path': f"{SEGMENT_DIR}/{segment}/", **metrics[segment]}
+                for segment in sorted(predictors)
+            },
+            predictors=dict(predictors)
+        )
+
+    @classmethod
+    def load(cls, model_path):
+        """Segments saved in model_path, or None when it has none (no model is loaded yet)"""
+        path = os.path.join(model_path, SEGMENT_MANIFEST)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            manifest = json.load(f)
+        return cls(manifest['segments'], model_path=model_path)
+
+    def __contains__(self, segment):
+        return segment in self.segments
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __getstate__(self):
+        # Training jobs pickle predictors across processes; the lock can't be
+        state = dict(self.__dict__)
+        state['_loaded'] = OrderedDict()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _load(self, segment):
+        from .quality_predictor import QualityPredictor
+
+        predictor = QualityPredictor(
+            model_path=os.path.join(self.model_path, self.segments[segment]['path'])
+        )
+        if not predictor.load_model():
+            raise ValueError(f"Could not load the {segment} segment model")
+        return predictor
+
+    def get(self, segment):
+        """Predictor of a segment, or None when the segment has no model"""
+
+        if segment not in self.segments:
+            return None
+        if segment in self._trained:
+            return self._trained[segment]
+
+        with self._lock:
+            predictor = self._loaded.get(segment)
+            if predictor is not None:
+                self._loaded.move_to_end(segment)
+                self.hits += 1
+                return predictor
+
+            # Loaded under the lock so concurrent requests load it once;
+            # the arrays are memory-mapped, so this takes milliseconds
+            try:
+                predictor = self._load(segment)
+            except Exception as e:
+                print(f"⚠️  Segment {segment} unavailable, using the global model: {e}")
+                return None
+            self.loads += 1
+            self._loaded[segment] = predictor
+            while len(self._loaded) > max(self.max_loaded, 1):
+                self._loaded.popitem(last=False)
+                self.evictions += 1
+            return predictor
+
+    def save(self, model_path):
+        """Write every segment model and the manifest under model_path"""
+
+        same_path = self.model_path is not None and \
+            os.path.abspath(self.model_path) == os.path.abspath(model_path)
+        if same_path and not self._trained:
+            return
+
+        segment_root = os.path.join(model_path, SEGMENT_DIR)
+        for segment, entry in self.segments.items():
+            path = os.path.join(model_path, entry['path'])
+            if segment in self._trained:
+                os.makedirs(path, exist_ok=True)
+                self._trained[segment].save_model(path)
+            else:
+                # Stored artifacts as they are (all variants, not just the served one)
+                shutil.copytree(
+                    os.path.join(self.model_path, entry['path']), path, dirs_exist_ok=True
+                )
+
+        # Segments of an earlier model that this one doesn't have
+        if os.path.isdir(segment_root):
+            for name in os.listdir(segment_root):
+                if name not in self.segments:
+                    shutil.rmtree(os.path.join(segment_root, name), ignore_errors=True)
+
+        manifest_path = os.path.join(model_path, SEGMENT_MANIFEST)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment_by': 'active_ingredient', 'segments': self.segments}, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'segments': sorted(self.segments),
+                'loaded': list(self._loaded),
+                'max_loaded': self.max_loaded,
+                'loads': self.loads,
+                'hits': self.hits,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,156 @@
+import numpy as np
+from decouple import config
+from .fast_inference import CompiledForest, _restore_state, median_latency_ms
+
+# Distilled Surrogate for the Quality Predictor
+#
+# One shallow decision tree is fitted to imitate the full models: its
+# targets are the random forest's quality score and the gradient boosting
+# class probabilities, computed by the full models on the training rows plus
+# perturbed and uniformly drawn copies of them. The tree is compiled to
+# NumPy node arrays like the full models, but walks 1 tree of depth
+# SURROGATE_MAX_DEPTH instead of 200 trees.
+#
+# A leaf whose rows the full classifier doesn't agree on ends up with mixed
+# probabilities; predictions whose top probability is below
+# SURROGATE_MIN_CONFIDENCE are treated as uncertain and scored by the full
+# models instead.
+
+SURROGATE_MAX_DEPTH = config('SURROGATE_MAX_DEPTH', default=8, cast=int)
+SURROGATE_MIN_CONFIDENCE = config('SURROGATE_MIN_CONFIDENCE', default=0.9, cast=float)
+# Synthetic rows labelled by the full models, per training row
+SURROGATE_AUGMENT_FACTOR = config('SURROGATE_AUGMENT_FACTOR', default=4, cast=int)
+
+
+def _augment(X, factor, rng):
+    """
+    Training rows plus jittered copies (10% of each column's spread) and
+    uniform draws from the per-column range, so the surrogate also learns
+    the full models' behaviour between and around the training points
+    """
+
+    n, d = X.shape
+    low, high = X.min(axis=0), X.max(axis=0)
+    spread = np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+
+    n_jitter = n * factor // 2
+    jitter = X[rng.integers(0, n, n_jitter)] + rng.normal(0, 0.1, (n_jitter, d)) * spread
+    uniform = rng.uniform(low, high, (n * factor - n_jitter, d))
+    return np.vstack([X, jitter, uniform])
+
+
+class QualitySurrogate:
+    """
+    Shallow-tree imitation of a trained QualityPredictor
+    predict() returns (quality_scores, probabilities, confident) for raw
+    feature rows; classes_ matches the full classifier.
+    """
+
+    __setstate__ = _restore_state
+
+    def __init__(self, forest, classes, min_confidence=SURROGATE_MIN_CONFIDENCE, fidelity=None):
+        self.forest = forest
+        self.classes_ = classes
+        self.min_confidence = min_confidence
+        self.fidelity = fidelity or {}
+
+    @classmethod
+    def distill(cls, teacher, X, max_depth=SURROGATE_MAX_DEPTH,
+                augment_factor=SURROGATE_AUGMENT_FACTOR,
+                min_confidence=SURROGATE_MIN_CONFIDENCE, random_state=42):
+        """
+        Fit a surrogate to a trained QualityPredictor
+        X: the teacher's training features (DataFrame or array in FEATURES order).
+        Fidelity to the teacher is measured on a 20% hold-out of the
+        distillation rows and stored in ``fidelity``.
+        """
+
+        from sklearn.tree import DecisionTreeRegressor
+
+        rng = np.random.default_rng(random_state)
+        if hasattr(X, 'columns'):
+            X = X[teacher.FEATURES]
+        X = np.asarray(X, dtype=np.float64)
+
+        rows = _augment(X, augment_factor, rng)
+        scores, _, probabilities = teacher._predict_arrays(rows)
+
+        order = rng.permutation(len(rows))
+        n_holdout = len(rows) // 5
+        holdout, train = order[:n_holdout], order[n_holdout:]
+
+        # Score rescaled to 0-1 so it weighs like a probability in the split criterion
+        targets = np.column_stack([scores / 100.0, probabilities])
+        tree = DecisionTreeRegressor(
+            max_depth=max_depth, min_samples_leaf=5, random_state=random_state
+        )
+        tree.fit(rows[train], targets[train])
+
+        # One compiled "tree" per output, all sharing the same structure
+        values = tree.tree_.value[:, :, 0]
+        forest = CompiledForest.from_trees(
+            [tree.tree_] * values.shape[1],
+            [values[:, 0] * 100.0] + [values[:, k] for k in range(1, values.shape[1])],
+            n_features=X.shape[1]
+        )
+        surrogate = cls(forest, teacher.classes_, min_confidence)
+        surrogate.fidelity = surrogate._measure_fidelity(
+            teacher, rows[holdout], scores[holdout], probabilities[holdout]
+        )
+        surrogate.fidelity['max_depth'] = max_depth
+        surrogate.fidelity['leaves'] = int(tree.get_n_leaves())
+        surrogate.fidelity['distillation_rows'] = len(train)
+        return surrogate
+
+    def _measure_fidelity(self, teacher, rows, teacher_scores, teacher_probabilities):
+        scores, probabilities, confident = self.predict(rows)
+        agree = np.argmax(probabilities, axis=1) == np.argmax(teacher_probabilities, axis=1)
+        residual = scores - teacher_scores
+        variance = np.var(teacher_scores)
+
+        # Single requests are dominated by per-call overhead; batches show the
+        # difference in per-row work
+        teacher_ms = median_latency_ms(teacher._predict_arrays, rows[:1], 200)
+        surrogate_ms = median_latency_ms(self.predict, rows[:1], 200)
+        teacher_batch_ms = median_latency_ms(teacher._predict_arrays, rows[:1000], 5)
+        surrogate_batch_ms = median_latency_ms(self.predict, rows[:1000], 5)
+
+        teacher_bytes = None
+        if teacher.compiled_regression is not None:
+            teacher_bytes = (
+                teacher.compiled_regression.forest.nbytes
+                + teacher.compiled_classification.forest.nbytes
+            )
+
+        return {
+            'holdout_rows': len(rows),
+            'score_mae': float(np.mean(np.abs(residual))),
+            'score_r2': float(1 - np.mean(residual ** 2) / variance) if variance > 0 else None,
+            'class_agreement': float(np.mean(agree)),
+            'min_confidence': self.min_confidence,
+            # Share of requests the surrogate answers itself in fast mode
+            'coverage': float(np.mean(confident)),
+            'confident_class_agreement': float(np.mean(agree[confident])) if confident.any() else None,
+            # Fast mode as served: surrogate when confident, full models otherwise
+            'fast_mode_class_agreement': float(np.mean(agree | ~confident)),
+            'full_latency_ms': round(teacher_ms, 4),
+            'surrogate_latency_ms': round(surrogate_ms, 4),
+            'speedup': round(teacher_ms / surrogate_ms, 1) if surrogate_ms > 0 else None,
+            'batch_rows': min(len(rows), 1000),
+            'full_batch_ms': round(teacher_batch_ms, 3),
+            'surrogate_batch_ms': round(surrogate_batch_ms, 3),
+            'batch_speedup': (
+                round(teacher_batch_ms / surrogate_batch_ms, 1) if surrogate_batch_ms > 0 else None
+            ),
+            'full_model_bytes': teacher_bytes,
+            'surrogate_model_bytes': self.forest.nbytes
+        }
+
+    def predict(self, X):
+        """Quality scores, class probabilities and a per-row confident flag"""
+        values = self.forest.leaf_values(X)
+        scores = values[:, 0]
+        probabilities = np.clip(values[:, 1:], 0.0, None)
+        probabilities = probabilities / np.maximum(probabilities.sum(axis=1, keepdims=True), 1e-12)
+        confident = probabilities.max(axis=1) >= self.min_confidence
+        return scores, probabilities, confident
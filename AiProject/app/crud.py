@@ -81,6 +81,40 @@ def get_recent_sensor_data(db: Session, user_id: int, hours: int = 24):
         models.SensorData.timestamp >= time_threshold
     ).order_by(desc(models.SensorData.timestamp)).limit(20).all()
 
+def get_latest_sensor_readings(db: Session, product_ids: List[int] = None, owner_id: int = None):
+    """
+    Latest sensor reading per product in one window-function query
+    Returns rows of (product_id, temperature, humidity, light_exposure, vibration, timestamp)
+    """
+    ranked = db.query(
+        models.SensorData.product_id.label('product_id'),
+        models.SensorData.temperature.label('temperature'),
+        models.SensorData.humidity.label('humidity'),
+        models.SensorData.light_exposure.label('light_exposure'),
+        models.SensorData.vibration.label('vibration'),
+        models.SensorData.timestamp.label('timestamp'),
+        func.row_number().over(
+            partition_by=models.SensorData.product_id,
+            order_by=(desc(models.SensorData.timestamp), desc(models.SensorData.id))
+        ).label('rank')
+    )
+    
+    if product_ids is not None:
+        ranked = ranked.filter(models.SensorData.product_id.in_(product_ids))
+    if owner_id is not None:
+        ranked = ranked.join(models.Product).filter(models.Product.owner_id == owner_id)
+    
+    ranked = ranked.subquery()
+    
+    return db.query(
+        ranked.c.product_id,
+        ranked.c.temperature,
+        ranked.c.humidity,
+        ranked.c.light_exposure,
+        ranked.c.vibration,
+        ranked.c.timestamp
+    ).filter(ranked.c.rank == 1).all()
+
 # Alert CRUD operations
 def create_alert(db: Session, alert: schemas.AlertCreate, user_id: int):
     db_alert = models.Alert(**alert.dict(), user_id=user_id)
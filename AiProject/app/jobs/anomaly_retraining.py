@@ -0,0 +1,130 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from decouple import config
+from ..database import SessionLocal
+from .. import model_registry
+from ..ai_models.anomaly_detector import AnomalyDetector
+from ..ai_models.ensemble_pruning import ENSEMBLE_PRUNING
+from .scheduler import PeriodicJob
+
+# Rolling Retraining for the Anomaly Detector
+#
+# Periodically retrains the Isolation Forest on a sliding window of recent
+# sensor readings in a separate process, validates it against the model
+# currently serving traffic on held-out readings of the same window and
+# publishes it to the model registry, which hot-swaps it into the API.
+
+RETRAIN_ENABLED = config('ANOMALY_RETRAIN_ENABLED', default=True, cast=bool)
+RETRAIN_INTERVAL_HOURS = config('ANOMALY_RETRAIN_INTERVAL_HOURS', default=24, cast=float)
+RETRAIN_WINDOW_DAYS = config('ANOMALY_RETRAIN_WINDOW_DAYS', default=7, cast=int)
+RETRAIN_MIN_SAMPLES = config('ANOMALY_RETRAIN_MIN_SAMPLES', default=50, cast=int)
+# New model may flag at most this much more of the held-out readings
+RETRAIN_TOLERANCE = config('ANOMALY_RETRAIN_TOLERANCE', default=0.05, cast=float)
+
+_retrain_lock = threading.Lock()
+
+
+def load_recent_readings(db, window_days=RETRAIN_WINDOW_DAYS):
+    """Stream the sliding window of sensor readings into a bounded sample"""
+    # Imported here so the API doesn't load pandas until a retrain runs
+    from .streaming_training import stream_sensor_sample, FEATURES
+
+    since = datetime.utcnow() - timedelta(days=window_days)
+    reservoir = stream_sensor_sample(db, since=since)
+    return reservoir.to_frame(FEATURES).astype(float)
+
+
+def _anomaly_rate(detector, X):
+    """Fraction of rows the detector flags as anomalous"""
+    predictions = detector.predict_labels(X)
+    return float(np.mean(predictions == -1))
+
+
+def _train_detector(sensor_df):
+    """Runs in the training process"""
+    detector = AnomalyDetector()
+    anomaly_count, normal_count = detector.train_model(sensor_df, prune=ENSEMBLE_PRUNING)
+    return detector, anomaly_count, normal_count
+
+
+def retrain_anomaly_detector(window_days=RETRAIN_WINDOW_DAYS):
+    """
+    Retrain on recent readings, validate, then swap and record
+    Returns a summary dict describing what happened
+    """
+
+    if not _retrain_lock.acquire(blocking=False):
+        return {"status": "skipped", "reason": "Retraining already in progress"}
+
+    db = SessionLocal()
+
+    try:
+        current = model_registry.get_predictor('anomaly')
+
+        readings = load_recent_readings(db, window_days)
+
+        if len(readings) < RETRAIN_MIN_SAMPLES:
+            return {
+                "status": "skipped",
+                "reason": f"Only {len(readings)} readings in the last {window_days} days"
+            }
+
+        # Hold out 20% of the raw window: both models are scored on the same
+        # unfiltered readings, so their anomaly rates are comparable. The
+        # Isolation Forest's contamination already accounts for the anomalies
+        # in the window, so it is trained on the rest of it as is.
+        holdout = readings.sample(frac=0.2, random_state=42)
+        train = readings.drop(holdout.index)
+
+        # Train in a separate process so the API's GIL isn't held
+        with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            detector, anomaly_count, normal_count = executor.submit(
+                _train_detector, train
+            ).result()
+        detector.compile_model()
+
+        new_rate = _anomaly_rate(detector, holdout.to_numpy())
+        old_rate = _anomaly_rate(current, holdout.to_numpy()) if current.is_trained() else None
+
+        if old_rate is not None and new_rate > old_rate + RETRAIN_TOLERANCE:
+            return {
+                "status": "rejected",
+                "reason": f"Held-out anomaly rate {new_rate:.1%} vs {old_rate:.1%} for current model",
+            }
+
+        # Store as a new registry version, record it and swap it in
+        manifest = model_registry.publish(
+            db,
+            'anomaly',
+            detector,
+            metrics={'accuracy': (1 - new_rate) * 100, 'holdout_anomaly_rate': new_rate},
+            training_data_count=len(train)
+        )
+        version = manifest['version']
+
+        print(f"✓ Anomaly detector retrained on {len(train)} readings (version {version})")
+
+        return {
+            "status": "swapped",
+            "version": version,
+            "training_samples": len(train),
+            "holdout_anomaly_rate": new_rate,
+            "previous_holdout_anomaly_rate": old_rate
+        }
+
+    finally:
+        db.close()
+        _retrain_lock.release()
+
+
+scheduler = PeriodicJob(
+    "anomaly-retraining",
+    RETRAIN_INTERVAL_HOURS * 3600,
+    retrain_anomaly_detector
+)
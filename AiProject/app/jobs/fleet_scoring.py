@@ -0,0 +1,196 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from decouple import config
+from sqlalchemy import insert
+from ..database import SessionLocal
+from .. import crud, models, model_registry
+from .scheduler import PeriodicJob
+
+# Fleet-Wide Quality Scoring
+#
+# Periodically scores every active (unexpired) product so each one has a
+# current QualityPrediction. Products are processed in id-ordered chunks:
+# one query for the chunk, one for its latest readings, one vectorized model
+# pass, and bulk inserts with one commit per chunk.
+
+FLEET_SCORING_ENABLED = config('FLEET_SCORING_ENABLED', default=True, cast=bool)
+FLEET_SCORING_INTERVAL_MINUTES = config('FLEET_SCORING_INTERVAL_MINUTES', default=15, cast=float)
+FLEET_SCORING_CHUNK_SIZE = config('FLEET_SCORING_CHUNK_SIZE', default=5000, cast=int)
+
+# Defaults used when lab measurements aren't available (same as smart analysis)
+DEFAULT_LAB_VALUES = {'ph': 7.0, 'moisture': 5.0, 'impurity': 0.5, 'active': 95.0}
+ALERT_THRESHOLD = 70
+
+_run_lock = threading.Lock()
+
+progress = {"status": "idle"}
+
+
+def _score_chunk(db, predictor, products, now):
+    """Score one chunk of products; returns (scored, alerts_created)"""
+
+    product_ids = [p.id for p in products]
+    latest = {
+        row.product_id: row
+        for row in crud.get_latest_sensor_readings(db, product_ids=product_ids)
+    }
+
+    rows = []
+    scored_products = []
+    for product in products:
+        reading = latest.get(product.id)
+        if reading is not None:
+            temperature, humidity = reading.temperature, reading.humidity
+        else:
+            temperature, humidity = product.current_temperature, product.current_humidity
+        if temperature is None or humidity is None:
+            continue
+
+        rows.append([
+            temperature,
+            humidity,
+            DEFAULT_LAB_VALUES['ph'],
+            DEFAULT_LAB_VALUES['moisture'],
+            DEFAULT_LAB_VALUES['impurity'],
+            DEFAULT_LAB_VALUES['active'],
+            (now - product.manufacturing_date).days,
+            (product.expiry_date - now).days
+        ])
+        scored_products.append(product)
+
+    if not rows:
+        return 0, 0
+
+    matrix = np.array(rows, dtype=np.float64)
+    conditions = matrix[:, :6]
+    days_elapsed = matrix[:, 6].astype(np.int64)
+    days_to_expiry = matrix[:, 7].astype(np.int64)
+
+    # One vectorized pass for the scores, one for the shelf-life search
+    features = np.column_stack([conditions[:, :4], days_elapsed, conditions[:, 4:]])
+    batch = predictor.predict_batch(features)
+    shelf_life = predictor.estimate_shelf_life_batch(
+        conditions, days_elapsed, days_to_expiry, threshold=ALERT_THRESHOLD
+    )[:, 0]
+
+    scores = batch['quality_score']
+    confidence = batch['confidence'].max(axis=1)
+
+    # Don't repeat alerts that are still unread
+    poor = [p.id for p, score in zip(scored_products, scores) if score < ALERT_THRESHOLD]
+    already_alerted = set()
+    if poor:
+        already_alerted = {
+            product_id for (product_id,) in db.query(models.Alert.product_id).filter(
+                models.Alert.product_id.in_(poor),
+                models.Alert.alert_type == "quality_degradation",
+                models.Alert.is_read == False
+            ).distinct()
+        }
+
+    prediction_rows = []
+    alert_rows = []
+    for i, product in enumerate(scored_products):
+        score = float(scores[i])
+        prediction_rows.append({
+            "product_id": product.id,
+            "predicted_quality_score": score,
+            "predicted_degradation_date": (
+                now + timedelta(days=int(shelf_life[i])) if shelf_life[i] >= 0 else None
+            ),
+            "confidence_level": float(confidence[i]),
+            "prediction_timestamp": now
+        })
+
+        if score < ALERT_THRESHOLD and product.id not in already_alerted:
+            alert_rows.append({
+                "user_id": product.owner_id,
+                "product_id": product.id,
+                "alert_type": "quality_degradation",
+                "severity": "high" if score < 50 else "medium",
+                "message": f"Scheduled AI scoring: Quality score is {score:.1f}"
+            })
+
+    db.execute(insert(models.QualityPrediction), prediction_rows)
+    if alert_rows:
+        db.execute(insert(models.Alert), alert_rows)
+    db.commit()
+
+    return len(prediction_rows), len(alert_rows)
+
+
+def score_fleet(chunk_size=FLEET_SCORING_CHUNK_SIZE):
+    """
+    Score all active products, chunk by chunk
+    Progress is published in the module-level ``progress`` dict
+    """
+
+    if not _run_lock.acquire(blocking=False):
+        return {"status": "skipped", "reason": "Fleet scoring already in progress"}
+
+    db = SessionLocal()
+    started = time.monotonic()
+
+    try:
+        predictor = model_registry.get_predictor('quality')
+        if not predictor.is_trained():
+            return {"status": "skipped", "reason": "Quality model not trained"}
+
+        now = datetime.utcnow()
+        active = db.query(models.Product).filter(models.Product.expiry_date >= now)
+
+        progress.clear()
+        progress.update({
+            "status": "running",
+            "started_at": now.isoformat(),
+            "products_total": active.count(),
+            "products_processed": 0,
+            "products_scored": 0,
+            "alerts_created": 0,
+            "chunks_done": 0
+        })
+
+        last_id = 0
+        while True:
+            # Keyset pagination keeps every chunk query cheap
+            products = active.filter(
+                models.Product.id > last_id
+            ).order_by(models.Product.id).limit(chunk_size).all()
+            if not products:
+                break
+            last_id = products[-1].id
+
+            scored, alerts = _score_chunk(db, predictor, products, now)
+
+            progress["products_processed"] += len(products)
+            progress["products_scored"] += scored
+            progress["alerts_created"] += alerts
+            progress["chunks_done"] += 1
+            print(f"  Fleet scoring: {progress['products_processed']}/{progress['products_total']} products")
+
+            # Release ORM objects so memory stays flat across chunks
+            db.expunge_all()
+
+        progress["status"] = "completed"
+        progress["finished_at"] = datetime.utcnow().isoformat()
+        progress["duration_seconds"] = round(time.monotonic() - started, 2)
+        return dict(progress)
+
+    except Exception as e:
+        db.rollback()
+        progress["status"] = "failed"
+        progress["error"] = str(e)
+        raise
+
+    finally:
+        db.close()
+        _run_lock.release()
+
+
+scheduler = PeriodicJob(
+    "fleet-scoring",
+    FLEET_SCORING_INTERVAL_MINUTES * 60,
+    score_fleet
+)
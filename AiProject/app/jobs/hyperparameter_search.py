@@ -0,0 +1,237 @@
+import itertools
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from decouple import config
+from ..ai_models.quality_predictor import QualityPredictor
+from ..ai_models.fast_inference import (
+    CompiledRandomForestRegressor,
+    CompiledGradientBoostingClassifier,
+    median_latency_ms
+)
+from .training_orchestrator import available_cpus
+
+# Hyperparameter Search for the Quality Predictor
+#
+# Successive halving over a grid of tree count, depth and learning rate,
+# scored by k-fold cross-validation. Every candidate starts on a small
+# subsample of each training fold; after each rung only the best
+# 1/TUNING_HALVING_FACTOR move on, with that many times more rows, and the
+# last rung trains on the full folds. Weak configurations are dropped
+# after a few cheap fits instead of being trained on everything.
+#
+# Each (candidate, fold) fit is one task for a pool of single-threaded
+# worker processes that hold the training data. Candidates are validated on
+# the whole held-out fold at every rung, so scores are comparable across
+# rungs. The fold-0 model of every candidate is also compiled and timed, so
+# the report has the latency per prediction next to the CV score. Timings
+# are taken while other workers fit, so compare them within one report.
+
+TUNING_FOLDS = config('TUNING_FOLDS', default=5, cast=int)
+TUNING_HALVING_FACTOR = config('TUNING_HALVING_FACTOR', default=3, cast=int)
+# Training rows per fold in the first rung (at least)
+TUNING_MIN_ROWS = config('TUNING_MIN_ROWS', default=2000, cast=int)
+# Best candidate is chosen among those at most this slow per single
+# prediction (0 = no limit)
+TUNING_MAX_LATENCY_MS = config('TUNING_MAX_LATENCY_MS', default=0.0, cast=float)
+# Worker processes (0 = one per available core)
+TUNING_WORKERS = config('TUNING_WORKERS', default=0, cast=int)
+
+SEARCH_SPACES = {
+    'regression': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [6, 10, 14]
+    },
+    'classification': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [3, 5, 7],
+        'learning_rate': [0.05, 0.1, 0.2]
+    }
+}
+METRICS = {'regression': 'r2', 'classification': 'accuracy'}
+
+# Training data of the worker process, set once by the pool initializer
+_worker_data = {}
+
+
+def _init_worker(X, targets):
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(limits=1)
+    _worker_data['X'] = X
+    _worker_data['targets'] = targets
+
+
+def _evaluate(model, params, train_idx, val_idx, measure_latency):
+    """Runs in a worker: fit on train_idx, score on val_idx, optionally time"""
+
+    X = _worker_data['X']
+    y = _worker_data['targets'][model]
+
+    start = time.perf_counter()
+    if model == 'regression':
+        fitted = QualityPredictor.fit_regression(X[train_idx], y[train_idx], params, n_jobs=1)
+    else:
+        fitted = QualityPredictor.fit_classification(X[train_idx], y[train_idx], params)
+    fit_seconds = time.perf_counter() - start
+
+    result = {
+        'score': float(fitted.score(X[val_idx], y[val_idx])),
+        'fit_seconds': fit_seconds
+    }
+
+    if measure_latency:
+        # Timed as served: compiled to node arrays
+        if model == 'regression':
+            predict = CompiledRandomForestRegressor(fitted).predict
+        else:
+            predict = CompiledGradientBoostingClassifier(fitted).predict_proba
+        rows = X[val_idx[:1000]]
+        result['latency_ms'] = median_latency_ms(predict, rows[:1], 100)
+        result['batch_row_us'] = median_latency_ms(predict, rows, 5) * 1000 / len(rows)
+    return result
+
+
+def _folds(model, y, n_folds, seed=42):
+    """(shuffled train indices, validation indices) per fold"""
+    from sklearn.model_selection import KFold, StratifiedKFold
+
+    if model == 'classification':
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    else:
+        splitter = KFold(n_splits=n_folds, shuffle=True, random_state=seed)
+
+    rng = np.random.default_rng(seed)
+    # Shuffled once, so a rung's subsample is a prefix of the next rung's
+    return [(rng.permutation(train), val) for train, val in splitter.split(np.zeros(len(y)), y)]
+
+
+def _rank_key(record, max_latency_ms):
+    """Within the latency budget first, then by CV score"""
+    rung = record['rungs'][-1]
+    too_slow = max_latency_ms > 0 and rung['latency_ms'] > max_latency_ms
+    return (too_slow, -rung['score'])
+
+
+def successive_halving(executor, model, targets, space=None, n_folds=TUNING_FOLDS,
+                       factor=TUNING_HALVING_FACTOR, min_rows=TUNING_MIN_ROWS,
+                       max_latency_ms=TUNING_MAX_LATENCY_MS):
+    """
+    Search one model's hyperparameters
+    executor must be a pool started by _init_worker with these targets.
+    Returns the report: best_params, the best candidate and every
+    candidate's per-rung CV score, fit time and latency.
+    """
+
+    space = space or SEARCH_SPACES[model]
+    factor = max(2, factor)
+    started = time.perf_counter()
+
+    candidates = [
+        {'params': dict(zip(space, values)), 'rungs': [], 'eliminated_at': None}
+        for values in itertools.product(*space.values())
+    ]
+    folds = _folds(model, targets[model], n_folds)
+    max_rows = min(len(train) for train, _ in folds)
+    n_rungs = max(1, math.ceil(math.log(len(candidates), factor)))
+
+    alive = list(candidates)
+    evaluations = 0
+    for rung in range(n_rungs):
+        rows = min(max_rows, max(min_rows, max_rows // factor ** (n_rungs - 1 - rung)))
+        print(f"   {model}: rung {rung + 1}/{n_rungs}, "
+              f"{len(alive)} candidates x {len(folds)} folds on {rows} rows")
+
+        futures = {
+            (i, f): executor.submit(
+                _evaluate, model, candidate['params'], train[:rows], val, f == 0
+            )
+            for i, candidate in enumerate(alive)
+            for f, (train, val) in enumerate(folds)
+        }
+        for i, candidate in enumerate(alive):
+            results = [futures[(i, f)].result() for f in range(len(folds))]
+            scores = [r['score'] for r in results]
+            candidate['rungs'].append({
+                'rung': rung,
+                'rows': rows,
+                'score': float(np.mean(scores)),
+                'score_std': float(np.std(scores)),
+                'fit_seconds': float(np.mean([r['fit_seconds'] for r in results])),
+                'latency_ms': round(results[0]['latency_ms'], 4),
+                'batch_row_us': round(results[0]['batch_row_us'], 3)
+            })
+        evaluations += len(futures)
+
+        alive.sort(key=lambda c: _rank_key(c, max_latency_ms))
+        if rung < n_rungs - 1:
+            keep = max(1, math.ceil(len(alive) / factor))
+            for candidate in alive[keep:]:
+                candidate['eliminated_at'] = rung
+            alive = alive[:keep]
+
+    best = alive[0]
+    candidates.sort(key=lambda c: (-len(c['rungs']), _rank_key(c, max_latency_ms)))
+    return {
+        'model': model,
+        'metric': METRICS[model],
+        'folds': len(folds),
+        'halving_factor': factor,
+        'max_latency_ms': max_latency_ms,
+        'within_latency_budget': not _rank_key(best, max_latency_ms)[0],
+        'best_params': best['params'],
+        'best': best['rungs'][-1],
+        'evaluations': evaluations,
+        'wall_seconds': round(time.perf_counter() - started, 2),
+        'candidates': candidates
+    }
+
+
+def tune_quality_models(X, y_score, y_class, workers=TUNING_WORKERS, **options):
+    """
+    Successive-halving search for both quality models
+    X: scaled training features. Returns {'regression': report,
+    'classification': report}; options are passed to successive_halving.
+    """
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    targets = {
+        'regression': np.asarray(y_score, dtype=np.float64),
+        'classification': np.asarray(y_class).astype(str)
+    }
+    workers = workers or len(available_cpus())
+
+    print(f"\n🔎 Tuning quality models: {options.get('n_folds', TUNING_FOLDS)}-fold CV, "
+          f"successive halving on {workers} worker processes")
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(X, targets)
+    ) as executor:
+        reports = {
+            model: successive_halving(executor, model, targets, **options)
+            for model in ('regression', 'classification')
+        }
+
+    for report in reports.values():
+        print_tuning_report(report)
+    return reports
+
+
+def print_tuning_report(report, top=5):
+    print(f"\n📊 {report['model']} tuning ({report['metric']}, {report['folds']}-fold CV, "
+          f"{report['evaluations']} fits in {report['wall_seconds']:.1f}s):")
+    print(f"   {'params':<52}{'rows':>7}{'score':>9}{'± std':>8}{'fit s':>8}{'ms/pred':>9}")
+    for candidate in report['candidates'][:top]:
+        rung = candidate['rungs'][-1]
+        params = ', '.join(f"{k}={v}" for k, v in candidate['params'].items())
+        print(f"   {params:<52}{rung['rows']:>7}{rung['score']:>9.4f}{rung['score_std']:>8.4f}"
+              f"{rung['fit_seconds']:>8.2f}{rung['latency_ms']:>9.3f}")
+
+    print(f"   ✓ Best: {report['best_params']}")
+    if not report['within_latency_budget']:
+        print(f"   ⚠️  No candidate met the {report['max_latency_ms']} ms latency budget")
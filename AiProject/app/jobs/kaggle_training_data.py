@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from decouple import config
+from sqlalchemy import select, func, type_coerce, String
+from .. import models
+from ..ai_models.quality_predictor import QualityPredictor
+from ..ai_models.segment_models import segment_keys
+
+# Columnar Training Data for the Quality Predictor
+#
+# Selects only the columns training needs with a Core query, streams it in
+# chunks and turns each chunk straight into typed NumPy columns: defaults for
+# missing lab values, the inspection-date fallbacks and days_elapsed are all
+# computed vectorized. No ORM objects or per-row dicts are built, so memory
+# is the final float64 feature matrix plus one chunk of raw rows.
+
+EXTRACT_CHUNK_SIZE = config('KAGGLE_EXTRACT_CHUNK_SIZE', default=50000, cast=int)
+
+# Lab values used when a record has none (or 0)
+LAB_DEFAULTS = {
+    'ph_level': 7.0,
+    'moisture_content': 5.0,
+    'impurity_percentage': 0.5,
+    'active_ingredient_concentration': 95.0
+}
+QUALITY_SCORES = QualityPredictor.CLASS_SCORES
+# Assumed age at inspection when neither inspection nor import date is known
+DEFAULT_INSPECTION_AGE = pd.Timedelta(days=30)
+
+_DATE_COLUMNS = {'manufacturing_date', 'inspection_date', 'imported_at'}
+_COLUMNS = [
+    'id',
+    'medicine_name',
+    'storage_temperature',
+    'storage_humidity',
+    'ph_level',
+    'moisture_content',
+    'impurity_percentage',
+    'active_ingredient_concentration',
+    'manufacturing_date',
+    'inspection_date',
+    'imported_at',
+    'quality_status'
+]
+
+
+def _float_column(values):
+    # None becomes NaN
+    return np.array(values, dtype=np.float64)
+
+
+def _naive_datetimes(values):
+    """
+    Naive UTC datetimes from driver values (datetime objects or ISO strings,
+    with or without fractional seconds); imported_at is timezone-aware on
+    some databases
+    """
+    return pd.DatetimeIndex(
+        pd.to_datetime(list(values), utc=True, format='ISO8601')
+    ).tz_localize(None)
+
+
+def _chunk_features(rows):
+    """
+    Feature matrix, status labels and segments for one chunk of rows
+    Returns (ids, X, statuses, segments) for the rows that are usable for
+    training; segments are the active-ingredient keys of segment_models
+    """
+
+    columns = dict(zip(_COLUMNS, zip(*rows)))
+
+    manufacturing = _naive_datetimes(columns['manufacturing_date'])
+    inspection = _naive_datetimes(columns['inspection_date'])
+    imported = _naive_datetimes(columns['imported_at'])
+
+    # Inspection date, else import date, else manufacturing date + 30 days
+    inspection = inspection.where(~inspection.isna(), imported)
+    inspection = inspection.where(~inspection.isna(), manufacturing + DEFAULT_INSPECTION_AGE)
+    days_elapsed = (inspection - manufacturing).days.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    features = {
+        'storage_temperature': _float_column(columns['storage_temperature']),
+        'storage_humidity': _float_column(columns['storage_humidity']),
+        'days_elapsed': days_elapsed
+    }
+    for name, default in LAB_DEFAULTS.items():
+        values = _float_column(columns[name])
+        features[name] = np.where(np.isnan(values) | (values == 0), default, values)
+
+    X = np.column_stack([features[name] for name in QualityPredictor.FEATURES])
+    statuses = np.array(columns['quality_status'], dtype=object)
+    segments = segment_keys(columns['medicine_name'])
+
+    # No usable dates means no days_elapsed
+    usable = ~np.isnan(X).any(axis=1)
+    ids = np.array(columns['id'], dtype=np.int64)
+    return ids[usable], X[usable], statuses[usable], segments[usable]
+
+
+def extract_quality_rows(db, chunk_size=EXTRACT_CHUNK_SIZE, after_id=None, up_to_id=None):
+    """
+    Stream usable training rows as (ids, X, statuses, segments) chunks
+    after_id / up_to_id bound the record ids (exclusive / inclusive).
+    """
+
+    table = models.KaggleMedicineData
+
+    # Dates are fetched as the driver returns them and parsed per chunk by
+    # pandas, instead of one datetime conversion per value in SQLAlchemy
+    query = select(*[
+        type_coerce(getattr(table, name), String) if name in _DATE_COLUMNS
+        else getattr(table, name)
+        for name in _COLUMNS
+    ]).where(
+        table.storage_temperature.isnot(None),
+        table.storage_humidity.isnot(None),
+        table.quality_status.isnot(None)
+    ).order_by(table.id)
+
+    if after_id is not None:
+        query = query.where(table.id > after_id)
+    if up_to_id is not None:
+        query = query.where(table.id <= up_to_id)
+
+    # Core connection (no ORM row processing) with a server-side cursor:
+    # only one chunk of raw rows is in memory at a time
+    result = db.connection().execute(
+        query.execution_options(stream_results=True, yield_per=chunk_size)
+    )
+
+    for partition in result.partitions(chunk_size):
+        yield _chunk_features(partition)
+
+
+def training_arrays(X, statuses):
+    """(X, y_score, y_class) in the shape QualityPredictor.train_model takes"""
+    X = pd.DataFrame(X, columns=QualityPredictor.FEATURES, copy=False)
+    y_class = pd.Series(np.asarray(statuses).astype(str), name='quality_status')
+    y_score = y_class.map(QUALITY_SCORES)
+    return X, y_score, y_class
+
+
+def load_quality_training_data(db, chunk_size=EXTRACT_CHUNK_SIZE):
+    """
+    Quality training set straight from kaggle_medicine_data
+
+    Returns (X, y_score, y_class, segments, counts): X is a DataFrame with
+    the QualityPredictor.FEATURES columns; segments the active-ingredient
+    key of each row (None when unknown); counts has the total, usable and
+    skipped record counts.
+    """
+
+    total = db.execute(
+        select(func.count()).select_from(models.KaggleMedicineData)
+    ).scalar()
+
+    feature_chunks = []
+    status_chunks = []
+    segment_chunks = []
+    for _, X_chunk, statuses, segments in extract_quality_rows(db, chunk_size):
+        feature_chunks.append(X_chunk)
+        status_chunks.append(statuses)
+        segment_chunks.append(segments)
+
+    if feature_chunks:
+        X = np.concatenate(feature_chunks)
+        statuses = np.concatenate(status_chunks)
+        segments = np.concatenate(segment_chunks)
+    else:
+        X = np.empty((0, len(QualityPredictor.FEATURES)))
+        statuses = np.empty(0, dtype=object)
+        segments = np.empty(0, dtype=object)
+
+    X, y_score, y_class = training_arrays(X, statuses)
+    counts = {'total': total, 'valid': len(X), 'skipped': total - len(X)}
+    return X, y_score, y_class, segments, counts
@@ -0,0 +1,38 @@
+import threading
+
+# Periodic Background Jobs
+
+
+class PeriodicJob:
+    """
+    Runs a function on a fixed interval in a daemon thread
+    """
+
+    def __init__(self, name, interval_seconds, func):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                result = self.func()
+                if isinstance(result, dict) and 'status' in result:
+                    print(f"{self.name}: {result['status']}")
+            except Exception as e:
+                print(f"❌ {self.name} failed: {e}")
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+from decouple import config
+from sqlalchemy import select
+from .. import models
+from ..ai_models.anomaly_detector import AnomalyDetector
+from ..ai_models.ensemble_pruning import ENSEMBLE_PRUNING
+
+# Streaming, Reservoir-Sampled Training Data for the Anomaly Detector
+#
+# Pages through sensor_data with a server-side cursor and keeps a fixed-size
+# uniform sample per (product, location) stratum, so memory stays bounded by
+# strata x sample size no matter how large the table grows.
+
+SAMPLE_PER_STRATUM = config('ANOMALY_SAMPLE_PER_STRATUM', default=1000, cast=int)
+STREAM_BATCH_SIZE = config('SENSOR_STREAM_BATCH_SIZE', default=10000, cast=int)
+
+FEATURES = ['temperature', 'humidity', 'light_exposure', 'vibration']
+# Missing optional sensors get the values train_all_models has always filled
+# in for them, so products without those sensors stay in the sample (it
+# filled zero readings too; a 0 here is kept as a real reading)
+DEFAULTS = {'light_exposure': 50.0, 'vibration': 0.5}
+
+
+class StratifiedReservoir:
+    """
+    One Algorithm R reservoir per stratum key
+    Every row seen so far has the same chance of being in its stratum's sample
+    """
+
+    def __init__(self, size_per_stratum=SAMPLE_PER_STRATUM, n_features=len(FEATURES), seed=42):
+        self.size = size_per_stratum
+        self.n_features = n_features
+        self.rng = np.random.default_rng(seed)
+        self.samples = {}
+        self.seen = {}
+
+    def add_batch(self, keys, rows):
+        """Offer a batch of rows; keys is a list of stratum keys, one per row"""
+        rows = np.asarray(rows, dtype=np.float64)
+        codes, uniques = pd.factorize(pd.Series(keys, dtype=object))
+
+        for code_idx, key in enumerate(uniques):
+            self._add_to_stratum(key, rows[codes == code_idx])
+
+    def _add_to_stratum(self, key, rows):
+        reservoir = self.samples.get(key)
+        if reservoir is None:
+            reservoir = np.empty((0, self.n_features))
+        seen = self.seen.get(key, 0)
+
+        # Fill phase: take rows directly until the reservoir is full
+        free = max(self.size - len(reservoir), 0)
+        if free:
+            reservoir = np.vstack([reservoir, rows[:free]])
+            seen += min(free, len(rows))
+            rows = rows[free:]
+
+        # Replacement phase: row i (1-based over the stratum) enters with p = size / i
+        if len(rows):
+            positions = seen + 1 + np.arange(len(rows))
+            slots = (self.rng.random(len(rows)) * positions).astype(np.int64)
+            accepted = np.nonzero(slots < self.size)[0]
+            for i in accepted:
+                reservoir[slots[i]] = rows[i]
+            seen += len(rows)
+
+        self.samples[key] = reservoir
+        self.seen[key] = seen
+
+    @property
+    def total_seen(self):
+        return sum(self.seen.values())
+
+    def to_frame(self, columns=FEATURES):
+        if not self.samples:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(np.vstack(list(self.samples.values())), columns=columns)
+
+
+def _clean_batch(partition):
+    """Readings with temperature and humidity, optional sensors defaulted"""
+    batch = pd.DataFrame(
+        partition,
+        columns=['id', 'product_id', 'location'] + FEATURES
+    )
+    batch = batch.dropna(subset=['temperature', 'humidity'])
+    for column, default in DEFAULTS.items():
+        batch[column] = batch[column].fillna(default)
+    batch[FEATURES] = batch[FEATURES].astype(np.float64)
+    return batch
+
+
+def extract_sensor_readings(db, batch_size=STREAM_BATCH_SIZE, since=None,
+                            after_id=None, up_to_id=None):
+    """
+    Stream cleaned sensor readings as DataFrame batches
+    Columns: id, product_id, location and FEATURES. after_id / up_to_id
+    bound the sensor_data ids (exclusive / inclusive).
+    """
+
+    query = select(
+        models.SensorData.id,
+        models.SensorData.product_id,
+        models.Product.location,
+        models.SensorData.temperature,
+        models.SensorData.humidity,
+        models.SensorData.light_exposure,
+        models.SensorData.vibration
+    ).outerjoin(
+        models.Product, models.Product.id == models.SensorData.product_id
+    ).order_by(models.SensorData.id)
+
+    if since is not None:
+        query = query.where(models.SensorData.timestamp >= since)
+    if after_id is not None:
+        query = query.where(models.SensorData.id > after_id)
+    if up_to_id is not None:
+        query = query.where(models.SensorData.id <= up_to_id)
+
+    # stream_results uses a server-side cursor so rows are fetched in pages
+    result = db.execute(
+        query.execution_options(stream_results=True, yield_per=batch_size)
+    )
+
+    for partition in result.partitions(batch_size):
+        yield _clean_batch(partition)
+
+
+def reservoir_sample(batches, size_per_stratum=SAMPLE_PER_STRATUM):
+    """Stratified reservoir sample of cleaned reading batches"""
+
+    reservoir = StratifiedReservoir(size_per_stratum)
+    for batch in batches:
+        keys = list(zip(batch['product_id'].fillna(-1), batch['location'].fillna('')))
+        reservoir.add_batch(keys, batch[FEATURES].to_numpy(dtype=np.float64))
+    return reservoir
+
+
+def stream_sensor_sample(db, size_per_stratum=SAMPLE_PER_STRATUM,
+                         batch_size=STREAM_BATCH_SIZE, since=None):
+    """
+    Single pass over sensor_data returning a stratified reservoir sample
+    """
+
+    return reservoir_sample(
+        extract_sensor_readings(db, batch_size, since=since),
+        size_per_stratum
+    )
+
+
+def sample_sensor_readings(db, size_per_stratum=SAMPLE_PER_STRATUM,
+                           batch_size=STREAM_BATCH_SIZE, readings=None):
+    """
+    Reservoir sample of all sensor readings as a DataFrame
+    readings: cleaned reading batches to sample from (e.g. a training
+    snapshot) instead of streaming sensor_data
+    """
+
+    if readings is None:
+        readings = extract_sensor_readings(db, batch_size)
+    reservoir = reservoir_sample(readings, size_per_stratum)
+    sample = reservoir.to_frame()
+
+    print(f"\n📊 Sampled {len(sample)} of {reservoir.total_seen} readings "
+          f"across {len(reservoir.samples)} product/location strata")
+    return sample
+
+
+def train_detector(sample, n_jobs=None):
+    """
+    Train an AnomalyDetector on a sample
+    Returns (detector, anomaly_count, normal_count); importable, so it can
+    run in a training worker process
+    """
+
+    detector = AnomalyDetector()
+    if len(sample) == 0:
+        return detector, 0, 0
+
+    anomaly_count, normal_count = detector.train_model(
+        sample, n_jobs=n_jobs, prune=ENSEMBLE_PRUNING
+    )
+    return detector, anomaly_count, normal_count
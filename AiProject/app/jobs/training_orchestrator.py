@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+
+# Parallel Training Orchestrator
+#
+# Independent model fits run at the same time, each in its own spawned
+# process with a CPU budget: the process is pinned to that many cores (where
+# the OS supports it), its BLAS/OpenMP pools are capped to match, and jobs
+# that can use threads get the budget as n_jobs. Single-threaded fits (e.g.
+# gradient boosting) get one core, and whatever is left is shared between
+# the parallel ones.
+#
+# Every job reports wall time, CPU time and the peak resident memory of its
+# process, so the nightly retrain shows where its time goes.
+
+# Cores the orchestrator may use (0 = every core this process may run on)
+TRAINING_CPUS = config('TRAINING_CPUS', default=0, cast=int)
+# Jobs running at once (0 = all of them)
+TRAINING_MAX_CONCURRENT = config('TRAINING_MAX_CONCURRENT', default=0, cast=int)
+
+
+class TrainingJob:
+    """
+    One model fit to run in a worker process
+    fn must be importable (module-level or a class's staticmethod). If
+    ``parallel``, it is called as fn(*args, n_jobs=<cpu budget>). ``cpus``
+    fixes the budget; None shares the cores left over by fixed budgets.
+    """
+
+    def __init__(self, name, fn, args=(), parallel=True, cpus=None):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.parallel = parallel
+        self.cpus = cpus if cpus is not None else (None if parallel else 1)
+
+
+def available_cpus():
+    """Ids of the cores this process may run on"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def allocate_cpus(jobs, cpu_ids):
+    """
+    {job name: [core ids]}: fixed budgets first, then the rest split evenly
+    When there are fewer cores than jobs, budgets wrap around and overlap.
+    """
+
+    total = len(cpu_ids)
+    fixed = sum(min(job.cpus, total) for job in jobs if job.cpus is not None)
+    flexible = [job for job in jobs if job.cpus is None]
+
+    budgets = {}
+    spare = max(total - fixed, 0)
+    for i, job in enumerate(flexible):
+        # Spread any remainder over the first jobs
+        share = spare // len(flexible) + (1 if i < spare % len(flexible) else 0)
+        budgets[job.name] = max(1, share)
+    for job in jobs:
+        if job.cpus is not None:
+            budgets[job.name] = max(1, min(job.cpus, total))
+
+    allocation = {}
+    position = 0
+    for job in jobs:
+        allocation[job.name] = [
+            cpu_ids[(position + k) % total] for k in range(budgets[job.name])
+        ]
+        position += budgets[job.name]
+    return allocation
+
+
+def _peak_memory_mb():
+    """Peak resident memory of this process, or None where unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if os.uname().sysname == 'Darwin' else 1024), 1)
+
+
+def _run_job(fn, args, kwargs, cpu_ids):
+    """Runs in the worker process: apply the CPU budget, fit, measure"""
+    from threadpoolctl import threadpool_limits
+
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpu_ids)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with threadpool_limits(limits=len(cpu_ids)):
+        result = fn(*args, **kwargs)
+
+    return result, {
+        'wall_seconds': round(time.perf_counter() - wall_start, 2),
+        'cpu_seconds': round(time.process_time() - cpu_start, 2),
+        'peak_memory_mb': _peak_memory_mb()
+    }
+
+
+def run_training_jobs(jobs, cpus=TRAINING_CPUS, max_concurrent=TRAINING_MAX_CONCURRENT):
+    """
+    Run jobs concurrently, one fresh process each
+    Returns ({name: result}, summary). A failed job's result is None and its
+    summary row has status 'failed' and the error; the others still finish.
+    """
+
+    cpu_ids = available_cpus()
+    if cpus > 0:
+        cpu_ids = cpu_ids[:cpus]
+    allocation = allocate_cpus(jobs, cpu_ids)
+
+    print(f"\n🚀 Training {len(jobs)} models in parallel on {len(cpu_ids)} cores")
+    for job in jobs:
+        print(f"   {job.name}: {len(allocation[job.name])} cores")
+
+    results = {}
+    summary = []
+    started = time.perf_counter()
+
+    # One process per job, so each job's peak memory is its own
+    with ProcessPoolExecutor(
+        max_workers=max_concurrent or len(jobs),
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1
+    ) as executor:
+        futures = {}
+        for job in jobs:
+            kwargs = {'n_jobs': len(allocation[job.name])} if job.parallel else {}
+            futures[job.name] = executor.submit(
+                _run_job, job.fn, job.args, kwargs, allocation[job.name]
+            )
+
+        for job in jobs:
+            row = {'job': job.name, 'cpus': len(allocation[job.name])}
+            try:
+                results[job.name], stats = futures[job.name].result()
+                row.update(status='completed', **stats)
+            except Exception as e:
+                results[job.name] = None
+                row.update(status='failed', error=str(e))
+                print(f"❌ Training job {job.name} failed: {e}")
+            summary.append(row)
+
+    summary.append({
+        'job': 'total',
+        'cpus': len(cpu_ids),
+        'status': 'completed' if all(r['status'] == 'completed' for r in summary) else 'failed',
+        'wall_seconds': round(time.perf_counter() - started, 2),
+        'cpu_seconds': round(sum(r.get('cpu_seconds', 0) for r in summary), 2),
+        # Sum of the jobs' wall times: roughly what running them one by one
+        # takes, as long as no two jobs shared a core
+        'sequential_seconds': round(sum(r.get('wall_seconds', 0) for r in summary), 2),
+        'shared_cores': sum(len(cores) for cores in allocation.values()) > len(cpu_ids)
+    })
+    return results, summary
+
+
+def print_training_summary(summary):
+    print("\n📊 Training summary:")
+    print(f"   {'job':<26}{'cores':>6}{'wall s':>9}{'cpu s':>9}{'cpu/wall':>10}{'peak MB':>10}")
+    for row in summary:
+        if row['status'] == 'failed' and 'wall_seconds' not in row:
+            print(f"   {row['job']:<26}{row['cpus']:>6}   failed: {row.get('error', '')}")
+            continue
+        wall = row['wall_seconds']
+        utilization = f"{row['cpu_seconds'] / wall:.2f}" if wall > 0 else "-"
+        peak = row.get('peak_memory_mb')
+        print(f"   {row['job']:<26}{row['cpus']:>6}{wall:>9.2f}{row['cpu_seconds']:>9.2f}"
+              f"{utilization:>10}{peak if peak is not None else '-':>10}")
+
+    total = summary[-1]
+    if total['shared_cores']:
+        print("\n   ⚠️  Fewer cores than jobs: jobs shared cores, so wall times overlap")
+    elif total['sequential_seconds'] and total['wall_seconds'] > 0:
+        print(f"\n   ⏱️  {total['wall_seconds']:.2f}s wall vs {total['sequential_seconds']:.2f}s "
+              f"if run one after another ({total['sequential_seconds'] / total['wall_seconds']:.1f}x)")
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+import pandas as pd
+from decouple import config
+from sqlalchemy import select, func
+from .. import models
+from ..ai_models.quality_predictor import QualityPredictor
+from .kaggle_training_data import extract_quality_rows
+from .streaming_training import extract_sensor_readings, FEATURES as SENSOR_FEATURES
+
+# Training Data Snapshots
+#
+# Cleaned training rows are cached locally as Parquet, one directory per
+# dataset:
+#
+#   <dataset>/segments/<hash>.parquet    immutable, named after its content
+#   <dataset>/<snapshot_id>.json         ordered segment list + high-water mark
+#   <dataset>/latest.json                pointer to the newest snapshot
+#
+# A snapshot's high-water mark is the largest record id it covers (plus the
+# newest imported_at / timestamp, for reference). Updating extracts and
+# cleans only the rows above it into a new segment, so a repeat retrain reads
+# the delta from the database instead of the whole table. The snapshot id is
+# the hash of the segment list and the mark: training from a given id sees
+# exactly the same rows, in the same order.
+#
+# Snapshots only ever append. Rows updated or deleted in the database after
+# they were captured are not picked up; rebuild with refresh=True for that.
+# A snapshot taken with other columns than the dataset has now is rebuilt.
+
+SNAPSHOT_PATH = config('SNAPSHOT_PATH', default='data/snapshots/')
+# Train from snapshots instead of full table reads
+TRAINING_SNAPSHOTS = config('TRAINING_SNAPSHOTS', default=True, cast=bool)
+# Rows per record batch when reading a snapshot back in pieces
+SNAPSHOT_READ_BATCH_SIZE = config('SNAPSHOT_READ_BATCH_SIZE', default=50000, cast=int)
+
+LATEST_POINTER = "latest.json"
+
+
+def _quality_frames(db, after_id, up_to_id):
+    for ids, X, statuses, segments in extract_quality_rows(db, after_id=after_id, up_to_id=up_to_id):
+        frame = pd.DataFrame(X, columns=QualityPredictor.FEATURES)
+        frame.insert(0, 'id', ids)
+        frame['quality_status'] = statuses.astype(str)
+        frame['segment'] = segments
+        yield frame
+
+
+def _sensor_frames(db, after_id, up_to_id):
+    for batch in extract_sensor_readings(db, after_id=after_id, up_to_id=up_to_id):
+        # Nullable keys as plain, Parquet-friendly columns
+        batch['product_id'] = batch['product_id'].astype('float64')
+        batch['location'] = batch['location'].astype(object)
+        yield batch.reset_index(drop=True)
+
+
+DATASETS = {
+    'kaggle_quality': {
+        'table': models.KaggleMedicineData,
+        'extract': _quality_frames,
+        'columns': ['id'] + QualityPredictor.FEATURES + ['quality_status', 'segment']
+    },
+    'sensor_readings': {
+        'table': models.SensorData,
+        'extract': _sensor_frames,
+        'columns': ['id', 'product_id', 'location'] + SENSOR_FEATURES
+    }
+}
+
+
+def _dataset(dataset):
+    if dataset not in DATASETS:
+        raise KeyError(f"Unknown training dataset '{dataset}'")
+    return DATASETS[dataset]
+
+
+def _dataset_path(dataset):
+    return os.path.join(SNAPSHOT_PATH, dataset)
+
+
+def _segment_path(dataset, segment):
+    return os.path.join(_dataset_path(dataset), 'segments', f"{segment}.parquet")
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _frame_digest(frame):
+    # Hash of the values, not the file bytes: independent of Parquet writer
+    # version and compression
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()
+
+
+def _write_segment(dataset, frames):
+    """
+    Stream frames into one Parquet segment named after its content
+    Returns (segment hash, rows), or (None, 0) when there were no rows
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _dataset(dataset)['columns']
+    segments_path = os.path.join(_dataset_path(dataset), 'segments')
+    os.makedirs(segments_path, exist_ok=True)
+
+    digest = hashlib.sha256(json.dumps(columns).encode())
+    tmp_path = os.path.join(segments_path, f".writing-{os.getpid()}.parquet")
+    writer = None
+    rows = 0
+    try:
+        for frame in frames:
+            if frame.empty:
+                continue
+            frame = frame[columns]
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+            digest.update(_frame_digest(frame))
+            rows += len(frame)
+
+        if writer is None:
+            return None, 0
+        writer.close()
+        writer = None
+
+        segment = digest.hexdigest()
+        os.replace(tmp_path, _segment_path(dataset, segment))
+        return segment, rows
+
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_manifest(dataset, snapshot_id):
+    path = os.path.join(_dataset_path(dataset), f"{snapshot_id}.json")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No {dataset} snapshot '{snapshot_id}'")
+    with open(path) as f:
+        return json.load(f)
+
+
+def latest_snapshot(dataset):
+    """Manifest of the newest snapshot, or None"""
+    path = os.path.join(_dataset_path(dataset), LATEST_POINTER)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return read_manifest(dataset, json.load(f)['snapshot_id'])
+
+
+def update_snapshot(db, dataset, refresh=False):
+    """
+    Bring a dataset's snapshot up to date with the database
+    Only records above the previous high-water mark are extracted; refresh
+    re-extracts everything. Returns the manifest of the resulting snapshot
+    (with 'appended_rows' for this update).
+    """
+
+    import pyarrow.parquet as pq
+
+    table = _dataset(dataset)['table']
+    previous = None if refresh else latest_snapshot(dataset)
+    if previous is not None:
+        for segment in previous['segments']:
+            if not os.path.isfile(_segment_path(dataset, segment['hash'])):
+                print(f"⚠️  {dataset} snapshot segment {segment['hash'][:12]} missing, rebuilding")
+                previous = None
+                break
+    if previous is not None and previous['segments']:
+        stored = pq.read_schema(_segment_path(dataset, previous['segments'][0]['hash'])).names
+        if stored != _dataset(dataset)['columns']:
+            print(f"⚠️  {dataset} snapshot {previous['snapshot_id']} has other columns, rebuilding")
+            previous = None
+
+    after_id = previous['high_water_mark']['id'] if previous else None
+
+    # Fix the mark before reading, so rows inserted meanwhile wait for the next update
+    high_water_id = db.execute(select(func.max(table.id))).scalar()
+    if previous is not None and (high_water_id is None or high_water_id <= after_id):
+        print(f"✓ {dataset} snapshot {previous['snapshot_id']} is up to date ({previous['rows']} rows)")
+        return dict(previous, appended_rows=0)
+
+    # Records in the delta (usable or not) and their newest insert time
+    inserted_at = table.imported_at if hasattr(table, 'imported_at') else table.timestamp
+    delta = select(func.count(), func.max(inserted_at)).select_from(table)
+    if high_water_id is not None:
+        delta = delta.where(table.id <= high_water_id)
+    if after_id is not None:
+        delta = delta.where(table.id > after_id)
+    records, latest_insert = db.execute(delta).one()
+
+    segment, rows = _write_segment(
+        dataset, _dataset(dataset)['extract'](db, after_id, high_water_id)
+    )
+
+    segments = list(previous['segments']) if previous else []
+    if segment is not None:
+        segments.append({'hash': segment, 'rows': rows})
+
+    high_water_mark = {
+        'id': high_water_id if high_water_id is not None else 0,
+        'inserted_at': str(latest_insert) if latest_insert is not None else (
+            previous['high_water_mark']['inserted_at'] if previous else None
+        )
+    }
+    snapshot_id = hashlib.sha256(json.dumps({
+        'dataset': dataset,
+        'segments': [s['hash'] for s in segments],
+        'high_water_mark': high_water_mark['id']
+    }, sort_keys=True).encode()).hexdigest()[:16]
+
+    manifest = {
+        'dataset': dataset,
+        'snapshot_id': snapshot_id,
+        'parent': previous['snapshot_id'] if previous else None,
+        'high_water_mark': high_water_mark,
+        'segments': segments,
+        'rows': sum(s['rows'] for s in segments),
+        # Database records covered, including ones cleaning dropped
+        'records': (previous['records'] if previous else 0) + records,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+    manifest_path = os.path.join(_dataset_path(dataset), f"{snapshot_id}.json")
+    if os.path.isfile(manifest_path):
+        manifest = read_manifest(dataset, snapshot_id)
+    else:
+        _write_json_atomic(manifest_path, manifest)
+    _write_json_atomic(
+        os.path.join(_dataset_path(dataset), LATEST_POINTER), {'snapshot_id': snapshot_id}
+    )
+
+    print(f"✓ {dataset} snapshot {snapshot_id}: +{rows} rows "
+          f"({manifest['rows']} total, high-water id {high_water_mark['id']})")
+    return dict(manifest, appended_rows=rows)
+
+
+def iter_snapshot(dataset, snapshot_id=None, batch_size=SNAPSHOT_READ_BATCH_SIZE):
+    """DataFrame batches of a snapshot (default: the latest), in row order"""
+
+    import pyarrow.parquet as pq
+
+    manifest = read_manifest(dataset, snapshot_id) if snapshot_id else latest_snapshot(dataset)
+    if manifest is None:
+        raise FileNotFoundError(f"No {dataset} snapshot yet")
+
+    for segment in manifest['segments']:
+        parquet = pq.ParquetFile(_segment_path(dataset, segment['hash']))
+        for batch in parquet.iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+
+
+def load_snapshot(dataset, snapshot_id=None):
+    """(frame, manifest) of a snapshot (default: the latest)"""
+
+    import pyarrow.parquet as pq
+
+    manifest = read_manifest(dataset, snapshot_id) if snapshot_id else latest_snapshot(dataset)
+    if manifest is None:
+        raise FileNotFoundError(f"No {dataset} snapshot yet")
+
+    frames = [
+        pq.read_table(_segment_path(dataset, segment['hash'])).to_pandas()
+        for segment in manifest['segments']
+    ]
+    if not frames:
+        return pd.DataFrame(columns=_dataset(dataset)['columns']), manifest
+    return pd.concat(frames, ignore_index=True), manifest
+
+
+def training_snapshot(db, dataset, snapshot_id=None, refresh=False):
+    """
+    Manifest to train from: the pinned snapshot_id as stored, otherwise the
+    latest snapshot brought up to date
+    """
+    if snapshot_id:
+        manifest = read_manifest(dataset, snapshot_id)
+        print(f"✓ Using {dataset} snapshot {snapshot_id} ({manifest['rows']} rows)")
+        return manifest
+    return update_snapshot(db, dataset, refresh=refresh)
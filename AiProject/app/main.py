@@ -1,4 +1,8 @@
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from decouple import config
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine, Base, SessionLocal
 from .routers import (
@@ -18,15 +22,46 @@ from .routers import (
     chat  # <--- NEW: Import the chat router
 )
 from .auth import get_password_hash
+from .jobs import anomaly_retraining, fleet_scoring
+from . import model_registry
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# --- Startup / Shutdown ---
+
+# Schedulers for retraining and fleet scoring; the multi-process runner
+# turns this off in every worker but one
+BACKGROUND_JOBS_ENABLED = config('BACKGROUND_JOBS_ENABLED', default=True, cast=bool)
+# Table creation and model warm-up; the multi-process runner does both once
+# in the master and turns this off in its workers
+STARTUP_TASKS_ENABLED = True
+
+@asynccontextmanager
+async def lifespan(app):
+    if STARTUP_TASKS_ENABLED:
+        # Create database tables
+        Base.metadata.create_all(bind=engine)
+        
+        # Models load on first use; warming them in the background keeps
+        # startup fast while /ready reports when they're in memory
+        if model_registry.MODEL_WARMUP:
+            threading.Thread(target=model_registry.warm_up, name="model-warmup", daemon=True).start()
+    
+    # Background jobs
+    if BACKGROUND_JOBS_ENABLED and anomaly_retraining.RETRAIN_ENABLED:
+        anomaly_retraining.scheduler.start()
+    if BACKGROUND_JOBS_ENABLED and fleet_scoring.FLEET_SCORING_ENABLED:
+        fleet_scoring.scheduler.start()
+    
+    yield
+    
+    anomaly_retraining.scheduler.stop()
+    fleet_scoring.scheduler.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Medicine Monitoring API",
     description="Backend API for AI-powered medicine and consumables monitoring system with Mistral AI integration",
-    version="2.1.0"
+    version="2.1.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -84,4 +119,28 @@ def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "ai_services": "active"
-    }
\ No newline at end of file
+    }
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness probe: reports which AI models are loaded
+    With warm-up enabled the pod is ready only once every model is warm;
+    otherwise models load on first use and the pod is always ready
+    """
+    warm = {family: model_registry.is_warm(family) for family in model_registry.FAMILIES}
+    ready = all(warm.values()) or not model_registry.MODEL_WARMUP
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "warming_up",
+            "models": {
+                family: {
+                    "warm": is_warm,
+                    "version": model_registry.active_version(family)
+                }
+                for family, is_warm in warm.items()
+            }
+        }
+    )
@@ -0,0 +1,416 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from decouple import config
+from . import models
+from .ai_models.quality_predictor import QualityPredictor
+from .ai_models.anomaly_detector import AnomalyDetector
+from .ai_models.micro_batcher import MicroBatcher
+
+# Versioned Model Registry
+#
+# Every trained model is stored once, in an immutable directory named after
+# the hash of its artifacts:
+#
+#   registry/<family>/<version>/            model pickles (and segment model
+#                                           subdirectories) + manifest.json
+#   registry/<family>/active.json           pointer to the serving version
+#
+# Activating a version loads it fully, then rebinds the predictor used by the
+# API in one assignment, so requests never see a half-loaded model. Old
+# versions stay on disk, and the one replaced last stays loaded, which makes
+# rollback a pointer flip and a swap.
+#
+# Serving predictors are loaded lazily, on first use (or by the optional
+# background warm-up), so the API starts without touching model files.
+#
+# Single-sample API requests go through infer(), which micro-batches
+# concurrent requests per family (and quality segment) into one vectorized
+# call.
+
+REGISTRY_PATH = config('MODEL_REGISTRY_PATH', default='app/ai_models/saved_models/registry/')
+# Load every model in a background thread at startup instead of on first use
+MODEL_WARMUP = config('MODEL_WARMUP', default=True, cast=bool)
+# Micro-batching of concurrent single-sample requests
+INFERENCE_BATCHING = config('INFERENCE_BATCHING', default=True, cast=bool)
+INFERENCE_MAX_BATCH_SIZE = config('INFERENCE_MAX_BATCH_SIZE', default=64, cast=int)
+INFERENCE_MAX_WAIT_MS = config('INFERENCE_MAX_WAIT_MS', default=2.0, cast=float)
+
+FAMILIES = {
+    'quality': {
+        'class': QualityPredictor,
+        'model_name': 'Quality Degradation Predictor',
+        'model_type': 'ml_prediction',
+        'batch_method': 'predict_many'
+    },
+    'anomaly': {
+        'class': AnomalyDetector,
+        'model_name': 'Sensor Anomaly Detector',
+        'model_type': 'anomaly_detection',
+        'batch_method': 'detect_many'
+    }
+}
+
+MANIFEST = "manifest.json"
+ACTIVE_POINTER = "active.json"
+
+_activation_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+# Serving predictor per family, filled on first use
+_predictors = {}
+# Micro-batcher per (family, mode, segment), created on first infer()
+_batchers = {}
+# (version, predictor) that served before the last activation, kept loaded
+# so rolling back to it is a swap, not a reload
+_previous = {}
+
+
+def _family(family):
+    if family not in FAMILIES:
+        raise KeyError(f"Unknown model family '{family}'")
+    return FAMILIES[family]
+
+
+def _family_path(family):
+    return os.path.join(REGISTRY_PATH, family)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _artifact_files(path):
+    """{relative path: sha256} of every file under a model directory"""
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            full_path = os.path.join(root, name)
+            files[os.path.relpath(full_path, path).replace(os.sep, '/')] = _file_sha256(full_path)
+    return dict(sorted(files.items()))
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def register(family, predictor, metrics=None):
+    """
+    Store a trained predictor as a new immutable version
+    Returns the manifest; identical artifacts map to the existing version
+    """
+
+    _family(family)
+    os.makedirs(_family_path(family), exist_ok=True)
+
+    # Save into a scratch directory next to the registry, then rename it into
+    # place so a version directory is never visible half-written
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=_family_path(family))
+    try:
+        predictor.save_model(staging + os.sep)
+
+        files = _artifact_files(staging)
+        content_hash = hashlib.sha256(
+            json.dumps(files, sort_keys=True).encode()
+        ).hexdigest()
+        version = content_hash[:12]
+
+        manifest = {
+            'family': family,
+            'version': version,
+            'content_hash': content_hash,
+            'files': files,
+            'metrics': metrics or {},
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+        version_path = os.path.join(_family_path(family), version)
+        if os.path.isdir(version_path):
+            return read_manifest(family, version)
+
+        _write_json_atomic(os.path.join(staging, MANIFEST), manifest)
+        os.rename(staging, version_path)
+        staging = None
+        return manifest
+
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def read_manifest(family, version):
+    path = os.path.join(_family_path(family), version, MANIFEST)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No {family} model version '{version}'")
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_versions(family):
+    """Manifests of every stored version, newest first"""
+
+    _family(family)
+    if not os.path.isdir(_family_path(family)):
+        return []
+
+    active = active_version(family)
+    manifests = []
+    for version in os.listdir(_family_path(family)):
+        if os.path.isfile(os.path.join(_family_path(family), version, MANIFEST)):
+            manifest = read_manifest(family, version)
+            manifest['active'] = version == active
+            manifests.append(manifest)
+    return sorted(manifests, key=lambda m: m['created_at'], reverse=True)
+
+
+def read_pointer(family):
+    path = os.path.join(_family_path(family), ACTIVE_POINTER)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def active_version(family):
+    return read_pointer(family).get('version')
+
+
+def active_versions():
+    """{family: active version} for every family"""
+    return {family: active_version(family) for family in FAMILIES}
+
+
+def load_version(family, version):
+    """
+    Load a stored version into a new predictor instance
+    Artifacts are checked against the manifest hashes first
+    """
+
+    manifest = read_manifest(family, version)
+    version_path = os.path.join(_family_path(family), version)
+
+    for name, expected in manifest['files'].items():
+        if _file_sha256(os.path.join(version_path, name)) != expected:
+            raise ValueError(f"Artifact {name} of {family} version {version} is corrupted")
+
+    predictor = _family(family)['class'](model_path=version_path + os.sep)
+    if not predictor.load_model():
+        raise ValueError(f"Could not load {family} version {version}")
+    predictor.registry_version = version
+    return predictor
+
+
+def load_active(family):
+    """
+    Predictor for the active version
+    Falls back to the legacy fixed paths when nothing has been activated yet
+    """
+
+    version = active_version(family)
+    if version:
+        try:
+            return load_version(family, version)
+        except Exception as e:
+            print(f"⚠️  Active {family} version {version} unavailable: {e}")
+
+    predictor = _family(family)['class']()
+    predictor.load_model()
+    return predictor
+
+
+def get_predictor(family):
+    """Predictor serving a family, loaded on first use"""
+
+    predictor = _predictors.get(family)
+    if predictor is None:
+        with _load_lock:
+            predictor = _predictors.get(family)
+            if predictor is None:
+                predictor = load_active(family)
+                _predictors[family] = predictor
+    return predictor
+
+
+def is_warm(family):
+    return family in _predictors
+
+
+def warm_up():
+    """Load every family now rather than on the first request"""
+    for family in FAMILIES:
+        get_predictor(family)
+    print("✓ AI models warmed up")
+
+
+def reload_active():
+    """Load the active version of every family and swap it in"""
+    for family in FAMILIES:
+        swap_predictor(family, load_active(family))
+
+
+def _score_batch(family, mode='full', segment=None):
+    def score(inputs):
+        # Resolved per batch, so a swapped-in version is picked up at once
+        predictor = get_predictor(family)
+        if segment is not None:
+            # Falls back to the global model if the version has no such segment
+            predictor = predictor.for_segment(segment)
+        method = getattr(predictor, _family(family)['batch_method'])
+        return method(inputs) if mode == 'full' else method(inputs, mode=mode)
+    return score
+
+
+def batcher(family, mode='full', segment=None):
+    """The micro-batcher for a family, prediction mode and segment, created on first use"""
+
+    _family(family)
+    key = (family, mode, segment)
+    if key not in _batchers:
+        with _load_lock:
+            if key not in _batchers:
+                name = family if mode == 'full' else f"{family}-{mode}"
+                _batchers[key] = MicroBatcher(
+                    _score_batch(family, mode, segment),
+                    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                    max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                    name=name if segment is None else f"{name}-{segment}"
+                )
+    return _batchers[key]
+
+
+def infer(family, inputs, mode='full', segment=None):
+    """
+    Score one sample with the serving model
+    inputs: the positional arguments of predict() (quality) or detect()
+    (anomaly). Concurrent calls are scored together in one batch.
+    mode: 'full' or, for quality, 'fast' (distilled surrogate).
+    segment: quality segment with its own model (see
+    QualityPredictor.model_segment), None for the global model.
+    """
+
+    if not INFERENCE_BATCHING:
+        return _score_batch(family, mode, segment)([inputs])[0]
+    return batcher(family, mode, segment).submit(inputs)
+
+
+def batching_stats(family):
+    """{mode[:segment]: micro-batcher stats}, or None before the first batched request"""
+    stats = {
+        mode if segment is None else f"{mode}:{segment}": batcher.stats()
+        for (batcher_family, mode, segment), batcher in list(_batchers.items())
+        if batcher_family == family
+    }
+    return stats or None
+
+
+def swap_predictor(family, predictor):
+    """
+    Replace the predictor used by the API
+    Replacing the dict entry is atomic: requests already running keep
+    their reference to the old instance, new requests get the new one.
+    """
+    _family(family)
+    _predictors[family] = predictor
+
+
+def _record_version(db, family, manifest, training_data_count=None):
+    """The AIModel row for a version, created on first registration"""
+
+    info = _family(family)
+    row = db.query(models.AIModel).filter(
+        models.AIModel.model_type == info['model_type'],
+        models.AIModel.version == manifest['version']
+    ).first()
+
+    if row is None:
+        accuracy = manifest['metrics'].get('accuracy')
+        row = models.AIModel(
+            model_name=info['model_name'],
+            model_type=info['model_type'],
+            version=manifest['version'],
+            accuracy=accuracy,
+            status="inactive",
+            training_data_count=training_data_count or 0,
+            last_trained=datetime.fromisoformat(manifest['created_at'])
+        )
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+    return row
+
+
+def activate(db, family, version, predictor=None, swap=True):
+    """
+    Make a stored version the serving one
+    Loads it (unless an already-loaded predictor is given), swaps it into the
+    API, moves the on-disk pointer and flags the AIModel rows.
+    """
+
+    manifest = read_manifest(family, version)
+
+    with _activation_lock:
+        if predictor is None:
+            predictor = load_version(family, version)
+        predictor.registry_version = version
+
+        previous = active_version(family)
+        if swap:
+            # Keep the version being replaced loaded, for rollback()
+            serving = _predictors.get(family)
+            if previous != version and serving is not None and \
+                    getattr(serving, 'registry_version', None) == previous:
+                _previous[family] = (previous, serving)
+            swap_predictor(family, predictor)
+
+        _write_json_atomic(os.path.join(_family_path(family), ACTIVE_POINTER), {
+            'version': version,
+            'previous': previous if previous != version else read_pointer(family).get('previous'),
+            'activated_at': datetime.utcnow().isoformat()
+        })
+
+        row = _record_version(db, family, manifest)
+        db.query(models.AIModel).filter(
+            models.AIModel.model_type == row.model_type,
+            models.AIModel.id != row.id
+        ).update({models.AIModel.status: "inactive"}, synchronize_session=False)
+        row.status = "active"
+        db.commit()
+
+    print(f"✓ Activated {family} model version {version}")
+    return manifest
+
+
+def rollback(db, family):
+    """
+    Reactivate the version that was serving before the current one
+    Swaps the still-loaded predictor back in when this process served that
+    version; otherwise it is loaded (and verified) from the registry.
+    """
+
+    previous = read_pointer(family).get('previous')
+    if not previous:
+        raise FileNotFoundError(f"No previous {family} version to roll back to")
+
+    kept_version, kept = _previous.get(family, (None, None))
+    return activate(db, family, previous, predictor=kept if kept_version == previous else None)
+
+
+def publish(db, family, predictor, metrics=None, training_data_count=None, swap=True):
+    """
+    Register a freshly trained predictor, record it and make it active
+    """
+
+    manifest = register(family, predictor, metrics)
+    _record_version(db, family, manifest, training_data_count)
+    return activate(db, family, manifest['version'], predictor=predictor, swap=swap)
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from .. import crud, schemas, models
+from .. import crud, schemas, models, model_registry
 from ..database import get_db
 from ..auth import get_admin_user
+from ..jobs.anomaly_retraining import retrain_anomaly_detector, RETRAIN_WINDOW_DAYS
+from ..jobs import fleet_scoring
 import json
 
 router = APIRouter(prefix="/admin/ai-models", tags=["admin-ai-models"])
@@ -29,6 +31,127 @@ def create_ai_model(
     
     return db_model
 
+@router.post("/anomaly/retrain")
+def retrain_anomaly_model(
+    window_days: int = RETRAIN_WINDOW_DAYS,
+    admin_user: models.User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Retrain the anomaly detector on recent readings and hot-swap it"""
+    result = retrain_anomaly_detector(window_days=window_days)
+    
+    # Log the action
+    crud.create_audit_log(
+        db,
+        user_id=admin_user.id,
+        action="RETRAIN_ANOMALY_MODEL",
+        table_name="ai_models",
+        new_value=json.dumps(result)
+    )
+    
+    return result
+
+@router.post("/fleet-scoring/run")
+def run_fleet_scoring(
+    background_tasks: BackgroundTasks,
+    admin_user: models.User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Score every active product now (runs in the background)"""
+    background_tasks.add_task(fleet_scoring.score_fleet)
+    
+    # Log the action
+    crud.create_audit_log(
+        db,
+        user_id=admin_user.id,
+        action="RUN_FLEET_SCORING",
+        table_name="quality_predictions"
+    )
+    
+    return {"message": "Fleet scoring started"}
+
+@router.get("/fleet-scoring/status")
+def get_fleet_scoring_status(
+    admin_user: models.User = Depends(get_admin_user)
+):
+    """Progress of the current or last fleet scoring run"""
+    return fleet_scoring.progress
+
+@router.get("/registry/{family}")
+def list_model_versions(
+    family: str,
+    admin_user: models.User = Depends(get_admin_user)
+):
+    """List stored versions of a model family (quality, anomaly)"""
+    if family not in model_registry.FAMILIES:
+        raise HTTPException(status_code=404, detail="Model family not found")
+    return {
+        "family": family,
+        "active_version": model_registry.active_version(family),
+        "versions": model_registry.list_versions(family)
+    }
+
+@router.post("/registry/{family}/activate/{version}")
+def activate_model_version(
+    family: str,
+    version: str,
+    admin_user: models.User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Load a stored version and swap it in for the running API"""
+    if family not in model_registry.FAMILIES:
+        raise HTTPException(status_code=404, detail="Model family not found")
+    
+    previous = model_registry.active_version(family)
+    try:
+        manifest = model_registry.activate(db, family, version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model activation failed: {str(e)}")
+    
+    # Log the action
+    crud.create_audit_log(
+        db,
+        user_id=admin_user.id,
+        action="ACTIVATE_MODEL_VERSION",
+        table_name="ai_models",
+        old_value=previous,
+        new_value=json.dumps({"family": family, "version": version})
+    )
+    
+    return {"message": f"Activated {family} model version {version}", "manifest": manifest}
+
+@router.post("/registry/{family}/rollback")
+def rollback_model_version(
+    family: str,
+    admin_user: models.User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Reactivate the version that was serving before the current one"""
+    if family not in model_registry.FAMILIES:
+        raise HTTPException(status_code=404, detail="Model family not found")
+    
+    previous = model_registry.active_version(family)
+    try:
+        manifest = model_registry.rollback(db, family)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model rollback failed: {str(e)}")
+    
+    # Log the action
+    crud.create_audit_log(
+        db,
+        user_id=admin_user.id,
+        action="ROLLBACK_MODEL_VERSION",
+        table_name="ai_models",
+        old_value=previous,
+        new_value=json.dumps({"family": family, "version": manifest['version']})
+    )
+    
+    return {"message": f"Rolled back {family} model to version {manifest['version']}", "manifest": manifest}
+
 @router.get("/", response_model=List[schemas.AIModel])
 def get_all_ai_models(
     admin_user: models.User = Depends(get_admin_user),
@@ -1,34 +1,31 @@
 # AI Prediction Endpoints
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
+from sqlalchemy import insert
+from typing import Optional, List
 from .. import crud, schemas, models
 from ..database import get_db
 from ..auth import get_current_user
-from ..ai_models.quality_predictor import QualityPredictor
-from ..ai_models.anomaly_detector import AnomalyDetector
 from ..ai_models.label_validator import LabelValidator
 from ..ai_models.image_analyzer import ImageAnalyzer
+from ..ai_models.quality_predictor import QualityPredictor
+from ..ai_models.segment_models import segment_key
+from .. import model_registry
 from pydantic import BaseModel
 from datetime import datetime
+import numpy as np
+import json
 import os
 
 router = APIRouter(prefix="/ai", tags=["ai-predictions"])
 
-# Initialize AI models (load from disk)
-quality_predictor = QualityPredictor()
-anomaly_detector = AnomalyDetector()
+# Initialize AI models
+# The quality predictor and anomaly detector come from the model registry,
+# which loads them on first use and swaps them on activation
 label_validator = LabelValidator()
 image_analyzer = ImageAnalyzer()
 
-# Load models at startup
-try:
-    quality_predictor.load_model()
-    anomaly_detector.load_model()
-    print("✓ AI models loaded successfully")
-except:
-    print("⚠️  AI models not found - please train them first")
-
 # Request/Response Schemas
 class QualityPredictionRequest(BaseModel):
     product_id: int
@@ -39,6 +36,27 @@ class QualityPredictionRequest(BaseModel):
     days_since_manufacturing: Optional[int] = 0
     impurity_percentage: Optional[float] = 0.5
     active_ingredient_concentration: Optional[float] = 95.0
+    # Selects the active ingredient's own model (default: the product's name)
+    medicine_name: Optional[str] = None
+
+class QualityPredictionBatchRequest(BaseModel):
+    items: List[QualityPredictionRequest]
+
+class SweepRange(BaseModel):
+    # steps evenly spaced values from start to stop, both included
+    start: float
+    stop: float
+    steps: int
+
+class QualitySweepRequest(BaseModel):
+    temperature: SweepRange
+    humidity: SweepRange
+    days: SweepRange
+    ph_level: Optional[float] = 7.0
+    moisture_content: Optional[float] = 5.0
+    impurity_percentage: Optional[float] = 0.5
+    active_ingredient_concentration: Optional[float] = 95.0
+    medicine_name: Optional[str] = None
 
 class AnomalyDetectionRequest(BaseModel):
     temperature: float
@@ -58,28 +76,81 @@ class QualityPredictionResponse(BaseModel):
     recommendation: str
 
 # AI Prediction Endpoints
+def _check_prediction_mode(mode):
+    if mode not in QualityPredictor.PREDICTION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"mode must be one of: {', '.join(QualityPredictor.PREDICTION_MODES)}"
+        )
+
+def _quality_segment(db, request):
+    """
+    Segment whose model scores a request: the active ingredient of
+    medicine_name, else of the product's name; None (global model) when
+    that segment has no model
+    """
+    quality_predictor = model_registry.get_predictor('quality')
+    if quality_predictor.segments is None:
+        return None
+    
+    name = request.medicine_name
+    if not name:
+        product = db.get(models.Product, request.product_id)
+        name = product.name if product is not None else None
+    return quality_predictor.model_segment(segment_key(name))
+
+def _quality_segments(db, items):
+    """_quality_segment() of every batch item, with one product query for the missing names"""
+    quality_predictor = model_registry.get_predictor('quality')
+    if quality_predictor.segments is None:
+        return [None] * len(items)
+    
+    product_ids = {item.product_id for item in items if not item.medicine_name}
+    product_names = dict(
+        db.query(models.Product.id, models.Product.name)
+        .filter(models.Product.id.in_(product_ids))
+        .all()
+    ) if product_ids else {}
+    return [
+        quality_predictor.model_segment(
+            segment_key(item.medicine_name or product_names.get(item.product_id))
+        )
+        for item in items
+    ]
+
 @router.post("/predict-quality")
 def predict_quality(
     request: QualityPredictionRequest,
+    mode: str = "full",
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Predict medicine quality based on current conditions
     Uses ML model trained on Kaggle dataset
+    mode=fast uses the distilled surrogate model (lower latency, slightly
+    less accurate); uncertain cases still go to the full models.
+    mode=joint runs only the classifier and derives the score from its
+    class probabilities (one model pass instead of two)
+    Medicines whose active ingredient has its own model are scored by it
     """
     
+    _check_prediction_mode(mode)
+    
     try:
-        # Make prediction
-        prediction = quality_predictor.predict(
-            temperature=request.temperature,
-            humidity=request.humidity,
-            ph=request.ph_level,
-            moisture=request.moisture_content,
-            days_elapsed=request.days_since_manufacturing,
-            impurity=request.impurity_percentage,
-            active_ingredient=request.active_ingredient_concentration
-        )
+        segment = _quality_segment(db, request)
+        
+        # Make prediction (batched with concurrent requests)
+        prediction = model_registry.infer('quality', (
+            request.temperature,
+            request.humidity,
+            request.ph_level,
+            request.moisture_content,
+            request.days_since_manufacturing,
+            request.impurity_percentage,
+            request.active_ingredient_concentration
+        ), mode=mode, segment=segment)
+        prediction['segment'] = segment
         
         # Add recommendation
         recommendation = _generate_recommendation(prediction)
@@ -112,18 +183,215 @@ def predict_quality(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+# Largest batch accepted by /predict-quality/batch
+MAX_BATCH_SIZE = 50000
+
+@router.post("/predict-quality/batch")
+def predict_quality_batch(
+    request: QualityPredictionBatchRequest,
+    mode: str = "full",
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Predict quality for many products in one pass
+    Scores all rows with one call per model, bulk-inserts the predictions
+    and alerts, and commits once. Items are routed to segment models like
+    /predict-quality, one call per segment.
+    """
+    
+    _check_prediction_mode(mode)
+    
+    if not request.items:
+        return {"predictions": [], "alerts_created": 0}
+    
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.items)} items (max {MAX_BATCH_SIZE})"
+        )
+    
+    try:
+        features = np.array([
+            [
+                item.temperature,
+                item.humidity,
+                item.ph_level,
+                item.moisture_content,
+                item.days_since_manufacturing,
+                item.impurity_percentage,
+                item.active_ingredient_concentration
+            ]
+            for item in request.items
+        ], dtype=np.float64)
+        
+        quality_predictor = model_registry.get_predictor('quality')
+        segments = _quality_segments(db, request.items)
+        
+        # One pass per segment model (None: the global model)
+        rows_by_segment = {}
+        for i, segment in enumerate(segments):
+            rows_by_segment.setdefault(segment, []).append(i)
+        scored = [None] * len(request.items)
+        for segment, rows in rows_by_segment.items():
+            predictor = quality_predictor.for_segment(segment)
+            batch = predictor.predict_batch(features[rows], mode=mode)
+            max_confidence = batch['confidence'].max(axis=1)
+            for j, i in enumerate(rows):
+                scored[i] = (predictor.prediction_from_batch(batch, j), float(max_confidence[j]))
+        
+        now = datetime.utcnow()
+        
+        predictions = []
+        prediction_rows = []
+        alert_rows = []
+        
+        for i, item in enumerate(request.items):
+            prediction, max_confidence = scored[i]
+            prediction['segment'] = segments[i]
+            recommendation = _generate_recommendation(prediction)
+            prediction['recommendation'] = recommendation
+            predictions.append({"product_id": item.product_id, **prediction})
+            
+            prediction_rows.append({
+                "product_id": item.product_id,
+                "predicted_quality_score": prediction['quality_score'],
+                "confidence_level": max_confidence,
+                "prediction_timestamp": now
+            })
+            
+            # Create alert if quality is poor
+            if prediction['quality_score'] < 70:
+                alert_rows.append({
+                    "user_id": current_user.id,
+                    "product_id": item.product_id,
+                    "alert_type": "quality_degradation",
+                    "severity": "high" if prediction['quality_score'] < 50 else "medium",
+                    "message": f"AI Prediction: Quality score is {prediction['quality_score']:.1f}. {recommendation}"
+                })
+        
+        # Bulk insert and commit once
+        db.execute(insert(models.QualityPrediction), prediction_rows)
+        if alert_rows:
+            db.execute(insert(models.Alert), alert_rows)
+        db.commit()
+        
+        return {"predictions": predictions, "alerts_created": len(alert_rows)}
+        
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+
+# Largest grid accepted by /predict-quality/sweep (points)
+MAX_SWEEP_POINTS = 2000000
+# Larger grids are always streamed
+MAX_INLINE_SWEEP_POINTS = 200000
+
+def _sweep_lines(header, blocks):
+    """NDJSON: the header, then one line per temperature"""
+    yield json.dumps(header) + "\n"
+    for start, scores, statuses in blocks:
+        for i in range(len(scores)):
+            yield json.dumps({
+                "temperature_index": start + i,
+                "quality_score": np.round(scores[i], 2).tolist(),
+                "quality_status": statuses[i].tolist()
+            }) + "\n"
+
+@router.post("/predict-quality/sweep")
+def predict_quality_sweep(
+    request: QualitySweepRequest,
+    mode: str = "full",
+    stream: bool = False,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    What-if sweep: quality over a temperature x humidity x days grid
+    Every combination is scored with the other conditions held fixed, in
+    one vectorized pass (values the models can't tell apart are scored
+    once). quality_score[t][h][d] and quality_status[t][h][d] (an index
+    into classes) follow the axes. With stream=true, or for grids above
+    MAX_INLINE_SWEEP_POINTS, the response is NDJSON: a header line with the
+    axes, then one line per temperature.
+    """
+    
+    _check_prediction_mode(mode)
+    
+    ranges = {'temperature': request.temperature, 'humidity': request.humidity, 'days': request.days}
+    for name, sweep_range in ranges.items():
+        if sweep_range.steps < 1:
+            raise HTTPException(status_code=400, detail=f"{name}.steps must be at least 1")
+    points = request.temperature.steps * request.humidity.steps * request.days.steps
+    if points > MAX_SWEEP_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sweep too large: {points} points (max {MAX_SWEEP_POINTS})"
+        )
+    
+    try:
+        axes = {
+            name: np.linspace(sweep_range.start, sweep_range.stop, sweep_range.steps)
+            for name, sweep_range in ranges.items()
+        }
+        quality_predictor = model_registry.get_predictor('quality')
+        segment = quality_predictor.model_segment(segment_key(request.medicine_name))
+        quality_predictor = quality_predictor.for_segment(segment)
+        
+        grid = (
+            axes['temperature'], axes['humidity'], axes['days'],
+            (request.ph_level, request.moisture_content,
+             request.impurity_percentage, request.active_ingredient_concentration)
+        )
+        header = {
+            "axes": {name: values.tolist() for name, values in axes.items()},
+            "shape": [len(values) for values in axes.values()],
+            "classes": [str(name) for name in quality_predictor.classes_],
+            "mode": mode,
+            "segment": segment
+        }
+        
+        if stream or points > MAX_INLINE_SWEEP_POINTS:
+            return StreamingResponse(
+                _sweep_lines(header, quality_predictor.iter_condition_grid(*grid, mode=mode)),
+                media_type="application/x-ndjson"
+            )
+        
+        scores, statuses = quality_predictor.predict_condition_grid(*grid, mode=mode)
+        # Plain lists, serialized directly (no per-element response encoding)
+        return JSONResponse({
+            **header,
+            "quality_score": np.round(scores, 2).tolist(),
+            "quality_status": statuses.tolist()
+        })
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Sweep failed: {str(e)}")
+
+# Longest horizon accepted by /predict-degradation-timeline (days)
+MAX_TIMELINE_DAYS = 3650
+
 @router.post("/predict-degradation-timeline")
 def predict_degradation_timeline(
     request: QualityPredictionRequest,
     days_ahead: int = 30,
+    step_days: int = 5,
+    from_current_age: bool = False,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Predict quality degradation over time
-    Provides timeline of expected quality changes
+    Provides timeline of expected quality changes; days_from_now counts from
+    day 0, or from the request's days_since_manufacturing with
+    from_current_age=true
     """
     
+    if step_days < 1 or days_ahead < 1 or days_ahead > MAX_TIMELINE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"days_ahead must be 1-{MAX_TIMELINE_DAYS} and step_days at least 1"
+        )
+    
     try:
         current_conditions = (
             request.temperature,
@@ -134,9 +402,14 @@ def predict_degradation_timeline(
             request.active_ingredient_concentration
         )
         
+        quality_predictor = model_registry.get_predictor('quality').for_segment(
+            _quality_segment(db, request)
+        )
         timeline = quality_predictor.predict_degradation_timeline(
             current_conditions,
-            days_ahead
+            days_ahead,
+            step_days=step_days,
+            days_elapsed=request.days_since_manufacturing if from_current_age else 0
         )
         
         return {
@@ -162,12 +435,13 @@ def detect_anomaly(
     """
     
     try:
-        result = anomaly_detector.detect(
-            temperature=request.temperature,
-            humidity=request.humidity,
-            light_exposure=request.light_exposure,
-            vibration=request.vibration
-        )
+        # Batched with concurrent requests
+        result = model_registry.infer('anomaly', (
+            request.temperature,
+            request.humidity,
+            request.light_exposure,
+            request.vibration
+        ))
         
         # Log to audit
         crud.create_audit_log(
@@ -277,6 +551,42 @@ async def analyze_packaging(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image analysis failed: {str(e)}")
 
+def _registry_model_status(family):
+    """Status, version, cache, batching, pruning, compact-format and segment stats; a model that isn't loaded yet stays unloaded"""
+    if not model_registry.is_warm(family):
+        return {
+            "status": "not_loaded",
+            "version": model_registry.active_version(family),
+            "cache": None,
+            "batching": None,
+            "surrogate": None,
+            "pruning": None,
+            "compact": None,
+            "segments": None
+        }
+    
+    predictor = model_registry.get_predictor(family)
+    return {
+        "status": "active" if predictor.is_trained() else "not_trained",
+        "version": model_registry.active_version(family),
+        "cache": predictor.cache.stats(),
+        "batching": model_registry.batching_stats(family),
+        # Fidelity of the fast-mode surrogate, for families that have one
+        "surrogate": (
+            predictor.surrogate.fidelity
+            if getattr(predictor, 'surrogate', None) is not None else None
+        ),
+        # Tree counts, accuracy and latency of the pruned ensembles, when served
+        "pruning": predictor.pruning_report if predictor.serving_pruned else None,
+        # Whether the compact float32 node arrays are served
+        "compact": predictor.serving_compact,
+        # Segment models and which of them are loaded, for families that have them
+        "segments": (
+            predictor.segments.stats()
+            if getattr(predictor, 'segments', None) is not None else None
+        )
+    }
+
 @router.get("/model-status")
 def get_model_status(
     current_user: models.User = Depends(get_current_user),
@@ -293,7 +603,7 @@ def get_model_status(
     models_info.append({
         "name": "Quality Degradation Predictor",
         "type": "ml_prediction",
-        "status": "active" if quality_predictor.regression_model else "not_trained",
+        **_registry_model_status('quality'),
         "description": "Predicts medicine quality based on storage conditions"
     })
     
@@ -301,7 +611,7 @@ def get_model_status(
     models_info.append({
         "name": "Anomaly Detector",
         "type": "anomaly_detection",
-        "status": "active" if anomaly_detector.model else "not_trained",
+        **_registry_model_status('anomaly'),
         "description": "Detects unusual sensor readings"
     })
     
@@ -330,6 +640,63 @@ def get_model_status(
         "total_models": len(models_info)
     }
 
+# Lab values smart analysis assumes (no lab measurements for live products)
+SMART_ANALYSIS_LAB_VALUES = (7.0, 5.0, 0.5, 95.0)
+
+def _smart_analysis_result(product, latest_sensor, quality_pred, anomaly_result,
+                           timeline, shelf_life, now):
+    """Assemble one product's smart analysis from its model outputs"""
+    
+    # Comprehensive Assessment
+    overall_status = "Safe" if (
+        quality_pred['quality_score'] > 70 and 
+        not anomaly_result['is_anomaly']
+    ) else "Warning"
+    
+    # Generate recommendations
+    recommendations = []
+    
+    if quality_pred['quality_score'] < 70:
+        recommendations.append(
+            f"Quality declining: {_generate_recommendation(quality_pred)}"
+        )
+    
+    if anomaly_result['is_anomaly']:
+        recommendations.append(anomaly_result['recommendation'])
+    
+    # Predictive warnings
+    future_warning = None
+    if shelf_life['shelf_life_days'] is not None:
+        future_warning = f"Quality may drop below safe levels in {shelf_life['shelf_life_days']} days"
+    
+    return {
+        "product_id": product.id,
+        "product_name": product.name,
+        "batch_number": product.batch_number,
+        "overall_status": overall_status,
+        "analysis_timestamp": now.isoformat(),
+        "quality_analysis": {
+            "score": quality_pred['quality_score'],
+            "status": quality_pred['quality_status'],
+            "confidence": quality_pred['confidence'],
+            "risk": quality_pred['degradation_risk']
+        },
+        "anomaly_detection": {
+            "is_anomalous": anomaly_result['is_anomaly'],
+            "severity": anomaly_result['severity'],
+            "score": anomaly_result['anomaly_score']
+        },
+        "current_conditions": {
+            "temperature": latest_sensor.temperature,
+            "humidity": latest_sensor.humidity,
+            "timestamp": latest_sensor.timestamp.isoformat()
+        },
+        "recommendations": recommendations if recommendations else ["No action needed"],
+        "predictive_warning": future_warning,
+        "shelf_life": shelf_life,
+        "degradation_timeline": timeline[:5]  # Next 25 days
+    }
+
 @router.post("/smart-analysis")
 def smart_analysis(
     product_id: int,
@@ -357,89 +724,147 @@ def smart_analysis(
             )
         
         latest_sensor = sensor_data[0]
+        now = datetime.utcnow()
+        conditions = (latest_sensor.temperature, latest_sensor.humidity, *SMART_ANALYSIS_LAB_VALUES)
         
         # Calculate days since manufacturing
-        days_elapsed = (datetime.utcnow() - product.manufacturing_date).days
-        
-        # 1. Quality Prediction
-        quality_pred = quality_predictor.predict(
-            temperature=latest_sensor.temperature,
-            humidity=latest_sensor.humidity,
-            ph=7.0,  # Default values
-            moisture=5.0,
-            days_elapsed=days_elapsed,
-            impurity=0.5,
-            active_ingredient=95.0
+        days_elapsed = (now - product.manufacturing_date).days
+        
+        quality_predictor = model_registry.get_predictor('quality')
+        
+        # 1. Quality Prediction (current quality is day 0 of the timeline)
+        timeline_batch = quality_predictor.predict_degradation_matrix(
+            conditions,
+            days_ahead=30,
+            step_days=5,
+            days_elapsed=days_elapsed
         )
+        quality_pred = quality_predictor.prediction_from_batch(timeline_batch, 0)
         
         # 2. Anomaly Detection
-        anomaly_result = anomaly_detector.detect(
-            temperature=latest_sensor.temperature,
-            humidity=latest_sensor.humidity,
-            light_exposure=latest_sensor.light_exposure,
-            vibration=latest_sensor.vibration
+        anomaly_result = model_registry.infer('anomaly', (
+            latest_sensor.temperature,
+            latest_sensor.humidity,
+            latest_sensor.light_exposure,
+            latest_sensor.vibration
+        ))
+        
+        # 3. Solve for the day quality crosses the safe threshold, up to expiry
+        shelf_life = quality_predictor.estimate_shelf_life(
+            conditions,
+            days_elapsed=days_elapsed,
+            max_days=(product.expiry_date - now).days,
+            threshold=70
         )
         
-        # 3. Comprehensive Assessment
-        overall_status = "Safe" if (
-            quality_pred['quality_score'] > 70 and 
-            not anomaly_result['is_anomaly']
-        ) else "Warning"
+        return _smart_analysis_result(
+            product, latest_sensor, quality_pred, anomaly_result,
+            quality_predictor.timeline_from_batch(timeline_batch), shelf_life, now
+        )
         
-        # 4. Generate recommendations
-        recommendations = []
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+# Products analyzed per model pass by /smart-analysis/fleet
+FLEET_ANALYSIS_CHUNK_SIZE = 2000
+
+def _fleet_analysis_chunks(products, latest, now, chunk_size=FLEET_ANALYSIS_CHUNK_SIZE):
+    """
+    Smart analysis of many products, yielded a chunk at a time
+    latest: {product_id: latest sensor reading}; products must all have one.
+    Each chunk runs one quality pass over every (product, horizon) row, one
+    anomaly pass and one shelf-life search.
+    """
+    
+    quality_predictor = model_registry.get_predictor('quality')
+    anomaly_detector = model_registry.get_predictor('anomaly')
+    
+    for start in range(0, len(products), chunk_size):
+        chunk = products[start:start + chunk_size]
+        readings = [latest[product.id] for product in chunk]
+        
+        conditions = np.array([
+            (reading.temperature, reading.humidity, *SMART_ANALYSIS_LAB_VALUES)
+            for reading in readings
+        ], dtype=np.float64)
+        days_elapsed = np.array([(now - p.manufacturing_date).days for p in chunk], dtype=np.int64)
+        days_to_expiry = np.array([(p.expiry_date - now).days for p in chunk], dtype=np.int64)
+        
+        timeline_batch = quality_predictor.predict_degradation_matrices(
+            conditions, days_elapsed, days_ahead=30, step_days=5
+        )
+        horizons = len(timeline_batch['days_from_now'])
+        anomaly_results = anomaly_detector.detect_many([
+            (r.temperature, r.humidity, r.light_exposure, r.vibration) for r in readings
+        ])
+        shelf_lives = quality_predictor.estimate_shelf_life_batch(
+            conditions, days_elapsed, days_to_expiry, threshold=70
+        )
         
-        if quality_pred['quality_score'] < 70:
-            recommendations.append(
-                f"Quality declining: {_generate_recommendation(quality_pred)}"
+        yield [
+            _smart_analysis_result(
+                product,
+                readings[i],
+                quality_predictor.prediction_from_batch(timeline_batch, i * horizons),
+                anomaly_results[i],
+                quality_predictor.timeline_from_batch(timeline_batch, i),
+                quality_predictor.shelf_life_result(shelf_lives[i], days_to_expiry[i], threshold=70),
+                now
             )
+            for i, product in enumerate(chunk)
+        ]
+
+def _fleet_lines(header, chunks):
+    """NDJSON: the header, then one line per product"""
+    yield json.dumps(header) + "\n"
+    for results in chunks:
+        for result in results:
+            yield json.dumps(result) + "\n"
+
+@router.post("/smart-analysis/fleet")
+def smart_analysis_fleet(
+    stream: bool = False,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Smart analysis of every product of the current user
+    Same per-product result as /smart-analysis, from two queries (the
+    products, and the latest reading of each in one window-function query)
+    and one pass per model over all of them. Products without sensor data
+    are listed in products_without_data. With stream=true the response is
+    NDJSON: a header line, then one line per product as it is analyzed.
+    """
+    
+    try:
+        products = db.query(models.Product).filter(
+            models.Product.owner_id == current_user.id
+        ).order_by(models.Product.id).all()
+        latest = {
+            reading.product_id: reading
+            for reading in crud.get_latest_sensor_readings(db, owner_id=current_user.id)
+        }
         
-        if anomaly_result['is_anomaly']:
-            recommendations.append(anomaly_result['recommendation'])
-        
-        # 5. Predictive warnings
-        timeline = quality_predictor.predict_degradation_timeline(
-            (latest_sensor.temperature, latest_sensor.humidity, 7.0, 5.0, 0.5, 95.0),
-            days_ahead=30
-        )
+        analyzed = [product for product in products if product.id in latest]
+        now = datetime.utcnow()
+        header = {
+            "analysis_timestamp": now.isoformat(),
+            "products_total": len(products),
+            "products_analyzed": len(analyzed),
+            "products_without_data": [p.id for p in products if p.id not in latest]
+        }
         
-        future_warning = None
-        for pred in timeline:
-            if pred['predicted_quality'] < 70:
-                future_warning = f"Quality may drop below safe levels in {pred['days_from_now']} days"
-                break
+        chunks = _fleet_analysis_chunks(analyzed, latest, now)
+        if stream:
+            return StreamingResponse(_fleet_lines(header, chunks), media_type="application/x-ndjson")
         
-        return {
-            "product_id": product_id,
-            "product_name": product.name,
-            "batch_number": product.batch_number,
-            "overall_status": overall_status,
-            "analysis_timestamp": datetime.utcnow().isoformat(),
-            "quality_analysis": {
-                "score": quality_pred['quality_score'],
-                "status": quality_pred['quality_status'],
-                "confidence": quality_pred['confidence'],
-                "risk": quality_pred['degradation_risk']
-            },
-            "anomaly_detection": {
-                "is_anomalous": anomaly_result['is_anomaly'],
-                "severity": anomaly_result['severity'],
-                "score": anomaly_result['anomaly_score']
-            },
-            "current_conditions": {
-                "temperature": latest_sensor.temperature,
-                "humidity": latest_sensor.humidity,
-                "timestamp": latest_sensor.timestamp.isoformat()
-            },
-            "recommendations": recommendations if recommendations else ["No action needed"],
-            "predictive_warning": future_warning,
-            "degradation_timeline": timeline[:5]  # Next 25 days
-        }
+        results = [result for results in chunks for result in results]
+        return JSONResponse({**header, "analyses": results})
         
-    except HTTPException:
-        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Fleet analysis failed: {str(e)}")
     
 # Helper Functions
 def _generate_recommendation(prediction):
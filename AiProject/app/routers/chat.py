@@ -2,7 +2,6 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from decouple import config
-from openai import AsyncOpenAI, APIConnectionError, APIStatusError # <--- UPDATED IMPORT
 import logging
 
 # Initialize router
@@ -43,6 +42,10 @@ async def chat_completions(request: ChatRequest):
         logger.error("OPENROUTER_API_KEY is not set in .env file.")
         raise HTTPException(status_code=500, detail="Server configuration error: API Key missing.")
 
+    # Imported on first use: the OpenAI SDK is slow to import and most
+    # workers never serve chat
+    from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+
     try:
         # 2. Prepare the system prompt (content remains the same)
         system_prompt = {
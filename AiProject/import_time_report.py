@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+
+# Import-Time Report
+#
+# Imports a module in a fresh interpreter with `python -X importtime` and
+# prints where the startup time goes: the slowest modules (cumulative, so a
+# package includes everything it pulls in) and totals per top-level package.
+#
+# Usage:
+#   python import_time_report.py                     # app.main
+#   python import_time_report.py app.routers.alerts --top 30
+#   python import_time_report.py app.main --budget-ms 800   # exit 1 if slower
+
+HEAVY_PACKAGES = ['sklearn', 'scipy', 'pandas', 'PIL', 'openai', 'joblib']
+
+
+def measure_imports(module):
+    """
+    Returns [(module_name, self_us, cumulative_us, depth)] in import order
+    """
+
+    env = dict(os.environ)
+    # Importing the app must not need a reachable database
+    env.setdefault('DATABASE_URL', 'sqlite://')
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def print_report(module, rows, top=20):
+    root = next((row for row in rows if row[0] == module), None)
+    total_ms = root[2] / 1000 if root else sum(row[1] for row in rows) / 1000
+
+    print("=" * 70)
+    print(f"IMPORT TIME REPORT: {module}")
+    print("=" * 70)
+    print(f"\n⏱️  Total: {total_ms:.0f} ms ({len(rows)} modules)")
+
+    print(f"\n📊 Slowest modules (cumulative):")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"   {cumulative_us / 1000:8.1f} ms  {self_us / 1000:7.1f} ms self  {name}")
+
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    print(f"\n📦 By top-level package (self time):")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"   {self_us / 1000:8.1f} ms  {package}")
+
+    heavy = [package for package in HEAVY_PACKAGES if package in packages]
+    if heavy:
+        print(f"\n⚠️  Heavy packages imported at startup: {', '.join(heavy)}")
+    else:
+        print(f"\n✓ No heavy packages ({', '.join(HEAVY_PACKAGES)}) imported at startup")
+
+    return total_ms
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-module import time report")
+    parser.add_argument('module', nargs='?', default='app.main')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Exit with status 1 if the import takes longer")
+    args = parser.parse_args()
+
+    total_ms = print_report(args.module, measure_imports(args.module), args.top)
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\n❌ {args.module} took {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        sys.exit(1)
@@ -0,0 +1,298 @@
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import uvicorn
+from decouple import config
+from app import main as app_main
+from app import model_registry
+from app.database import engine, Base
+
+# Production Server (pre-fork, multi-process)
+#
+# The master process imports the app and loads every model once, then forks
+# worker processes that all accept from one shared listening socket. Workers
+# inherit the loaded models, so read-only model memory is shared
+# copy-on-write rather than loaded again per worker.
+#
+# Signals to the master:
+#   SIGHUP            reload models, then replace every worker gracefully
+#   SIGTERM / SIGINT  stop workers gracefully and exit
+#   SIGTTIN / SIGTTOU add / remove one worker
+#
+# Background jobs (fleet scoring, anomaly retraining) run in the slot-0
+# worker only. A replacement slot-0 worker is started once the previous one
+# has exited, so two workers never run the jobs at the same time. Workers
+# skip the startup work (tables, model warm-up) the master already did.
+#
+# Workers exit after MAX_REQUESTS (+ random jitter) requests and are replaced,
+# which bounds slow memory growth. When a model version is activated in any
+# worker the registry pointer moves; the master notices and reloads all
+# workers so they serve the same version.
+#
+# Usage: python run_production.py [--workers N] [--port 8000]
+# (Unix only; use run_server.py for development)
+
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+HOST = config('HOST', default='0.0.0.0')
+PORT = config('PORT', default=8000, cast=int)
+WORKERS = config('WEB_CONCURRENCY', default=_available_cores(), cast=int)
+# Recycle a worker after this many requests (0 disables)
+MAX_REQUESTS = config('MAX_REQUESTS', default=10000, cast=int)
+MAX_REQUESTS_JITTER = config('MAX_REQUESTS_JITTER', default=1000, cast=int)
+# Seconds a stopping worker gets to finish in-flight requests
+GRACEFUL_TIMEOUT = config('GRACEFUL_TIMEOUT', default=30, cast=int)
+MODEL_RELOAD_POLL_SECONDS = config('MODEL_RELOAD_POLL_SECONDS', default=5, cast=float)
+LOG_LEVEL = config('LOG_LEVEL', default='info')
+
+# A worker that dies sooner than this after starting is respawned with a delay
+MIN_WORKER_LIFETIME = 1.0
+# Worker slot that runs the background jobs
+JOBS_SLOT = 0
+
+
+def run_worker(sock, slot, max_requests):
+    """Body of a forked worker: serve the preloaded app on the shared socket"""
+
+    # Back to default signal handling; uvicorn installs its own
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(sig, signal.SIG_DFL)
+    random.seed()
+
+    # Pooled connections belong to the master
+    engine.dispose(close=False)
+
+    # Background jobs run in one worker only
+    app_main.BACKGROUND_JOBS_ENABLED = app_main.BACKGROUND_JOBS_ENABLED and slot == JOBS_SLOT
+    # Tables and models were set up by the master before forking
+    app_main.STARTUP_TASKS_ENABLED = False
+
+    limit = None
+    if max_requests > 0:
+        limit = max_requests + random.randint(0, max(MAX_REQUESTS_JITTER, 0))
+
+    server = uvicorn.Server(uvicorn.Config(
+        app_main.app,
+        lifespan="on",
+        limit_max_requests=limit,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        log_level=LOG_LEVEL
+    ))
+    server.run(sockets=[sock])
+
+
+class Master:
+    """
+    Keeps one worker per slot alive, replaces recycled or crashed workers and
+    rolls all workers on reload
+    """
+
+    def __init__(self, sock, num_workers, max_requests):
+        self.sock = sock
+        self.num_workers = num_workers
+        self.max_requests = max_requests
+        self.workers = {}        # pid -> slot
+        self.retiring = {}       # pid -> kill deadline
+        self.started_at = {}     # pid -> start time
+        self.last_crash = {}     # slot -> time a short-lived worker died
+        self.stopping = False
+        self.reload_requested = False
+        self.versions = model_registry.active_versions()
+        self.last_poll = time.monotonic()
+
+    # --- signals (only set flags; the loop acts on them) ---
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def handle_more(self, signum, frame):
+        self.num_workers += 1
+
+    def handle_fewer(self, signum, frame):
+        self.num_workers = max(1, self.num_workers - 1)
+
+    # --- workers ---
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = slot
+            self.started_at[pid] = time.monotonic()
+            return pid
+
+        code = 0
+        try:
+            run_worker(self.sock, slot, self.max_requests)
+        except BaseException as e:
+            print(f"❌ Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def retire(self, pid):
+        """Ask a worker to finish in-flight requests and exit"""
+        if pid in self.retiring:
+            return
+        self.retiring[pid] = time.monotonic() + GRACEFUL_TIMEOUT
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            slot = self.workers.pop(pid, None)
+            retired = self.retiring.pop(pid, None) is not None
+            lifetime = time.monotonic() - self.started_at.pop(pid, time.monotonic())
+            if slot is None or retired or self.stopping:
+                continue
+
+            if lifetime < MIN_WORKER_LIFETIME:
+                self.last_crash[slot] = time.monotonic()
+            print(f"♻️  Worker {pid} (slot {slot}) exited with status "
+                  f"{os.waitstatus_to_exitcode(status)}, replacing")
+
+    def maintain(self):
+        """Spawn workers for empty slots; retire workers above the target count"""
+        serving = {slot for pid, slot in self.workers.items() if pid not in self.retiring}
+        now = time.monotonic()
+
+        for slot in range(self.num_workers):
+            crashed = self.last_crash.get(slot)
+            if slot in serving or (crashed and now - crashed < MIN_WORKER_LIFETIME):
+                continue
+            # The jobs slot is refilled only after its previous worker (and
+            # with it, its schedulers) has exited
+            if slot == JOBS_SLOT and JOBS_SLOT in self.workers.values():
+                continue
+            self.spawn(slot)
+
+        for pid, slot in list(self.workers.items()):
+            if slot >= self.num_workers:
+                self.retire(pid)
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    # --- reload / shutdown ---
+
+    def models_changed(self):
+        if time.monotonic() - self.last_poll < MODEL_RELOAD_POLL_SECONDS:
+            return False
+        self.last_poll = time.monotonic()
+        return model_registry.active_versions() != self.versions
+
+    def reload(self):
+        """
+        Reload models in the master, start fresh workers, then retire the old ones
+        The jobs slot's replacement is started by maintain() once the old
+        one has exited.
+        """
+        self.reload_requested = False
+        print("🔄 Reloading models and workers...")
+
+        model_registry.reload_active()
+        self.versions = model_registry.active_versions()
+        gc.freeze()
+
+        old = [pid for pid in self.workers if pid not in self.retiring]
+        for slot in range(self.num_workers):
+            if slot != JOBS_SLOT:
+                self.spawn(slot)
+        for pid in old:
+            self.retire(pid)
+
+    def shutdown(self):
+        print("🛑 Stopping workers...")
+        for pid in list(self.workers):
+            self.retire(pid)
+
+        while self.workers:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+        print("✓ All workers stopped")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        signal.signal(signal.SIGTTIN, self.handle_more)
+        signal.signal(signal.SIGTTOU, self.handle_fewer)
+
+        print(f"✓ Master {os.getpid()} starting {self.num_workers} workers")
+
+        while True:
+            self.reap()
+            if self.stopping:
+                self.shutdown()
+                return
+            if self.reload_requested or self.models_changed():
+                self.reload()
+            self.kill_overdue()
+            self.maintain()
+            time.sleep(0.2)
+
+
+def bind_socket(host, port):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-fork production server")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS)
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        print("❌ run_production.py needs os.fork (Linux/macOS); use run_server.py instead")
+        sys.exit(1)
+
+    sock = bind_socket(args.host, args.port)
+
+    # One-time startup work happens here, before forking
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    model_registry.warm_up()
+
+    # Move everything loaded so far out of the garbage collector's view so
+    # collections in workers don't write to (and un-share) those pages
+    gc.freeze()
+
+    print(f"✓ Listening on http://{args.host}:{args.port}")
+    Master(sock, max(1, args.workers), args.max_requests).run()
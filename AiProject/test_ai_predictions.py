@@ -0,0 +1,98 @@
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import model_registry
+from app.auth import get_current_user
+from app.database import get_db
+from app.routers import ai_predictions
+from app import models
+from app.ai_models.quality_predictor import QualityPredictor
+from app.ai_models.segment_models import SegmentModels
+from test_fast_inference import _make_quality_data
+from test_jobs import _sqlite_sessions, _seed_products
+
+# Endpoints of the AI router, on models trained in the test
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(ai_predictions.router)
+    app.dependency_overrides[get_current_user] = lambda: None
+    app.dependency_overrides[get_db] = lambda: None
+    return TestClient(app)
+
+
+def _serve_quality_model():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+    model_registry.swap_predictor('quality', predictor)
+    return predictor
+
+
+def test_degradation_timeline_starts_at_day_zero_unless_asked():
+    predictor = _serve_quality_model()
+    client = _client()
+    request = {'product_id': 1, 'temperature': 9.0, 'humidity': 60.0, 'days_since_manufacturing': 300}
+    conditions = (9.0, 60.0, 7.0, 5.0, 0.5, 95.0)
+    try:
+        response = client.post("/ai/predict-degradation-timeline", json=request)
+        assert response.status_code == 200
+        assert response.json()['prediction_timeline'] == \
+            predictor.predict_degradation_timeline(conditions, 30, step_days=5, days_elapsed=0)
+
+        response = client.post(
+            "/ai/predict-degradation-timeline?from_current_age=true", json=request
+        )
+        assert response.status_code == 200
+        assert response.json()['prediction_timeline'] == \
+            predictor.predict_degradation_timeline(conditions, 30, step_days=5, days_elapsed=300)
+    finally:
+        model_registry._predictors.pop('quality', None)
+
+
+def test_batch_uses_segment_models_like_single_predictions():
+    predictor = _serve_quality_model()
+    aspirin = QualityPredictor()
+    aspirin.train_model(*_make_quality_data(seed=5))
+    predictor.segments = SegmentModels.from_trained({'aspirin': aspirin}, {'aspirin': {}})
+
+    db = _sqlite_sessions()()
+    _seed_products(db, 3)
+    db.get(models.Product, 2).name = 'Aspirin 100mg'
+    db.commit()
+    client = _client()
+    client.app.dependency_overrides[get_db] = lambda: db
+    client.app.dependency_overrides[get_current_user] = lambda: db.get(models.User, 1)
+
+    conditions = {'temperature': 14.0, 'humidity': 70.0, 'days_since_manufacturing': 200}
+    items = [
+        {'product_id': 1, **conditions},
+        {'product_id': 1, 'medicine_name': 'Aspirin 500mg', **conditions},
+        {'product_id': 2, **conditions},
+        {'product_id': 3, 'medicine_name': 'Metformin 850 mg', **conditions}
+    ]
+    try:
+        response = client.post("/ai/predict-quality/batch", json={'items': items})
+        assert response.status_code == 200
+        batch = response.json()['predictions']
+        assert [p['segment'] for p in batch] == [None, 'aspirin', 'aspirin', None]
+        for item, prediction in zip(items, batch):
+            single = client.post("/ai/predict-quality", json=item).json()
+            assert prediction['segment'] == single['segment']
+            assert abs(prediction['quality_score'] - single['quality_score']) < 1e-9
+            assert prediction['quality_status'] == single['quality_status']
+        # The segment model and the global one disagree on these conditions
+        assert batch[0]['confidence'] != batch[1]['confidence']
+    finally:
+        model_registry._predictors.pop('quality', None)
+        db.close()
+
+
+if __name__ == "__main__":
+    test_degradation_timeline_starts_at_day_zero_unless_asked()
+    test_batch_uses_segment_models_like_single_predictions()
+    print("\n✅ AI endpoints work")
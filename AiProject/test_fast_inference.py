@@ -0,0 +1,590 @@
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from app.ai_models.quality_predictor import QualityPredictor
+from app.ai_models.anomaly_detector import AnomalyDetector
+from app.ai_models.micro_batcher import MicroBatcher
+from app.ai_models.prediction_cache import PredictionCache, quantize
+from app.ai_models import compact_models
+from app.ai_models.segment_models import (
+    SegmentModels, plan_segments, train_segment, select_segments, segment_keys
+)
+from concurrent.futures import ThreadPoolExecutor
+
+# Compiled inference must match sklearn on the same inputs
+
+def _make_quality_data(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'storage_temperature': rng.normal(5, 3, n),
+        'storage_humidity': rng.normal(60, 10, n),
+        'ph_level': rng.normal(7, 0.3, n),
+        'moisture_content': rng.normal(5, 1, n),
+        'days_elapsed': rng.integers(0, 400, n).astype(float),
+        'impurity_percentage': rng.normal(0.5, 0.3, n),
+        'active_ingredient_concentration': rng.normal(95, 3, n)
+    })
+    score = 100 - 2 * np.abs(X['storage_temperature'] - 5) - 0.1 * X['days_elapsed']
+    y_class = pd.Series(np.where(score > 70, 'Good', np.where(score > 40, 'Degraded', 'Counterfeit')))
+    y_score = y_class.map({'Good': 100, 'Degraded': 50, 'Counterfeit': 0})
+    return X, y_score, y_class
+
+
+def _make_sensor_data(n=300, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'temperature': rng.normal(5, 1.5, n),
+        'humidity': rng.normal(60, 8, n),
+        'light_exposure': rng.normal(50, 10, n),
+        'vibration': rng.normal(0.5, 0.2, n)
+    })
+
+
+def test_quality_predictor_matches_sklearn():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+    assert predictor.compiled_regression is not None
+
+    rows = _make_quality_data(n=500, seed=7)[0].to_numpy()
+    scaled = predictor.scaler.transform(pd.DataFrame(rows, columns=X.columns))
+
+    np.testing.assert_allclose(
+        predictor.compiled_regression.predict(rows),
+        predictor.regression_model.predict(scaled),
+        rtol=1e-9, atol=1e-9
+    )
+    np.testing.assert_allclose(
+        predictor.compiled_classification.predict_proba(rows),
+        predictor.classification_model.predict_proba(scaled),
+        rtol=1e-7, atol=1e-9
+    )
+    assert (
+        predictor.compiled_classification.predict(rows)
+        == predictor.classification_model.predict(scaled)
+    ).all()
+
+
+def test_anomaly_detector_matches_sklearn():
+    sensor_df = _make_sensor_data()
+    detector = AnomalyDetector()
+    detector.train_model(sensor_df)
+    assert detector.compiled_model is not None
+
+    rows = np.vstack([
+        _make_sensor_data(n=400, seed=3).to_numpy(),
+        [[25.0, 90.0, 100.0, 5.0], [-5.0, 20.0, 0.0, 0.0]]
+    ])
+    scaled = detector.scaler.transform(pd.DataFrame(rows, columns=sensor_df.columns))
+
+    np.testing.assert_allclose(
+        detector.compiled_model.score_samples(rows),
+        detector.model.score_samples(scaled),
+        rtol=1e-9, atol=1e-12
+    )
+    assert (detector.compiled_model.predict(rows) == detector.model.predict(scaled)).all()
+
+
+def test_memory_mapped_reload_matches():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+    rows = _make_quality_data(n=200, seed=5)[0].to_numpy()
+
+    with tempfile.TemporaryDirectory() as path:
+        predictor.model_path = path + "/"
+        predictor.save_model()
+
+        reloaded = QualityPredictor(model_path=path + "/")
+        assert reloaded.load_model()
+        # Served from the mapped node arrays; sklearn stays on disk until asked for
+        assert reloaded._regression_model is None
+        np.testing.assert_array_equal(
+            reloaded.predict_batch(rows)['quality_score'],
+            predictor.predict_batch(rows)['quality_score']
+        )
+        assert reloaded.regression_model is not None
+
+
+def test_micro_batched_predictions_match():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    predictor.train_model(X, y_score, y_class)
+
+    inputs = [tuple(row) for row in X.head(50).itertuples(index=False)]
+    expected = [predictor.predict(*values) for values in inputs]
+    predictor.cache.clear()
+
+    batcher = MicroBatcher(predictor.predict_many, max_batch_size=16, max_wait_ms=5)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(batcher.submit, inputs))
+
+    assert results == expected
+    assert batcher.stats()['largest_batch'] > 1
+
+    # A failing input only fails its own request
+    def fail_on_none(items):
+        if None in items:
+            raise ValueError("bad input")
+        return items
+
+    batcher = MicroBatcher(fail_on_none, max_wait_ms=20)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(batcher.submit, item) for item in [1, None, 3, 4]]
+    assert [f.exception() is not None for f in futures] == [False, True, False, False]
+
+
+def test_fast_mode_surrogate():
+    X, y_score, y_class = _make_quality_data(n=1000)
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    predictor.train_model(X, y_score, y_class)
+    fidelity = predictor.distill(X)
+    assert fidelity['class_agreement'] > 0.95
+    assert fidelity['fast_mode_class_agreement'] >= fidelity['class_agreement']
+
+    predictor.save_model()
+    reloaded = QualityPredictor(model_path=predictor.model_path)
+    assert reloaded.load_model()
+
+    fast = reloaded.predict_batch(X, mode='fast')
+    full = reloaded.predict_batch(X)
+    served_fast = fast['served_by'] == 'fast'
+    assert served_fast.any()
+    # Uncertain rows are scored by the full models
+    np.testing.assert_array_equal(
+        fast['quality_score'][~served_fast], full['quality_score'][~served_fast]
+    )
+    assert np.mean(fast['quality_status'] == full['quality_status']) > 0.95
+
+
+def test_pruned_ensembles_served_after_reload():
+    X, y_score, y_class = _make_quality_data(n=1000)
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    predictor.train_model(X, y_score, y_class, prune=True)
+    report = predictor.pruning_report
+    for name in ('regression', 'classification'):
+        assert report[name]['pruned']['trees'] <= report[name]['full']['trees']
+        assert report[name]['validation_pruned_score'] >= \
+            report[name]['validation_full_score'] - report[name]['tolerance']
+
+    predictor.save_model()
+    # The full artifacts keep every tree, the _pruned ones only the kept ones
+    import joblib
+    full = joblib.load(predictor.model_path + "quality_compiled.pkl")
+    pruned = joblib.load(predictor.model_path + "quality_compiled_pruned.pkl")
+    assert len(full['regression'].forest.roots) == len(predictor.regression_model.estimators_)
+    assert full['classification'].n_stages == len(predictor.classification_model.estimators_)
+    assert len(pruned['regression'].forest.roots) == report['regression']['pruned']['trees']
+    assert pruned['classification'].n_stages == report['classification']['pruned']['trees']
+    assert len(full['regression'].forest.roots) > len(pruned['regression'].forest.roots)
+
+    reloaded = QualityPredictor(model_path=predictor.model_path)
+    assert reloaded.load_model()
+    assert reloaded.serving_pruned
+    pruned = predictor.pruned_models['regression']
+    np.testing.assert_allclose(
+        reloaded.predict_batch(X)['quality_score'],
+        pruned.predict(predictor.scaler.transform(X)),
+        rtol=1e-9, atol=1e-9
+    )
+
+    sensor_df = _make_sensor_data()
+    detector = AnomalyDetector(model_path=tempfile.mkdtemp() + "/")
+    detector.train_model(sensor_df, prune=True)
+    detector.save_model()
+    full = joblib.load(detector.model_path + "anomaly_compiled.pkl")
+    pruned = joblib.load(detector.model_path + "anomaly_compiled_pruned.pkl")
+    assert len(full.forest.roots) == len(detector.model.estimators_)
+    assert len(pruned['model'].forest.roots) == len(detector.pruned_model.estimators_)
+    assert len(full.forest.roots) > len(pruned['model'].forest.roots)
+
+    reloaded = AnomalyDetector(model_path=detector.model_path)
+    assert reloaded.load_model()
+    X_raw = sensor_df.to_numpy()
+    np.testing.assert_array_equal(
+        reloaded.predict_labels(X_raw),
+        detector.pruned_model.predict(detector.scaler.transform(sensor_df))
+    )
+
+
+def test_pruning_picks_trees_on_validation_rows():
+    X, y_score, y_class = _make_quality_data(n=1000)
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    split = predictor.split_training_data(X, y_score, y_class, validation=True)
+    # Validation rows come out of the training split, never the test split
+    assert len(split['X_train']) + len(split['X_val']) + len(split['X_test']) == len(X)
+    held_out = set(split['y_score_val'].index)
+    assert not held_out & set(split['y_score_test'].index)
+    assert not held_out & set(split['y_score_train'].index)
+
+    predictor.finish_training(
+        QualityPredictor.fit_regression(split['X_train'], split['y_score_train']),
+        QualityPredictor.fit_classification(split['X_train'], split['y_class_train']),
+        split
+    )
+    report = predictor.prune(split)
+
+    # The reported scores are the models' scores on the test rows
+    regression = predictor.pruned_models['regression']
+    classification = predictor.pruned_models['classification']
+    assert report['regression']['pruned_score'] == \
+        round(regression.score(split['X_test'], split['y_score_test']), 5)
+    assert report['regression']['full_score'] == \
+        round(predictor.regression_model.score(split['X_test'], split['y_score_test']), 5)
+    assert report['classification']['pruned_score'] == \
+        round(classification.score(split['X_test'], split['y_class_test']), 5)
+    # ...and the tree count was picked on the validation rows
+    assert report['regression']['validation_pruned_score'] == \
+        round(regression.score(split['X_val'], split['y_score_val']), 5)
+    assert report['classification']['validation_pruned_score'] == \
+        round(classification.score(split['X_val'], split['y_class_val']), 5)
+
+
+def test_anomaly_pruning_picks_trees_on_held_out_readings():
+    from app.ai_models import anomaly_detector
+    from app.ai_models.ensemble_pruning import PRUNING_VALIDATION_FRACTION
+
+    sensor_df = _make_sensor_data(n=1000)
+    seen = []
+    prune_isolation_forest = anomaly_detector.prune_isolation_forest
+    def recording(model, X_val, tolerance, **kwargs):
+        seen.append((X_val, kwargs['X_test']))
+        return prune_isolation_forest(model, X_val, tolerance, **kwargs)
+    anomaly_detector.prune_isolation_forest = recording
+    try:
+        detector = AnomalyDetector(model_path=tempfile.mkdtemp() + "/")
+        detector.train_model(sensor_df, prune=True)
+    finally:
+        anomaly_detector.prune_isolation_forest = prune_isolation_forest
+
+    # k is picked on readings held out of training, and graded on the others
+    [(X_val, X_test)] = seen
+    assert len(X_val) == round(len(sensor_df) * PRUNING_VALIDATION_FRACTION)
+    assert len(X_val) + len(X_test) == len(sensor_df)
+    trained_on = {tuple(row) for row in X_test}
+    assert not any(tuple(row) in trained_on for row in X_val)
+
+    report = detector.pruning_report
+    full = detector.model.score_samples(X_test) < detector.model.offset_
+    pruned = detector.pruned_model.score_samples(X_test) < detector.pruned_model.offset_
+    assert report['pruned_score'] == round(float(np.mean(pruned == full)), 5)
+
+
+def test_joint_mode_uses_classifier_probabilities():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+
+    joint = predictor.predict_batch(X, mode='joint')
+    full = predictor.predict_batch(X)
+    class_scores = np.array([QualityPredictor.CLASS_SCORES[c] for c in joint['classes']])
+    np.testing.assert_allclose(joint['quality_score'], full['confidence'] @ class_scores)
+    np.testing.assert_array_equal(joint['quality_status'], full['quality_status'])
+    assert (joint['served_by'] == 'joint').all()
+    assert predictor.predict(5.5, 60.0, 7.0, 5.0, 30, 0.5, 95.0, mode='joint')['served_by'] == 'joint'
+
+
+def test_compact_models_match_compiled():
+    X, y_score, y_class = _make_quality_data(n=1000)
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    predictor.train_model(X, y_score, y_class)
+    sensor_df = _make_sensor_data()
+    detector = AnomalyDetector(model_path=tempfile.mkdtemp() + "/")
+    detector.train_model(sensor_df)
+
+    for compiled, rows in (
+        (predictor.compiled_regression, X.to_numpy()),
+        (predictor.compiled_classification, X.to_numpy()),
+        (detector.compiled_model, sensor_df.to_numpy())
+    ):
+        result = compact_models.compare(compiled, compact_models.compact(compiled), rows)
+        assert result['max_abs_diff'] < 1e-3
+        assert result['label_agreement'] is None or result['label_agreement'] >= 0.99
+        # float32 thresholds/values and int32 features: 28 of 40 bytes per node
+        assert result['compact_bytes'] <= 0.72 * result['bytes']
+
+    predictor.save_model()
+    detector.save_model()
+    compact_models.SERVE_COMPACT_MODELS = True
+    try:
+        reloaded = QualityPredictor(model_path=predictor.model_path)
+        assert reloaded.load_model()
+        detector_reloaded = AnomalyDetector(model_path=detector.model_path)
+        assert detector_reloaded.load_model()
+    finally:
+        compact_models.SERVE_COMPACT_MODELS = False
+    assert reloaded.serving_compact and detector_reloaded.serving_compact
+    np.testing.assert_allclose(
+        reloaded.predict_batch(X)['confidence'], predictor.predict_batch(X)['confidence'], atol=1e-4
+    )
+    agreement = np.mean(
+        detector_reloaded.predict_labels(sensor_df.to_numpy()) == detector.predict_labels(sensor_df.to_numpy())
+    )
+    assert agreement >= 0.99
+
+
+def test_segment_models_load_lazily():
+    # Aspirin degrades with heat, Metformin with age: one model per ingredient fits better
+    X, _, _ = _make_quality_data(n=1600)
+    names = np.where(np.arange(len(X)) % 2 == 0, 'Aspirin 500mg', 'Metformin 850 mg')
+    segments = segment_keys(names)
+    score = np.where(
+        segments == 'aspirin',
+        100 - 6 * np.abs(X['storage_temperature'] - 5),
+        100 - 0.2 * X['days_elapsed']
+    )
+    y_class = pd.Series(np.where(score > 70, 'Good', np.where(score > 40, 'Degraded', 'Counterfeit')))
+    y_score = y_class.map(QualityPredictor.CLASS_SCORES)
+
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    predictor.train_model(X, y_score, y_class)
+    test_rows = QualityPredictor.test_rows(len(X))
+    plan = plan_segments(segments, y_class, test_rows, min_rows=100)
+    assert sorted(plan) == ['aspirin', 'metformin']
+    trained = {
+        segment: train_segment(X[rows], y_score[rows], y_class[rows], test_rows[rows])
+        for segment, rows in plan.items()
+    }
+    predictor.segments, report = select_segments(
+        predictor, trained, X, y_score, y_class, plan, test_rows
+    )
+    assert predictor.segments is not None and 'aspirin' in predictor.segments
+    predictor.save_model()
+
+    reloaded = QualityPredictor(model_path=predictor.model_path)
+    assert reloaded.load_model()
+    reloaded.segments.max_loaded = 1
+    assert reloaded.segments.stats()['loaded'] == []
+    assert reloaded.for_segment('unknown') is reloaded
+    assert reloaded.model_segment('unknown') is None
+
+    rows = X[segments == 'aspirin'].head(50)
+    np.testing.assert_allclose(
+        reloaded.for_segment('aspirin').predict_batch(rows)['quality_score'],
+        trained['aspirin'].predict_batch(rows)['quality_score']
+    )
+    assert reloaded.for_segment('aspirin') is reloaded.for_segment('aspirin')
+    for segment in predictor.segments.segments:
+        reloaded.for_segment(segment)
+    stats = reloaded.segments.stats()
+    assert len(stats['loaded']) == 1
+    assert stats['evictions'] == len(predictor.segments) - 1
+
+
+def test_segment_pruning_skips_comparison_rows():
+    from app.ai_models import quality_predictor
+
+    X, y_score, y_class = _make_quality_data(n=600)
+    test_rows = QualityPredictor.test_rows(len(X))
+    seen = []
+    prune_random_forest = quality_predictor.prune_random_forest
+    def recording(model, X_val, y_val, tolerance, **kwargs):
+        seen.append((X_val, kwargs['X_test']))
+        return prune_random_forest(model, X_val, y_val, tolerance, **kwargs)
+    quality_predictor.prune_random_forest = recording
+    try:
+        predictor = train_segment(X, y_score, y_class, test_rows)
+    finally:
+        quality_predictor.prune_random_forest = prune_random_forest
+
+    # Trees are picked on training rows, not on the rows select_segments compares on
+    [(X_val, X_test)] = seen
+    assert len(X_test) == test_rows.sum()
+    compared = {tuple(row) for row in X_test}
+    assert not any(tuple(row) in compared for row in X_val)
+    assert predictor.pruning_report['regression']['validation_full_score'] is not None
+
+    try:
+        predictor.prune(predictor.split_training_data(X, y_score, y_class, test_rows=test_rows))
+        assert False, "pruned without validation rows"
+    except ValueError as e:
+        assert 'validation' in str(e)
+
+
+def test_condition_grid_matches_row_by_row():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+    predictor.distill(X)
+
+    temperatures, humidities, days = np.linspace(-5, 20, 26), np.linspace(30, 90, 13), np.arange(0, 400, 40)
+    t, h, d = np.meshgrid(temperatures, humidities, days, indexing='ij')
+    features = np.column_stack([
+        t.ravel(), h.ravel(), np.full(t.size, 7.0), np.full(t.size, 5.0),
+        d.ravel(), np.full(t.size, 0.5), np.full(t.size, 95.0)
+    ])
+    for mode in QualityPredictor.PREDICTION_MODES:
+        expected = predictor.predict_batch(features, mode=mode)
+        scores, statuses = predictor.predict_condition_grid(
+            temperatures, humidities, days, (7.0, 5.0, 0.5, 95.0), mode=mode
+        )
+        assert scores.shape == statuses.shape == t.shape
+        np.testing.assert_array_equal(scores.ravel(), expected['quality_score'])
+        np.testing.assert_array_equal(predictor.classes_[statuses.ravel()], expected['quality_status'])
+
+    # Streamed in blocks of temperatures, same result
+    blocks = list(predictor.iter_condition_grid(
+        temperatures, humidities, days, (7.0, 5.0, 0.5, 95.0), chunk_rows=100
+    ))
+    assert len(blocks) > 1
+    np.testing.assert_array_equal(
+        np.concatenate([block_scores for _, block_scores, _ in blocks]),
+        predictor.predict_condition_grid(temperatures, humidities, days, (7.0, 5.0, 0.5, 95.0))[0]
+    )
+
+
+def test_fleet_timelines_match_single_product():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+
+    rng = np.random.default_rng(3)
+    conditions = np.column_stack([
+        rng.uniform(-5, 35, 20), rng.uniform(20, 95, 20),
+        np.full(20, 7.0), np.full(20, 5.0), np.full(20, 0.5), np.full(20, 95.0)
+    ])
+    days_elapsed = rng.integers(0, 600, 20)
+    batch = predictor.predict_degradation_matrices(conditions, days_elapsed)
+    shelf_lives = predictor.estimate_shelf_life_batch(conditions, days_elapsed, 365)
+
+    # One pass over every product gives each product's single-product result
+    for i in range(len(conditions)):
+        single = predictor.predict_degradation_matrix(conditions[i], days_elapsed=days_elapsed[i])
+        assert predictor.timeline_from_batch(batch, i) == predictor.timeline_from_batch(single)
+        assert predictor.prediction_from_batch(batch, i * len(batch['days_from_now'])) == \
+            predictor.prediction_from_batch(single, 0)
+        assert predictor.shelf_life_result(shelf_lives[i], 365) == predictor.estimate_shelf_life(
+            conditions[i], days_elapsed=days_elapsed[i], max_days=365
+        )
+
+
+def test_shelf_life_search_matches_day_by_day_scan():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+
+    lab = [7.0, 5.0, 0.5, 95.0]
+    conditions = np.array([
+        [30.0, 60.0] + lab,   # below threshold already on day 0
+        [5.0, 60.0] + lab,    # stays above for the whole horizon
+        [5.0, 60.0] + lab,    # crosses part way
+        [8.0, 55.0] + lab,
+        [2.0, 70.0] + lab
+    ])
+    days_elapsed = np.array([0, 0, 200, 120, 60])
+    max_days = np.array([400, 60, 400, 365, 730])
+
+    result = predictor.estimate_shelf_life_batch(conditions, days_elapsed, max_days, threshold=70)
+
+    # Brute force: score every day of each horizon on the mean, p10 and p90 curves
+    expected = np.full((len(conditions), 3), -1)
+    for i in range(len(conditions)):
+        days = np.arange(max_days[i] + 1)
+        features = np.column_stack([
+            np.tile(conditions[i, :4], (len(days), 1)),
+            days_elapsed[i] + days,
+            np.tile(conditions[i, 4:], (len(days), 1))
+        ])
+        below = predictor._score_curves(features) < 70
+        for curve in range(3):
+            if below[:, curve].any():
+                expected[i, curve] = np.argmax(below[:, curve])
+
+    np.testing.assert_array_equal(result, expected)
+    assert result[0, 0] == 0
+    assert (result[1] == -1).all()
+    assert 0 < result[2, 0] <= max_days[2]
+
+
+def test_prediction_cache_ttl_and_lru():
+    cache = PredictionCache(max_entries=2, ttl_seconds=0.05)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1          # 'a' is now the most recently used
+    cache.put('c', 3)                   # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['expirations'] == 1 and stats['entries'] == 1
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_prediction_cache_quantization():
+    precision = AnomalyDetector.INPUT_PRECISION
+    # Readings within half a sensor step share a key, a full step apart don't
+    assert quantize((5.01, 60.1, 50.2, 0.501), precision) == quantize((4.99, 59.9, 49.8, 0.499), precision)
+    assert quantize((5.0, 60.0, 50.0, 0.5), precision) != quantize((5.1, 60.0, 50.0, 0.5), precision)
+    assert quantize((5.0, 60.0, None, None), precision)[2:] == (None, None)
+
+    detector = AnomalyDetector()
+    detector.train_model(_make_sensor_data())
+    first = detector.detect(5.01, 60.1, 50.2, 0.501)
+    assert detector.detect(4.99, 59.9, 49.8, 0.499) == first
+    assert detector.cache.stats()['hits'] == 1
+
+
+def test_prediction_cache_cleared_on_reload():
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    predictor.train_model(X, y_score, y_class)
+    sample = (12.0, 60.0, 7.0, 5.0, 300, 0.5, 95.0)
+    predictor.predict(*sample)
+    assert predictor.cache.stats()['entries'] == 1
+
+    # Another model stored elsewhere, loaded into the same instance
+    other = QualityPredictor(model_path=tempfile.mkdtemp() + "/")
+    X_other, _, _ = _make_quality_data(seed=5)
+    y_other = pd.Series(np.where(X_other['days_elapsed'] > 100, 'Counterfeit', 'Good'))
+    other.train_model(X_other, y_other.map({'Good': 100, 'Counterfeit': 0}), y_other)
+    other.save_model()
+
+    predictor.model_path = other.model_path
+    assert predictor.load_model()
+    assert predictor.cache.stats()['entries'] == 0
+    assert predictor.predict(*sample) == other.predict(*sample)
+
+
+def benchmark_single_prediction(n_calls=2000):
+    """Report p50/p99 latency of QualityPredictor.predict with the compiled backend"""
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+
+    timings = []
+    for _ in range(n_calls):
+        start = time.perf_counter()
+        predictor.predict(5.5, 60.0, 7.0, 5.0, 30, 0.5, 95.0)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"\n   p50: {np.percentile(timings, 50):.3f} ms")
+    print(f"   p99: {np.percentile(timings, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    test_quality_predictor_matches_sklearn()
+    test_anomaly_detector_matches_sklearn()
+    test_memory_mapped_reload_matches()
+    test_micro_batched_predictions_match()
+    test_fast_mode_surrogate()
+    test_pruned_ensembles_served_after_reload()
+    test_pruning_picks_trees_on_validation_rows()
+    test_anomaly_pruning_picks_trees_on_held_out_readings()
+    test_joint_mode_uses_classifier_probabilities()
+    test_compact_models_match_compiled()
+    test_segment_models_load_lazily()
+    test_segment_pruning_skips_comparison_rows()
+    test_condition_grid_matches_row_by_row()
+    test_fleet_timelines_match_single_product()
+    test_shelf_life_search_matches_day_by_day_scan()
+    test_prediction_cache_ttl_and_lru()
+    test_prediction_cache_quantization()
+    test_prediction_cache_cleared_on_reload()
+    print("\n✅ Compiled inference matches sklearn")
+    benchmark_single_prediction()
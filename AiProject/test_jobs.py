@@ -0,0 +1,403 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Background jobs run against an in-memory SQLite database
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import crud, models, model_registry
+from app.database import Base
+from app.ai_models.anomaly_detector import AnomalyDetector
+from app.ai_models.quality_predictor import QualityPredictor
+from test_fast_inference import _make_quality_data
+from app.jobs import anomaly_retraining, fleet_scoring
+from app.jobs.streaming_training import StratifiedReservoir
+from app.jobs.training_orchestrator import TrainingJob, allocate_cpus
+from app.jobs.kaggle_training_data import load_quality_training_data
+from app.jobs import training_snapshots
+
+
+def _sqlite_sessions():
+    """sessionmaker for a fresh in-memory database with every table"""
+    engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _sensor_rows(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'temperature': rng.normal(5, 1.5, n),
+        'humidity': rng.normal(60, 8, n),
+        'light_exposure': rng.normal(50, 10, n),
+        'vibration': rng.normal(0.5, 0.2, n)
+    })
+
+
+def _seed_products(db, n_products, owner_id=1, now=None):
+    now = now or datetime.utcnow()
+    db.execute(insert(models.User), [{
+        'id': owner_id, 'email': f'{owner_id}@example.com',
+        'username': f'user{owner_id}', 'hashed_password': 'x'
+    }])
+    db.execute(insert(models.Product), [
+        {
+            'id': i,
+            'name': f'Product {i}',
+            'batch_number': f'B{i}',
+            'manufacturing_date': now - timedelta(days=30 + i),
+            'expiry_date': now + timedelta(days=365),
+            'location': f'Warehouse {i % 2}',
+            'owner_id': owner_id
+        }
+        for i in range(1, n_products + 1)
+    ])
+    db.commit()
+
+
+def test_anomaly_retrain_on_same_distribution_is_swapped_in():
+    Session = _sqlite_sessions()
+    db = Session()
+    now = datetime.utcnow()
+    _seed_products(db, 2, now=now)
+    readings = _sensor_rows(800)
+    db.execute(insert(models.SensorData), [
+        {'product_id': 1 + i % 2, 'timestamp': now - timedelta(minutes=i), **row}
+        for i, row in enumerate(readings.to_dict('records'))
+    ])
+    db.commit()
+    db.close()
+
+    # Serving model trained on the same distribution
+    current = AnomalyDetector()
+    current.train_model(_sensor_rows(800, seed=2))
+
+    saved = (anomaly_retraining.SessionLocal, model_registry.REGISTRY_PATH)
+    anomaly_retraining.SessionLocal = Session
+    model_registry.REGISTRY_PATH = tempfile.mkdtemp() + os.sep
+    model_registry.swap_predictor('anomaly', current)
+    try:
+        result = anomaly_retraining.retrain_anomaly_detector(window_days=1)
+
+        assert result['status'] == 'swapped', result
+        # Both models flag about the contamination share of the raw holdout
+        assert result['previous_holdout_anomaly_rate'] > 0
+        assert result['holdout_anomaly_rate'] <= \
+            result['previous_holdout_anomaly_rate'] + anomaly_retraining.RETRAIN_TOLERANCE
+        assert model_registry.get_predictor('anomaly') is not current
+        assert model_registry.active_version('anomaly') == result['version']
+    finally:
+        anomaly_retraining.SessionLocal, model_registry.REGISTRY_PATH = saved
+        model_registry._predictors.pop('anomaly', None)
+
+
+def test_reservoir_strata_stay_bounded():
+    reservoir = StratifiedReservoir(size_per_stratum=50, n_features=1, seed=0)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        keys = list(rng.choice(['a', 'b', 'c'], size=40, p=[0.7, 0.25, 0.05]))
+        reservoir.add_batch(keys, rng.normal(size=(40, 1)))
+
+    assert reservoir.total_seen == 800
+    for key, sample in reservoir.samples.items():
+        assert len(sample) == min(50, reservoir.seen[key])
+    # The rare stratum keeps every row it has seen
+    assert len(reservoir.samples['c']) == reservoir.seen['c'] < 50
+
+
+def test_reservoir_sample_is_uniform():
+    # Rows 0..999 of one stratum, offered in batches; each should be kept
+    # with probability 100 / 1000 whatever its position in the stream
+    kept = np.zeros(1000)
+    trials = 300
+    for seed in range(trials):
+        reservoir = StratifiedReservoir(size_per_stratum=100, n_features=1, seed=seed)
+        for start in range(0, 1000, 64):
+            rows = np.arange(start, min(start + 64, 1000), dtype=np.float64)[:, None]
+            reservoir.add_batch(['s'] * len(rows), rows)
+        sample = reservoir.samples['s'][:, 0].astype(np.int64)
+        assert len(sample) == 100 and len(np.unique(sample)) == 100
+        kept[sample] += 1
+
+    inclusion = kept.reshape(10, 100).mean(axis=1) / trials
+    np.testing.assert_allclose(inclusion, 0.1, rtol=0.1)
+
+
+def test_latest_sensor_readings_window_query():
+    Session = _sqlite_sessions()
+    db = Session()
+    now = datetime.utcnow()
+    _seed_products(db, 3, now=now)
+    db.execute(insert(models.User), [{'id': 2, 'email': 'b@example.com', 'username': 'b', 'hashed_password': 'x'}])
+    db.execute(insert(models.Product), [{
+        'id': 4, 'name': 'Other', 'batch_number': 'B4', 'manufacturing_date': now,
+        'expiry_date': now + timedelta(days=30), 'owner_id': 2
+    }])
+    db.execute(insert(models.SensorData), [
+        {'id': 1, 'product_id': 1, 'temperature': 1.0, 'humidity': 50.0, 'timestamp': now - timedelta(hours=2)},
+        {'id': 2, 'product_id': 1, 'temperature': 2.0, 'humidity': 50.0, 'timestamp': now},
+        {'id': 3, 'product_id': 1, 'temperature': 3.0, 'humidity': 50.0, 'timestamp': now - timedelta(hours=1)},
+        # Same timestamp: the later row wins
+        {'id': 4, 'product_id': 2, 'temperature': 4.0, 'humidity': 50.0, 'timestamp': now},
+        {'id': 5, 'product_id': 2, 'temperature': 5.0, 'humidity': 50.0, 'timestamp': now},
+        {'id': 6, 'product_id': 4, 'temperature': 6.0, 'humidity': 50.0, 'timestamp': now}
+    ])
+    db.commit()
+
+    latest = {row.product_id: row.temperature for row in crud.get_latest_sensor_readings(db)}
+    assert latest == {1: 2.0, 2: 5.0, 4: 6.0}
+    assert {row.product_id for row in crud.get_latest_sensor_readings(db, owner_id=1)} == {1, 2}
+    assert [row.temperature for row in crud.get_latest_sensor_readings(db, product_ids=[2, 3])] == [5.0]
+    db.close()
+
+
+def test_fleet_scoring_in_chunks_without_repeat_alerts():
+    Session = _sqlite_sessions()
+    db = Session()
+    now = datetime.utcnow()
+    _seed_products(db, 8, now=now)
+    # Product 8 has expired, product 7 has no readings or current conditions
+    db.query(models.Product).filter(models.Product.id == 8).update(
+        {models.Product.expiry_date: now - timedelta(days=1)}
+    )
+    db.execute(insert(models.SensorData), [
+        {
+            'product_id': product_id,
+            'temperature': 30.0 if product_id % 2 == 0 else 5.0,
+            'humidity': 60.0,
+            'timestamp': now - timedelta(minutes=k)
+        }
+        for product_id in (1, 2, 3, 4, 5, 6, 8) for k in range(3)
+    ])
+    db.commit()
+    db.close()
+
+    X, y_score, y_class = _make_quality_data()
+    predictor = QualityPredictor()
+    predictor.train_model(X, y_score, y_class)
+
+    saved = fleet_scoring.SessionLocal
+    fleet_scoring.SessionLocal = Session
+    model_registry.swap_predictor('quality', predictor)
+    try:
+        result = fleet_scoring.score_fleet(chunk_size=3)
+        assert result['status'] == 'completed'
+        assert result['products_total'] == 7 and result['chunks_done'] == 3
+        assert result['products_scored'] == 6
+
+        db = Session()
+        scores = dict(db.query(
+            models.QualityPrediction.product_id, models.QualityPrediction.predicted_quality_score
+        ).all())
+        assert set(scores) == {1, 2, 3, 4, 5, 6}
+        poor = {product_id for product_id, score in scores.items() if score < fleet_scoring.ALERT_THRESHOLD}
+        assert poor and result['alerts_created'] == len(poor)
+
+        # Unread alerts aren't repeated; a read one is
+        assert fleet_scoring.score_fleet(chunk_size=3)['alerts_created'] == 0
+        read = min(poor)
+        db.query(models.Alert).filter(models.Alert.product_id == read).update({models.Alert.is_read: True})
+        db.commit()
+        assert fleet_scoring.score_fleet(chunk_size=3)['alerts_created'] == 1
+
+        alerts = db.query(models.Alert.product_id).all()
+        assert sorted(product_id for (product_id,) in alerts) == sorted(list(poor) + [read])
+        assert db.query(models.QualityPrediction).count() == 18
+        db.close()
+    finally:
+        fleet_scoring.SessionLocal = saved
+        model_registry._predictors.pop('quality', None)
+
+
+def test_allocate_cpus_splits_cores_between_jobs():
+    jobs = [
+        TrainingJob('regression', print),
+        TrainingJob('classification', print, parallel=False),
+        TrainingJob('anomaly', print)
+    ]
+    allocation = allocate_cpus(jobs, list(range(8)))
+    # The single-threaded fit gets one core, the other 7 are shared out
+    assert {name: len(cores) for name, cores in allocation.items()} == \
+        {'regression': 4, 'classification': 1, 'anomaly': 3}
+    assert sorted(sum(allocation.values(), [])) == list(range(8))
+
+    # A fixed budget larger than the machine is capped; the rest still gets a core
+    allocation = allocate_cpus([TrainingJob('big', print, cpus=16), TrainingJob('rest', print)], [0, 1, 2, 3])
+    assert allocation == {'big': [0, 1, 2, 3], 'rest': [0]}
+
+
+def test_allocate_cpus_with_more_jobs_than_cores():
+    jobs = [TrainingJob(f'job{i}', print) for i in range(5)]
+    allocation = allocate_cpus(jobs, [2, 5])
+    # Every job gets one core; the budgets wrap around the available ones
+    assert allocation == {'job0': [2], 'job1': [5], 'job2': [2], 'job3': [5], 'job4': [2]}
+
+    jobs = [TrainingJob(f'single{i}', print, parallel=False) for i in range(3)]
+    assert allocate_cpus(jobs, [7]) == {'single0': [7], 'single1': [7], 'single2': [7]}
+
+
+def _seed_kaggle_records(db):
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(1, 13):
+        rows.append({
+            'id': i,
+            'medicine_name': ['Aspirin 500mg', 'Metformin 850 mg', 'Ibuprofen'][i % 3],
+            'batch_id': f'K{i}',
+            'manufacturing_date': base + timedelta(days=i),
+            'storage_temperature': 2.0 + i,
+            'storage_humidity': 40.0 + 2 * i,
+            'ph_level': 6.5 + i / 10,
+            'moisture_content': 4.0 + i / 10,
+            'impurity_percentage': 0.2 + i / 100,
+            'active_ingredient_concentration': 90.0 + i / 2,
+            'quality_status': ['Good', 'Degraded', 'Counterfeit'][i % 3],
+            'inspection_date': base + timedelta(days=60 + 7 * i, hours=i),
+            'imported_at': base + timedelta(days=300)
+        })
+    rows[1].update(ph_level=None, moisture_content=0.0)                 # lab defaults
+    rows[2].update(impurity_percentage=None, active_ingredient_concentration=None)
+    rows[3].update(inspection_date=None)                                # falls back to import date
+    rows[4].update(inspection_date=None, imported_at=None)              # manufacture + 30 days
+    rows[5].update(inspection_date=None, imported_at=None, manufacturing_date=None)  # dropped
+    rows[6].update(storage_temperature=None)                            # filtered out
+    rows[7].update(quality_status=None)                                 # filtered out
+    db.execute(insert(models.KaggleMedicineData), rows)
+    db.commit()
+
+
+def _orm_training_data(db):
+    """The ORM path the columnar extraction replaced"""
+    kaggle_dict = []
+    for record in db.query(models.KaggleMedicineData).order_by(models.KaggleMedicineData.id):
+        if (record.storage_temperature is None or record.storage_humidity is None or
+                record.quality_status is None):
+            continue
+        inspection_date = record.inspection_date or record.imported_at
+        if inspection_date is None:
+            if not record.manufacturing_date:
+                continue
+            inspection_date = record.manufacturing_date + pd.Timedelta(days=30)
+        kaggle_dict.append({
+            'storage_temperature': float(record.storage_temperature),
+            'storage_humidity': float(record.storage_humidity),
+            'ph_level': float(record.ph_level) if record.ph_level else 7.0,
+            'moisture_content': float(record.moisture_content) if record.moisture_content else 5.0,
+            'manufacturing_date': record.manufacturing_date,
+            'inspection_date': inspection_date,
+            'impurity_percentage': float(record.impurity_percentage) if record.impurity_percentage else 0.5,
+            'active_ingredient_concentration': (
+                float(record.active_ingredient_concentration)
+                if record.active_ingredient_concentration else 95.0
+            ),
+            'quality_status': str(record.quality_status)
+        })
+    X, y_score, y_class, _ = QualityPredictor().prepare_training_data(kaggle_dict)
+    return X, y_score, y_class
+
+
+def test_columnar_training_data_matches_orm_path():
+    db = _sqlite_sessions()()
+    _seed_kaggle_records(db)
+
+    X, y_score, y_class, segments, counts = load_quality_training_data(db, chunk_size=4)
+    X_orm, y_score_orm, y_class_orm = _orm_training_data(db)
+
+    assert counts == {'total': 12, 'valid': 9, 'skipped': 3}
+    pd.testing.assert_frame_equal(
+        X.reset_index(drop=True), X_orm.reset_index(drop=True).astype(np.float64)
+    )
+    np.testing.assert_array_equal(y_score.to_numpy(), y_score_orm.to_numpy())
+    np.testing.assert_array_equal(y_class.to_numpy(), y_class_orm.to_numpy())
+    assert set(segments) == {'aspirin', 'metformin', 'ibuprofen'}
+    db.close()
+
+
+def _add_readings(db, first_id, count, now):
+    readings = _sensor_rows(count, seed=first_id)
+    db.execute(insert(models.SensorData), [
+        {'id': first_id + i, 'product_id': 1 + i % 2, 'timestamp': now, **row}
+        for i, row in enumerate(readings.to_dict('records'))
+    ])
+    db.commit()
+
+
+def _snapshot_history(snapshot_path):
+    """Snapshot ids of a build, an append and an up-to-date check on a fresh database"""
+    saved = training_snapshots.SNAPSHOT_PATH
+    training_snapshots.SNAPSHOT_PATH = snapshot_path
+    try:
+        db = _sqlite_sessions()()
+        now = datetime(2026, 1, 1)
+        _seed_products(db, 2, now=now)
+        _add_readings(db, 1, 100, now)
+        first = training_snapshots.update_snapshot(db, 'sensor_readings')
+        _add_readings(db, 101, 30, now)
+        second = training_snapshots.update_snapshot(db, 'sensor_readings')
+        unchanged = training_snapshots.update_snapshot(db, 'sensor_readings')
+        return db, first, second, unchanged
+    finally:
+        training_snapshots.SNAPSHOT_PATH = saved
+
+
+def test_snapshot_appends_above_the_high_water_mark():
+    snapshot_path = tempfile.mkdtemp() + os.sep
+    db, first, second, unchanged = _snapshot_history(snapshot_path)
+
+    assert first['rows'] == first['appended_rows'] == 100 and first['parent'] is None
+    assert first['high_water_mark']['id'] == 100
+
+    # Only the 30 new readings were extracted, into a second segment
+    assert second['appended_rows'] == 30 and second['rows'] == 130
+    assert second['parent'] == first['snapshot_id']
+    assert second['segments'][0] == first['segments'][0]
+    assert [s['rows'] for s in second['segments']] == [100, 30]
+    assert second['high_water_mark']['id'] == 130
+
+    # Nothing above the mark: same snapshot, nothing extracted
+    assert unchanged['appended_rows'] == 0
+    assert unchanged['snapshot_id'] == second['snapshot_id']
+
+    saved = training_snapshots.SNAPSHOT_PATH
+    training_snapshots.SNAPSHOT_PATH = snapshot_path
+    try:
+        frame, _ = training_snapshots.load_snapshot('sensor_readings')
+        assert frame['id'].tolist() == list(range(1, 131))
+        # A pinned snapshot still reads exactly its own rows
+        pinned, _ = training_snapshots.load_snapshot('sensor_readings', first['snapshot_id'])
+        assert pinned['id'].tolist() == list(range(1, 101))
+        assert sum(len(b) for b in training_snapshots.iter_snapshot('sensor_readings', batch_size=16)) == 130
+    finally:
+        training_snapshots.SNAPSHOT_PATH = saved
+    db.close()
+
+
+def test_snapshot_ids_are_reproducible():
+    # The same data and updates give the same ids in another snapshot store
+    db_a, *ids_a = _snapshot_history(tempfile.mkdtemp() + os.sep)
+    db_b, *ids_b = _snapshot_history(tempfile.mkdtemp() + os.sep)
+    db_a.close()
+    db_b.close()
+    assert [m['snapshot_id'] for m in ids_a] == [m['snapshot_id'] for m in ids_b]
+    assert ids_a[0]['snapshot_id'] != ids_a[1]['snapshot_id']
+
+
+if __name__ == "__main__":
+    test_anomaly_retrain_on_same_distribution_is_swapped_in()
+    test_reservoir_strata_stay_bounded()
+    test_reservoir_sample_is_uniform()
+    test_latest_sensor_readings_window_query()
+    test_fleet_scoring_in_chunks_without_repeat_alerts()
+    test_allocate_cpus_splits_cores_between_jobs()
+    test_allocate_cpus_with_more_jobs_than_cores()
+    test_columnar_training_data_matches_orm_path()
+    test_snapshot_appends_above_the_high_water_mark()
+    test_snapshot_ids_are_reproducible()
+    print("\n✅ Background jobs work")
@@ -0,0 +1,112 @@
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import models, model_registry
+from app.ai_models.anomaly_detector import AnomalyDetector
+from test_fast_inference import _make_sensor_data
+from test_jobs import _sqlite_sessions
+
+# Model registry: versions, activation and rollback
+
+
+def _trained_detector(seed):
+    detector = AnomalyDetector()
+    detector.train_model(_make_sensor_data(seed=seed))
+    return detector
+
+
+def _with_registry(test):
+    """Run a test against an empty registry directory and no serving models"""
+    def run():
+        saved = model_registry.REGISTRY_PATH
+        model_registry.REGISTRY_PATH = tempfile.mkdtemp() + os.sep
+        try:
+            test()
+        finally:
+            model_registry.REGISTRY_PATH = saved
+            model_registry._predictors.pop('anomaly', None)
+            model_registry._previous.pop('anomaly', None)
+    run.__name__ = test.__name__
+    return run
+
+
+@_with_registry
+def test_register_is_content_addressed():
+    detector = _trained_detector(seed=1)
+    manifest = model_registry.register('anomaly', detector, metrics={'accuracy': 90.0})
+
+    assert manifest['version'] == manifest['content_hash'][:12]
+    assert 'anomaly_compiled.pkl' in manifest['files']
+    # The same artifacts map to the existing version
+    assert model_registry.register('anomaly', detector)['version'] == manifest['version']
+    assert [m['version'] for m in model_registry.list_versions('anomaly')] == [manifest['version']]
+
+    other = model_registry.register('anomaly', _trained_detector(seed=2))
+    assert other['version'] != manifest['version']
+    assert len(model_registry.list_versions('anomaly')) == 2
+
+
+@_with_registry
+def test_activate_and_instant_rollback():
+    db = _sqlite_sessions()()
+    first = model_registry.register('anomaly', _trained_detector(seed=1))['version']
+    second = model_registry.register('anomaly', _trained_detector(seed=2))['version']
+
+    model_registry.activate(db, 'anomaly', first)
+    serving_first = model_registry.get_predictor('anomaly')
+    assert model_registry.active_version('anomaly') == first
+
+    model_registry.activate(db, 'anomaly', second)
+    assert model_registry.active_version('anomaly') == second
+    assert model_registry.read_pointer('anomaly')['previous'] == first
+    active = db.query(models.AIModel).filter(models.AIModel.status == "active").all()
+    assert [row.version for row in active] == [second]
+
+    # Rollback swaps the still-loaded predictor back, without reloading
+    load_version = model_registry.load_version
+    def no_reload(family, version):
+        raise AssertionError("rollback reloaded a version it still had loaded")
+    model_registry.load_version = no_reload
+    try:
+        model_registry.rollback(db, 'anomaly')
+    finally:
+        model_registry.load_version = load_version
+
+    assert model_registry.get_predictor('anomaly') is serving_first
+    assert model_registry.active_version('anomaly') == first
+    assert model_registry.read_pointer('anomaly')['previous'] == second
+    db.close()
+
+
+@_with_registry
+def test_corrupted_artifact_is_rejected():
+    db = _sqlite_sessions()()
+    good = model_registry.register('anomaly', _trained_detector(seed=1))['version']
+    bad = model_registry.register('anomaly', _trained_detector(seed=2))['version']
+    model_registry.activate(db, 'anomaly', good)
+    serving = model_registry.get_predictor('anomaly')
+
+    path = os.path.join(model_registry.REGISTRY_PATH, 'anomaly', bad, 'anomaly_compiled.pkl')
+    with open(path, 'r+b') as f:
+        f.seek(100)
+        f.write(b'corrupted')
+
+    try:
+        model_registry.activate(db, 'anomaly', bad)
+        assert False, "corrupted version was activated"
+    except ValueError as e:
+        assert 'corrupted' in str(e)
+
+    # Still serving the good version
+    assert model_registry.get_predictor('anomaly') is serving
+    assert model_registry.active_version('anomaly') == good
+    db.close()
+
+
+if __name__ == "__main__":
+    test_register_is_content_addressed()
+    test_activate_and_instant_rollback()
+    test_corrupted_artifact_is_rejected()
+    print("\n✅ Model registry works")
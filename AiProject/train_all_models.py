@@ -1,18 +1,48 @@
+import argparse
 import sys
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app import models
+from app import models, model_registry
 from app.ai_models.quality_predictor import QualityPredictor
 from app.ai_models.anomaly_detector import AnomalyDetector
 from app.ai_models.label_validator import LabelValidator
 from app.ai_models.image_analyzer import ImageAnalyzer
+from app.ai_models.ensemble_pruning import ENSEMBLE_PRUNING
+from app.ai_models.segment_models import (
+    SEGMENT_MODELS,
+    plan_segments,
+    train_segment,
+    select_segments
+)
+from app.jobs.kaggle_training_data import load_quality_training_data, training_arrays
+from app.jobs.streaming_training import sample_sensor_readings, train_detector
+from app.jobs.training_snapshots import (
+    TRAINING_SNAPSHOTS,
+    training_snapshot,
+    load_snapshot,
+    iter_snapshot
+)
+from app.jobs.hyperparameter_search import tune_quality_models
+from app.jobs.training_orchestrator import (
+    TrainingJob,
+    run_training_jobs,
+    print_training_summary
+)
 import pandas as pd
 
-def train_all_models():
+def train_all_models(use_snapshots=TRAINING_SNAPSHOTS, snapshot_ids=None, refresh_snapshots=False,
+                     tune=False):
     """
     Train all AI models using data from database
+    use_snapshots: train from the local training-data snapshots, appending
+    only new records to them; snapshot_ids pins {dataset: snapshot id} to
+    reproduce an earlier run exactly
+    tune: pick the quality models' hyperparameters by cross-validated
+    successive halving before the final fit
     """
     
+    snapshot_ids = snapshot_ids or {}
+    
     print("=" * 70)
     print("AI MODEL TRAINING - MEDICINE MONITORING SYSTEM")
     print("=" * 70)
@@ -32,7 +62,7 @@ def train_all_models():
         print(f"   Kaggle dataset: {kaggle_count} records")
         print(f"   Sensor data: {sensor_count} records")
         
-        if kaggle_count == 0:
+        if kaggle_count == 0 and not snapshot_ids.get('kaggle_quality'):
             print("\n❌ No Kaggle data found!")
             print("\n📋 Please follow these steps:")
             print("   1. Run: python import_kaggle_data.py")
@@ -48,129 +78,210 @@ def train_all_models():
         print("1. QUALITY DEGRADATION PREDICTION MODEL")
         print("=" * 70)
         
-        # Get Kaggle data with validation
-        kaggle_data = db.query(models.KaggleMedicineData).all()
+        # Only the needed columns, cleaned and typed column by column
+        print(f"\n📊 Processing {kaggle_count} records...")
         
-        print(f"\n📊 Processing {len(kaggle_data)} records...")
+        quality_snapshot = None
+        if use_snapshots:
+            # Cleaned rows from the local snapshot; only new records are read
+            quality_snapshot = training_snapshot(
+                db, 'kaggle_quality', snapshot_ids.get('kaggle_quality'), refresh_snapshots
+            )
+            frame, _ = load_snapshot('kaggle_quality', quality_snapshot['snapshot_id'])
+            X, y_score, y_class = training_arrays(
+                frame[QualityPredictor.FEATURES], frame['quality_status']
+            )
+            segments = frame['segment'].to_numpy(dtype=object)
+            del frame
+            extract_counts = {
+                'total': quality_snapshot['records'],
+                'valid': len(X),
+                'skipped': quality_snapshot['records'] - len(X)
+            }
+        else:
+            X, y_score, y_class, segments, extract_counts = load_quality_training_data(db)
         
-        # Convert to dict with data cleaning
-        kaggle_dict = []
-        skipped = 0
+        print(f"   Valid records: {extract_counts['valid']}")
+        print(f"   Skipped (missing data): {extract_counts['skipped']}")
         
-        for record in kaggle_data:
-            # Check if essential fields exist
-            if (record.storage_temperature is None or 
-                record.storage_humidity is None or 
-                record.quality_status is None):
-                skipped += 1
-                continue
-            
-            # Use inspection_date, fallback to imported_at, or use a default
-            inspection_date = record.inspection_date
-            if inspection_date is None:
-                inspection_date = record.imported_at
-            if inspection_date is None:
-                # Use manufacturing date + 30 days as fallback
-                if record.manufacturing_date:
-                    inspection_date = record.manufacturing_date + pd.Timedelta(days=30)
-                else:
-                    skipped += 1
-                    continue
-            
-            kaggle_dict.append({
-                'storage_temperature': float(record.storage_temperature),
-                'storage_humidity': float(record.storage_humidity),
-                'ph_level': float(record.ph_level) if record.ph_level else 7.0,
-                'moisture_content': float(record.moisture_content) if record.moisture_content else 5.0,
-                'manufacturing_date': record.manufacturing_date,
-                'inspection_date': inspection_date,
-                'impurity_percentage': float(record.impurity_percentage) if record.impurity_percentage else 0.5,
-                'active_ingredient_concentration': float(record.active_ingredient_concentration) if record.active_ingredient_concentration else 95.0,
-                'quality_status': str(record.quality_status)
-            })
-        
-        print(f"   Valid records: {len(kaggle_dict)}")
-        print(f"   Skipped (missing data): {skipped}")
-        
-        if len(kaggle_dict) < 10:
+        if extract_counts['valid'] < 10:
             print("\n⚠️  Not enough valid data to train!")
             print("   Minimum required: 10 records")
             print("   Try reimporting the Kaggle dataset")
             return
         
         # ===================================================================
-        # 3. TRAIN QUALITY PREDICTION MODEL
+        # 3. PREPARE QUALITY PREDICTION TRAINING JOBS
         # ===================================================================
         
         predictor = QualityPredictor()
+        jobs = []
+        tuning = None
+        segment_plan = {}
         
         try:
-            X, y_score, y_class, features = predictor.prepare_training_data(kaggle_dict)
-            
             print(f"\n   Training with {len(X)} samples...")
             
-            reg_accuracy, class_accuracy = predictor.train_model(X, y_score, y_class)
-            predictor.save_model()
+            # Pruning picks its tree counts on a slice of the training rows
+            split = predictor.split_training_data(X, y_score, y_class, validation=ENSEMBLE_PRUNING)
+            
+            regression_params = classification_params = None
+            if tune:
+                # Held-out test split stays out of the search
+                tuning = tune_quality_models(
+                    split['X_train'], split['y_score_train'], split['y_class_train']
+                )
+                regression_params = tuning['regression']['best_params']
+                classification_params = tuning['classification']['best_params']
             
-            # Update AI model record in database
-            quality_model = db.query(models.AIModel).filter(
-                models.AIModel.model_type == "ml_prediction"
-            ).first()
+            jobs.append(TrainingJob(
+                'quality_regression',
+                QualityPredictor.fit_regression,
+                (split['X_train'], split['y_score_train'], regression_params)
+            ))
+            # Boosting is sequential: one core is all it can use
+            jobs.append(TrainingJob(
+                'quality_classification',
+                QualityPredictor.fit_classification,
+                (split['X_train'], split['y_class_train'], classification_params),
+                parallel=False
+            ))
             
-            if quality_model:
-                quality_model.accuracy = class_accuracy * 100
-                quality_model.status = "active"
-                quality_model.last_trained = pd.Timestamp.now()
-                quality_model.training_data_count = len(kaggle_dict)
-                db.commit()
+            # One model per active ingredient with enough data, fitted on
+            # its rows of the same train/test split
+            if SEGMENT_MODELS:
+                test_rows = QualityPredictor.test_rows(len(X))
+                segment_plan = plan_segments(segments, y_class, test_rows)
+                print(f"   Segment models: {', '.join(segment_plan) or 'none (not enough rows per ingredient)'}")
+                for segment, rows in segment_plan.items():
+                    jobs.append(TrainingJob(
+                        f'quality_segment:{segment}',
+                        train_segment,
+                        (X[rows], y_score[rows], y_class[rows], test_rows[rows])
+                    ))
                 
         except Exception as e:
-            print(f"\n❌ Error training quality model: {e}")
+            print(f"\n❌ Error preparing quality data: {e}")
             print("   Continuing with other models...")
         
         # ===================================================================
-        # 4. TRAIN ANOMALY DETECTION MODEL
+        # 4. PREPARE ANOMALY DETECTION TRAINING JOB
         # ===================================================================
         
         print("\n" + "=" * 70)
         print("2. ANOMALY DETECTION MODEL")
         print("=" * 70)
         
-        if sensor_count > 0:
-            sensor_data_list = db.query(models.SensorData).all()
-            
-            sensor_df = pd.DataFrame([{
-                'temperature': float(s.temperature),
-                'humidity': float(s.humidity),
-                'light_exposure': float(s.light_exposure) if s.light_exposure else 50.0,
-                'vibration': float(s.vibration) if s.vibration else 0.5
-            } for s in sensor_data_list])
-            
-            print(f"\n📊 Training with {len(sensor_df)} sensor readings")
-            
-            detector = AnomalyDetector()
-            anomaly_count, normal_count = detector.train_model(sensor_df)
-            detector.save_model()
-            
-            # Update model record
-            anomaly_model = db.query(models.AIModel).filter(
-                models.AIModel.model_name.like("%Anomaly%")
-            ).first()
-            
-            if anomaly_model:
-                accuracy = (normal_count / len(sensor_df)) * 100
-                anomaly_model.accuracy = accuracy
-                anomaly_model.status = "active"
-                anomaly_model.last_trained = pd.Timestamp.now()
-                anomaly_model.training_data_count = len(sensor_df)
-                db.commit()
+        sensor_df = None
+        sensor_snapshot = None
+        if sensor_count > 0 or snapshot_ids.get('sensor_readings'):
+            # Single streamed pass with a bounded per-product/location sample
+            if use_snapshots:
+                sensor_snapshot = training_snapshot(
+                    db, 'sensor_readings', snapshot_ids.get('sensor_readings'), refresh_snapshots
+                )
+                sensor_df = sample_sensor_readings(
+                    db, readings=iter_snapshot('sensor_readings', sensor_snapshot['snapshot_id'])
+                )
+            else:
+                sensor_df = sample_sensor_readings(db)
+            if len(sensor_df) > 0:
+                jobs.append(TrainingJob('anomaly_detector', train_detector, (sensor_df,)))
+            else:
+                print("\n⚠️  No usable sensor readings (temperature/humidity missing)")
         else:
             print("\n⚠️  No sensor data available")
             print("   Run: python seed_initial_data.py")
             print("   Then retrain the models")
         
         # ===================================================================
-        # 5. INITIALIZE OTHER MODELS
+        # 5. TRAIN ALL MODELS IN PARALLEL
+        # ===================================================================
+        
+        print("\n" + "=" * 70)
+        print("TRAINING")
+        print("=" * 70)
+        
+        results, summary = run_training_jobs(jobs) if jobs else ({}, [])
+        
+        if results.get('quality_regression') is not None and \
+                results.get('quality_classification') is not None:
+            try:
+                print("\n🤖 Quality Prediction Models:")
+                reg_accuracy, class_accuracy = predictor.finish_training(
+                    results['quality_regression'],
+                    results['quality_classification'],
+                    split
+                )
+                
+                # Smallest ensembles within tolerance, saved next to the full ones
+                if ENSEMBLE_PRUNING:
+                    predictor.prune(split)
+                
+                # mode=joint (classifier only) against the two-model setup
+                joint_mode = predictor.benchmark_joint_mode(split)
+                
+                # Compact surrogate for mode=fast requests
+                surrogate_fidelity = predictor.distill(X)
+                
+                # Segment models that beat the global one on their rows
+                segment_report = None
+                if segment_plan:
+                    predictor.segments, segment_report = select_segments(
+                        predictor,
+                        {segment: results.get(f'quality_segment:{segment}') for segment in segment_plan},
+                        X, y_score, y_class, segment_plan, test_rows
+                    )
+                predictor.save_model()
+                
+                # Store as a new registry version and make it the active one
+                manifest = model_registry.publish(
+                    db,
+                    'quality',
+                    predictor,
+                    metrics={
+                        'accuracy': class_accuracy * 100,
+                        'r2': reg_accuracy,
+                        'surrogate': surrogate_fidelity,
+                        'training_snapshot': quality_snapshot['snapshot_id'] if quality_snapshot else None,
+                        'tuning': tuning,
+                        'pruning': predictor.pruning_report,
+                        'joint_mode': joint_mode,
+                        'segments': segment_report
+                    },
+                    training_data_count=extract_counts['valid'],
+                    swap=False
+                )
+                print(f"  ✓ Registered quality model version {manifest['version']}")
+                
+            except Exception as e:
+                print(f"\n❌ Error training quality model: {e}")
+                print("   Continuing with other models...")
+        
+        if results.get('anomaly_detector') is not None:
+            detector, anomaly_count, normal_count = results['anomaly_detector']
+            detector.save_model()
+            
+            # Store as a new registry version and make it the active one
+            manifest = model_registry.publish(
+                db,
+                'anomaly',
+                detector,
+                metrics={
+                    'accuracy': (normal_count / len(sensor_df)) * 100,
+                    'training_snapshot': sensor_snapshot['snapshot_id'] if sensor_snapshot else None,
+                    'pruning': detector.pruning_report
+                },
+                training_data_count=len(sensor_df),
+                swap=False
+            )
+            print(f"  ✓ Registered anomaly model version {manifest['version']}")
+        
+        if summary:
+            print_training_summary(summary)
+        
+        # ===================================================================
+        # 6. INITIALIZE OTHER MODELS
         # ===================================================================
         
         print("\n" + "=" * 70)
@@ -226,4 +337,23 @@ def train_all_models():
         db.close()
 
 if __name__ == "__main__":
-    train_all_models()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train all AI models")
+    parser.add_argument('--no-snapshots', action='store_true',
+                        help="read the full tables instead of the training-data snapshots")
+    parser.add_argument('--refresh-snapshots', action='store_true',
+                        help="rebuild the snapshots from scratch (picks up updated/deleted rows)")
+    parser.add_argument('--quality-snapshot', help="train the quality model from this snapshot id")
+    parser.add_argument('--sensor-snapshot', help="train the anomaly model from this snapshot id")
+    parser.add_argument('--tune', action='store_true',
+                        help="search quality model hyperparameters (k-fold CV, successive halving)")
+    args = parser.parse_args()
+
+    train_all_models(
+        use_snapshots=TRAINING_SNAPSHOTS and not args.no_snapshots,
+        snapshot_ids={
+            'kaggle_quality': args.quality_snapshot,
+            'sensor_readings': args.sensor_snapshot
+        },
+        refresh_snapshots=args.refresh_snapshots,
+        tune=args.tune
+    )
\ No newline at end of file